@@ -1,27 +1,239 @@
-import SocketServer
+#!/usr/bin/env python3
+#
+# Peer for session traffic tests: serves many TCP connections at once
+# from a single selector loop.
+#
+#   echo     send back everything received
+#   discard  read and drop everything
+#   source   send an endless stream, drop everything received
+#
+# Every connection shares one receive and one source buffer, so memory
+# does not grow with the number of connections (echo only keeps what
+# the peer has not read back yet).
+
+import argparse
+import selectors
 import socket
+import time
 
-class MyTCPHandler(SocketServer.BaseRequestHandler):
-    """
-    The RequestHandler class for our server.
+BUFSIZE = 256 * 1024
 
-    It is instantiated once per connection to the server, and must
-    override the handle() method to implement communication to the
-    client.
-    """
 
-    def handle(self):
-        # self.request is the TCP socket connected to the client
-        self.data = self.request.recv(1024).strip()
-        # just send back the same data, but upper-cased
-        self.request.sendall(self.data.upper())
+class Connection(object):
 
-if __name__ == "__main__":
-    HOST, PORT = socket.gethostname(), 9999
+    __slots__ = ('sock', 'peer', 't_start', 'rx', 'tx', 'rx_last',
+                 'tx_last', 'pending', 'events')
+
+    def __init__(self, sock, peer):
+        self.sock = sock
+        self.peer = peer
+        self.t_start = time.monotonic()
+        self.rx = 0
+        self.tx = 0
+        self.rx_last = 0
+        self.tx_last = 0
+        # Echo data not sent yet
+        self.pending = None
+        self.events = 0
+
+    def name(self):
+        return "%s:%d" % self.peer[:2]
+
+
+class Server(object):
+
+    def __init__(self, address, port, mode, backlog=1024, verbose=False):
+        self.mode = mode
+        self.verbose = verbose
+        self.selector = selectors.DefaultSelector()
+        self.conns = {}
+
+        self.rbuf = bytearray(BUFSIZE)
+        self.rview = memoryview(self.rbuf)
+        self.sview = memoryview(bytes(bytearray(i & 0xff
+                                                for i in range(BUFSIZE))))
+
+        self.accepted = 0
+        self.closed_rx = 0
+        self.closed_tx = 0
+        self.rx_last = 0
+        self.tx_last = 0
+
+        # Numeric addresses only, nothing is looked up
+        family, type_, proto, _, sockaddr = socket.getaddrinfo(
+            address, port, 0, socket.SOCK_STREAM, 0,
+            socket.AI_PASSIVE | socket.AI_NUMERICHOST)[0]
+        self.listener = socket.socket(family, type_, proto)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(sockaddr)
+        self.listener.listen(backlog)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+
+    def accept(self):
+        while True:
+            try:
+                sock, peer = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # Out of file descriptors and friends, retry later
+                print("accept: %s" % e)
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = Connection(sock, peer)
+            self.accepted += 1
+            self.conns[sock.fileno()] = conn
+            self.watch(conn, selectors.EVENT_READ |
+                       (selectors.EVENT_WRITE if self.mode == 'source'
+                        else 0))
+            if self.verbose:
+                print("%s connected" % conn.name())
+
+    def watch(self, conn, events):
+        if events == conn.events:
+            return
+        if conn.events:
+            self.selector.modify(conn.sock, events, conn)
+        else:
+            self.selector.register(conn.sock, events, conn)
+        conn.events = events
+
+    def close(self, conn):
+        self.selector.unregister(conn.sock)
+        del self.conns[conn.sock.fileno()]
+        conn.sock.close()
+        self.closed_rx += conn.rx
+        self.closed_tx += conn.tx
+        if self.verbose:
+            elapsed = max(time.monotonic() - conn.t_start, 1e-9)
+            print("%s closed after %.1fs: rx %s, tx %s" %
+                  (conn.name(), elapsed, rate(conn.rx, elapsed),
+                   rate(conn.tx, elapsed)))
+
+    def readable(self, conn):
+        try:
+            n = conn.sock.recv_into(self.rbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.close(conn)
+            return
+        if n == 0:
+            self.close(conn)
+            return
+        conn.rx += n
 
-    # Create the server, binding to localhost on port 9999
-    server = SocketServer.TCPServer((HOST, PORT), MyTCPHandler)
+        if self.mode == 'echo':
+            self.send(conn, self.rview[:n])
 
-    # Activate the server; this will keep running until you
-    # interrupt the program with Ctrl-C
-    server.serve_forever()
+    def send(self, conn, data):
+        try:
+            sent = conn.sock.send(data)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self.close(conn)
+            return
+        conn.tx += sent
+        if sent < len(data):
+            # Stop reading until the peer caught up, the rest has to be
+            # copied since the receive buffer is reused
+            conn.pending = bytes(data[sent:])
+            self.watch(conn, selectors.EVENT_WRITE)
+
+    def writable(self, conn):
+        if self.mode == 'source':
+            self.send_source(conn)
+            return
+
+        data, conn.pending = conn.pending, None
+        self.send(conn, memoryview(data))
+        if conn.pending is None and conn.sock.fileno() in self.conns:
+            self.watch(conn, selectors.EVENT_READ)
+
+    def send_source(self, conn):
+        try:
+            conn.tx += conn.sock.send(self.sview)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self.close(conn)
+
+    def report(self, elapsed, per_connection):
+        rx = self.closed_rx + sum(c.rx for c in self.conns.values())
+        tx = self.closed_tx + sum(c.tx for c in self.conns.values())
+        print("%d connections (%d accepted): rx %s, tx %s" %
+              (len(self.conns), self.accepted,
+               rate(rx - self.rx_last, elapsed),
+               rate(tx - self.tx_last, elapsed)))
+        self.rx_last = rx
+        self.tx_last = tx
+
+        for conn in self.conns.values():
+            if per_connection:
+                print("  %-24s rx %s, tx %s" %
+                      (conn.name(), rate(conn.rx - conn.rx_last, elapsed),
+                       rate(conn.tx - conn.tx_last, elapsed)))
+            conn.rx_last = conn.rx
+            conn.tx_last = conn.tx
+
+    def run(self, interval, per_connection):
+        last_report = time.monotonic()
+        next_report = last_report + interval
+        while True:
+            timeout = None
+            if interval:
+                timeout = max(next_report - time.monotonic(), 0)
+            for key, mask in self.selector.select(timeout):
+                conn = key.data
+                if conn is None:
+                    self.accept()
+                    continue
+                if mask & selectors.EVENT_READ:
+                    self.readable(conn)
+                    if conn.sock.fileno() not in self.conns:
+                        continue
+                if mask & selectors.EVENT_WRITE:
+                    self.writable(conn)
+
+            now = time.monotonic()
+            if interval and now >= next_report:
+                self.report(now - last_report, per_connection)
+                last_report = now
+                next_report = now + interval
+
+
+def rate(nbytes, seconds):
+    return "%.2f MB/s" % (nbytes / seconds / 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="TCP echo/discard/source server for traffic tests")
+    parser.add_argument('-a', '--address', default='127.0.0.1',
+                        help="numeric address to bind, '::' or "
+                        "'0.0.0.0' for all")
+    parser.add_argument('-p', '--port', type=int, default=9999)
+    parser.add_argument('-m', '--mode', default='echo',
+                        choices=['echo', 'discard', 'source'])
+    parser.add_argument('-i', '--interval', type=float, default=1.0,
+                        metavar='SECONDS',
+                        help="report period, 0 disables the reports")
+    parser.add_argument('-C', '--per-connection', action='store_true',
+                        help="report every connection's bytes/s too")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="log connects and per-connection totals")
+    args = parser.parse_args()
+
+    server = Server(args.address, args.port, args.mode,
+                    verbose=args.verbose)
+    print("%s server on %s port %d" % (args.mode, args.address, args.port))
+    try:
+        server.run(args.interval, args.per_connection)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,184 @@
-import SocketServer
+#!/usr/bin/env python3
+#
+# UDP peer for session traffic tests. Counts packets per second and,
+# for packets carrying the probe header of src/udp_probe.py (sequence
+# number and sender timestamp), loss, reordering and jitter per sender.
+# With --reflect every packet is sent back unchanged so the sender can
+# measure the round trip as well.
+#
+# Datagrams are drained in batches into preallocated buffers whenever
+# the socket becomes readable; nothing is printed per packet.
+
+import argparse
+import selectors
 import socket
+import struct
+import time
+
+HEADER = struct.Struct("!IQ")
+
+BATCH = 256
+BUFSIZE = 65536
+
+
+class SequenceStats(object):
+    """Same accounting as udp_probe.SequenceStats."""
+
+    def __init__(self):
+        self.received = 0
+        self.first = None
+        self.highest = None
+        self.reordered = 0
+        self.jitter = 0.0
+        self.transit = None
+
+    def packet(self, seq, sent, arrival):
+        self.received += 1
+        if self.first is None:
+            self.first = self.highest = seq
+        elif seq > self.highest:
+            self.highest = seq
+        else:
+            self.reordered += 1
+            return
+
+        transit = arrival - sent
+        if self.transit is not None:
+            d = abs(transit - self.transit)
+            self.jitter += (d - self.jitter) / 16.0
+        self.transit = transit
+
+    def lost(self):
+        if self.first is None:
+            return 0
+        return max(self.highest - self.first + 1 - self.received, 0)
+
+
+class Reflector(object):
+
+    def __init__(self, address, port, reflect=False, rcvbuf=0):
+        self.reflect = reflect
+        self.buffers = [bytearray(BUFSIZE) for i in range(BATCH)]
+        self.views = [memoryview(buf) for buf in self.buffers]
+        self.peers = {}
+
+        self.packets = 0
+        self.bytes = 0
+        self.reflected = 0
+        self.send_errors = 0
+        self.packets_last = 0
+        self.bytes_last = 0
+
+        family, type_, proto, _, sockaddr = socket.getaddrinfo(
+            address, port, 0, socket.SOCK_DGRAM, 0,
+            socket.AI_PASSIVE | socket.AI_NUMERICHOST)[0]
+        self.sock = socket.socket(family, type_, proto)
+        if rcvbuf:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.bind(sockaddr)
+        self.sock.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+
+    def drain(self):
+        # Fill the whole batch first, then account and reflect it.
+        # Every datagram gets its own arrival time, one for the whole
+        # batch would flatten the transit time differences the jitter
+        # is computed from. It is still the time it was read, which
+        # lags the kernel's arrival time while the socket is backed up.
+        batch = []
+        for buf in self.buffers:
+            try:
+                n, peer = self.sock.recvfrom_into(buf)
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((n, peer, time.monotonic()))
+        if not batch:
+            return
+
+        self.packets += len(batch)
+        for i, (n, peer, arrival) in enumerate(batch):
+            self.bytes += n
+            if n >= HEADER.size:
+                seq, sent = HEADER.unpack_from(self.buffers[i])
+                stats = self.peers.get(peer)
+                if stats is None:
+                    stats = self.peers[peer] = SequenceStats()
+                stats.packet(seq, sent / 1e9, arrival)
+
+        if not self.reflect:
+            return
+        for i, (n, peer, arrival) in enumerate(batch):
+            try:
+                self.sock.sendto(self.views[i][:n], peer)
+                self.reflected += 1
+            except OSError:
+                # Full socket buffer, the sender sees it as loss
+                self.send_errors += 1
+
+    def report(self, elapsed, per_peer):
+        print("%.0f pps, %.2f MB/s, %d reflected, %d send errors" %
+              ((self.packets - self.packets_last) / elapsed,
+               (self.bytes - self.bytes_last) / elapsed / 1e6,
+               self.reflected, self.send_errors))
+        self.packets_last = self.packets
+        self.bytes_last = self.bytes
+
+        if not per_peer:
+            return
+        for peer, stats in sorted(self.peers.items()):
+            expected = stats.received + stats.lost()
+            print("  %-24s %d received, %d lost (%.2f%%), %d reordered, "
+                  "jitter %.3fms" %
+                  ("%s:%d" % peer[:2], stats.received, stats.lost(),
+                   100.0 * stats.lost() / expected if expected else 0.0,
+                   stats.reordered, stats.jitter * 1000.0))
+
+    def run(self, interval, per_peer):
+        last_report = time.monotonic()
+        next_report = last_report + interval
+        while True:
+            timeout = None
+            if interval:
+                timeout = max(next_report - time.monotonic(), 0)
+            if self.selector.select(timeout):
+                self.drain()
+
+            now = time.monotonic()
+            if interval and now >= next_report:
+                self.report(now - last_report, per_peer)
+                last_report = now
+                next_report = now + interval
+
 
-class MyUDPHandler(SocketServer.BaseRequestHandler):
-    """
-    This class works similar to the TCP handler class, except that
-    self.request consists of a pair of data and client socket, and since
-    there is no connection the client address must be given explicitly
-    when sending data back via sendto().
-    """
+def main():
+    parser = argparse.ArgumentParser(
+        description="UDP sink/reflector with loss and jitter statistics")
+    parser.add_argument('-a', '--address', default='127.0.0.1',
+                        help="numeric address to bind, '::' or "
+                        "'0.0.0.0' for all")
+    parser.add_argument('-p', '--port', type=int, default=9999)
+    parser.add_argument('-r', '--reflect', action='store_true',
+                        help="send every packet back to its sender")
+    parser.add_argument('--rcvbuf', type=int, default=4 * 1024 * 1024,
+                        metavar='BYTES', help="socket receive buffer")
+    parser.add_argument('-i', '--interval', type=float, default=1.0,
+                        metavar='SECONDS',
+                        help="report period, 0 disables the reports")
+    parser.add_argument('-P', '--per-peer', action='store_true',
+                        help="report loss, reordering and jitter of every "
+                        "sender")
+    args = parser.parse_args()
 
-    def handle(self):
-        data = self.request[0].strip()
-        socket = self.request[1]
-        print data
-        socket.sendto(data.upper(), self.client_address)
+    reflector = Reflector(args.address, args.port, reflect=args.reflect,
+                          rcvbuf=args.rcvbuf)
+    print("UDP %s on %s port %d" %
+          ("reflector" if args.reflect else "sink", args.address, args.port))
+    try:
+        reflector.run(args.interval, args.per_peer)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
-    HOST, PORT = socket.gethostbyname(socket.gethostname()), 9999
-    server = SocketServer.UDPServer((HOST, PORT), MyUDPHandler)
-    server.serve_forever()
+    main()
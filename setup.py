@@ -1,6 +1,34 @@
 #!/usr/bin/env python
 
+import os
+
 from distutils.core import setup
+from distutils.command.build_py import build_py
+
+
+class build_py_ui(build_py):
+    """Compile the Qt Designer forms so they are not parsed at startup."""
+
+    def run(self):
+        build_py.run(self)
+
+        try:
+            from PyQt5 import uic
+        except ImportError:
+            self.warn("PyQt5 not found, forms are compiled at runtime")
+            return
+
+        target = os.path.join(self.build_lib, 'session_ui')
+        for name in os.listdir(os.path.join('src', 'ui')):
+            if not name.endswith('.ui'):
+                continue
+            ui_file = os.path.join('src', 'ui', name)
+            py_file = os.path.join(target,
+                                   'ui_' + os.path.splitext(name)[0] + '.py')
+            self.announce("compiling %s -> %s" % (ui_file, py_file), 2)
+            with open(py_file, 'w') as f:
+                uic.compileUi(ui_file, f)
+
 
 setup(name='session_ui',
       version='0.1',
@@ -13,8 +41,9 @@ setup(name='session_ui',
       package_data={'session_ui': ['ui/*.ui']},
       data_files=[('share/applications', ['session-ui.desktop'])],
       license='GPLv2',
-      options={'bdist_rpm': {'requires': 'PyQt4',
+      options={'bdist_rpm': {'requires': 'PyQt5',
                              'group':    'User Interface/Desktops',
                              'vendor':   'The Session UI Team'}},
-      scripts=['session-ui']
+      cmdclass={'build_py': build_py_ui},
+      scripts=['session-ui', 'session-pool', 'session-dashboard']
      )
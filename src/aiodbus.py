@@ -0,0 +1,872 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import asyncio
+import os
+import struct
+from urllib.parse import unquote
+
+if __package__:
+    from . import log
+else:
+    import log
+
+# A D-Bus client connection on asyncio which speaks the wire protocol
+# itself: no libdbus main loop integration and no Qt. It covers what
+# the headless session needs: asynchronous method calls with reply and
+# error handlers, signal matches, watch_name_owner() and exported
+# (fallback) objects. Values arrive as plain Python types; outgoing
+# values may be plain Python types or the typed ones below, which
+# stand in for dbus-python's (dbustypes.use(aiodbus)). Errors are
+# DBusException with the same methods as dbus-python's.
+
+SYSTEM_BUS_ADDRESS = "unix:path=/var/run/dbus/system_bus_socket"
+
+DBUS_NAME = "org.freedesktop.DBus"
+DBUS_PATH = "/org/freedesktop/DBus"
+
+DEFAULT_TIMEOUT = 25.0
+
+# Message types
+METHOD_CALL = 1
+METHOD_RETURN = 2
+ERROR = 3
+SIGNAL = 4
+
+# Message flags
+NO_REPLY_EXPECTED = 0x1
+
+# Header fields and the types of their values
+PATH = 1
+INTERFACE = 2
+MEMBER = 3
+ERROR_NAME = 4
+REPLY_SERIAL = 5
+DESTINATION = 6
+SENDER = 7
+SIGNATURE = 8
+UNIX_FDS = 9
+
+FIELD_SIGNATURES = {PATH: 'o', INTERFACE: 's', MEMBER: 's',
+                    ERROR_NAME: 's', REPLY_SERIAL: 'u', DESTINATION: 's',
+                    SENDER: 's', SIGNATURE: 'g', UNIX_FDS: 'u'}
+
+ALIGNMENT = {'y': 1, 'b': 4, 'n': 2, 'q': 2, 'i': 4, 'u': 4, 'x': 8,
+             't': 8, 'd': 8, 'h': 4, 's': 4, 'o': 4, 'g': 1, 'v': 1,
+             'a': 4, '(': 8, '{': 8}
+
+FIXED = {'y': 'B', 'b': 'I', 'n': 'h', 'q': 'H', 'i': 'i', 'u': 'I',
+         'x': 'q', 't': 'Q', 'd': 'd', 'h': 'I'}
+
+STRUCTS = {
+    '<': dict((code, struct.Struct('<' + fmt)) for code, fmt in FIXED.items()),
+    '>': dict((code, struct.Struct('>' + fmt)) for code, fmt in FIXED.items()),
+}
+LITTLE = STRUCTS['<']
+U32 = LITTLE['u']
+
+# endian, type, flags, version, body length, serial
+HEADER = struct.Struct('<cBBBII')
+
+
+
+class DBusException(Exception):
+    """Like dbus.DBusException, an error with a D-Bus error name."""
+
+    _dbus_error_name = None
+
+    def __init__(self, *args, **kwargs):
+        name = kwargs.pop('name', None)
+        if name is not None:
+            self._dbus_error_name = name
+        Exception.__init__(self, *args, **kwargs)
+
+    def get_dbus_name(self):
+        return self._dbus_error_name
+
+    def get_dbus_message(self):
+        return Exception.__str__(self)
+
+    def __str__(self):
+        if self._dbus_error_name is None:
+            return Exception.__str__(self)
+        return '%s: %s' % (self._dbus_error_name, Exception.__str__(self))
+
+
+# Typed values, named like dbus-python's. Array, Dictionary and
+# Struct may carry the signature of their contents.
+
+class Boolean(int):
+    pass
+
+
+class Byte(int):
+    pass
+
+
+class Int16(int):
+    pass
+
+
+class UInt16(int):
+    pass
+
+
+class Int32(int):
+    pass
+
+
+class UInt32(int):
+    pass
+
+
+class Int64(int):
+    pass
+
+
+class UInt64(int):
+    pass
+
+
+class Double(float):
+    pass
+
+
+class String(str):
+    pass
+
+
+class ObjectPath(str):
+    pass
+
+
+class Signature(str):
+    pass
+
+
+class Array(list):
+    def __init__(self, iterable=(), signature=None):
+        list.__init__(self, iterable)
+        self.signature = signature
+
+
+class Dictionary(dict):
+    def __init__(self, mapping=(), signature=None):
+        dict.__init__(self, mapping)
+        self.signature = signature
+
+
+class Struct(tuple):
+    def __new__(cls, iterable=(), signature=None):
+        self = tuple.__new__(cls, iterable)
+        self.signature = signature
+        return self
+
+
+TYPE_SIGNATURES = {bool: 'b', float: 'd', str: 's', bytes: 'ay',
+                   Boolean: 'b', Byte: 'y', Int16: 'n', UInt16: 'q',
+                   Int32: 'i', UInt32: 'u', Int64: 'x', UInt64: 't',
+                   Double: 'd', String: 's', ObjectPath: 'o',
+                   Signature: 'g'}
+
+
+def error(name, message):
+    return DBusException(message, name='org.freedesktop.DBus.Error.'
+                         + name)
+
+
+def type_end(signature, i):
+    code = signature[i]
+    if code == 'a':
+        return type_end(signature, i + 1)
+    if code in '({':
+        close = ')' if code == '(' else '}'
+        i += 1
+        while signature[i] != close:
+            i = type_end(signature, i)
+        return i + 1
+    if code not in ALIGNMENT:
+        raise ValueError("invalid signature %r" % signature)
+    return i + 1
+
+
+_split = {}
+
+
+def split_signature(signature):
+    """The complete types of signature, 'a{sv}o' -> ['a{sv}', 'o']."""
+    types = _split.get(signature)
+    if types is None:
+        types = []
+        i = 0
+        try:
+            while i < len(signature):
+                end = type_end(signature, i)
+                types.append(signature[i:end])
+                i = end
+        except IndexError:
+            raise ValueError("invalid signature %r" % signature)
+        _split[signature] = types
+    return types
+
+
+def guess_items(values):
+    signatures = set(guess_signature(v) for v in values)
+    if len(signatures) == 1:
+        return signatures.pop()
+    return 'v'
+
+
+def guess_signature(value):
+    """The D-Bus type of value, the way dbus-python guesses it."""
+    signature = TYPE_SIGNATURES.get(type(value))
+    if signature is not None:
+        return signature
+
+    # Array, Dictionary and Struct may know their contents' types
+    contents = getattr(value, 'signature', None)
+    if isinstance(value, dict):
+        if contents:
+            return 'a{%s}' % contents
+        if not value:
+            return 'a{sv}'
+        return 'a{%s%s}' % (guess_items(value.keys()),
+                            guess_items(value.values()))
+    if isinstance(value, tuple):
+        if contents:
+            return '(%s)' % contents
+        return '(%s)' % ''.join([guess_signature(v) for v in value])
+    if isinstance(value, list):
+        if contents:
+            return 'a' + contents
+        if not value:
+            return 'av'
+        return 'a' + guess_items(value)
+    if isinstance(value, bool):
+        return 'b'
+    if isinstance(value, int):
+        if -2 ** 31 <= value < 2 ** 31:
+            return 'i'
+        return 'x'
+    if isinstance(value, float):
+        return 'd'
+    if isinstance(value, str):
+        return 's'
+    raise TypeError("can't guess the D-Bus type of %r" % (value,))
+
+
+def pad(buf, alignment):
+    buf.extend(b'\0' * (-len(buf) % alignment))
+
+
+def marshal(buf, signature, value):
+    """Append value of the single complete type signature to buf."""
+    code = signature[0]
+    fixed = LITTLE.get(code)
+    if fixed is not None:
+        pad(buf, fixed.size)
+        if code == 'b':
+            value = 1 if value else 0
+        buf += fixed.pack(value)
+    elif code == 's' or code == 'o':
+        data = value.encode('utf-8')
+        pad(buf, 4)
+        buf += U32.pack(len(data))
+        buf += data
+        buf.append(0)
+    elif code == 'g':
+        data = value.encode('ascii')
+        buf.append(len(data))
+        buf += data
+        buf.append(0)
+    elif code == 'v':
+        contents = guess_signature(value)
+        marshal(buf, 'g', contents)
+        marshal(buf, contents, value)
+    elif code == 'a':
+        pad(buf, 4)
+        at = len(buf)
+        buf += b'\0\0\0\0'
+        element = signature[1:]
+        pad(buf, ALIGNMENT[element[0]])
+        start = len(buf)
+        if element[0] == '{':
+            key, val = split_signature(element[1:-1])
+            for k, v in value.items():
+                pad(buf, 8)
+                marshal(buf, key, k)
+                marshal(buf, val, v)
+        elif element == 'y' and isinstance(value, (bytes, bytearray)):
+            buf += value
+        else:
+            for v in value:
+                marshal(buf, element, v)
+        U32.pack_into(buf, at, len(buf) - start)
+    elif code == '(':
+        pad(buf, 8)
+        for s, v in zip(split_signature(signature[1:-1]), value):
+            marshal(buf, s, v)
+    else:
+        raise ValueError("can't marshal type %r" % signature)
+
+
+class Unmarshaller(object):
+    """Reads values from data, starting at offset."""
+
+    def __init__(self, data, offset, endian):
+        self.data = data
+        self.offset = offset
+        self.structs = STRUCTS[endian]
+
+    def align(self, alignment):
+        self.offset += -self.offset % alignment
+
+    def read(self, signature):
+        code = signature[0]
+        fixed = self.structs.get(code)
+        if fixed is not None:
+            self.align(fixed.size)
+            value, = fixed.unpack_from(self.data, self.offset)
+            self.offset += fixed.size
+            if code == 'b':
+                return bool(value)
+            return value
+        if code == 's' or code == 'o':
+            n = self.read('u')
+            start = self.offset
+            self.offset += n + 1
+            return self.data[start:start + n].decode('utf-8')
+        if code == 'g':
+            n = self.data[self.offset]
+            start = self.offset + 1
+            self.offset += n + 2
+            return self.data[start:start + n].decode('ascii')
+        if code == 'v':
+            return self.read(self.read('g'))
+        if code == 'a':
+            n = self.read('u')
+            element = signature[1:]
+            self.align(ALIGNMENT[element[0]])
+            end = self.offset + n
+            if element[0] == '{':
+                key, val = split_signature(element[1:-1])
+                value = {}
+                while self.offset < end:
+                    self.align(8)
+                    k = self.read(key)
+                    value[k] = self.read(val)
+                return value
+            if element == 'y':
+                self.offset = end
+                return bytes(self.data[end - n:end])
+            value = []
+            while self.offset < end:
+                value.append(self.read(element))
+            return value
+        if code == '(':
+            self.align(8)
+            return tuple([self.read(s)
+                          for s in split_signature(signature[1:-1])])
+        raise ValueError("can't unmarshal type %r" % signature)
+
+
+class Message(object):
+    """A received message, 'fields' maps header field codes to values."""
+
+    __slots__ = ('type', 'flags', 'serial', 'fields', 'body')
+
+    def __init__(self, type, flags, serial, fields, body):
+        self.type = type
+        self.flags = flags
+        self.serial = serial
+        self.fields = fields
+        self.body = body
+
+    @classmethod
+    def parse(cls, data):
+        endian = '<' if data[0:1] == b'l' else '>'
+        msg_type, flags, version, length, serial = \
+            struct.unpack_from(endian + 'xBBBII', data, 0)
+        r = Unmarshaller(data, 12, endian)
+        fields = dict(r.read('a(yv)'))
+        r.align(8)
+        body = [r.read(s)
+                for s in split_signature(fields.get(SIGNATURE, ''))]
+        return cls(msg_type, flags, serial, fields, body)
+
+
+def encode_message(msg_type, serial, fields, signature='', body=(),
+                   flags=0):
+    """A message as bytes, fields is a list of (code, value)."""
+    data = bytearray()
+    types = split_signature(signature)
+    if len(types) != len(body):
+        raise TypeError("signature %r does not match %d arguments" %
+                        (signature, len(body)))
+    for s, v in zip(types, body):
+        marshal(data, s, v)
+    if signature:
+        fields = fields + [(SIGNATURE, signature)]
+
+    buf = bytearray(HEADER.pack(b'l', msg_type, flags, 1, len(data),
+                                serial))
+    at = len(buf)
+    buf += b'\0\0\0\0'
+    for code, value in fields:
+        pad(buf, 8)
+        buf.append(code)
+        marshal(buf, 'g', FIELD_SIGNATURES[code])
+        marshal(buf, FIELD_SIGNATURES[code], value)
+    U32.pack_into(buf, at, len(buf) - at - 4)
+    pad(buf, 8)
+    buf += data
+    return buf
+
+
+def match_rule(rule):
+    return ",".join(["%s='%s'" % (key, value)
+                     for key, value in sorted(rule.items())])
+
+
+class Connection(asyncio.Protocol):
+    """A D-Bus connection; create it with connect().
+
+    call() sends a method call and hands the reply to reply_handler
+    (the body as arguments) or a DBusException to error_handler,
+    also when no reply arrived within 'timeout' seconds. Incoming
+    calls are dispatched to the methods of objects added with
+    add_object(); 'sent' and 'received' count the messages.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.transport = None
+        self.buf = bytearray()
+        self.authenticated = False
+        self.mechanisms = [b'ANONYMOUS']
+        self.ready = loop.create_future()
+        self.unique_name = None
+        self.on_disconnected = None
+
+        self.serial = 0
+        self.pending = {}
+        self.matches = []
+        self.objects = {}
+        self.fallbacks = {}
+
+        self.sent = 0
+        self.received = 0
+
+    # Transport
+
+    def connection_made(self, transport):
+        self.transport = transport
+        uid = str(os.getuid()).encode('ascii')
+        transport.write(b'\0AUTH EXTERNAL ' +
+                        ''.join(['%02x' % c for c in uid]).encode('ascii') +
+                        b'\r\n')
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.fail(error("Disconnected", "connection to the bus lost"))
+        pending, self.pending = self.pending, {}
+        for reply_handler, error_handler, timer in pending.values():
+            if timer:
+                timer.cancel()
+            if error_handler:
+                error_handler(error("Disconnected",
+                                    "connection to the bus lost"))
+        if self.on_disconnected:
+            self.on_disconnected()
+
+    def fail(self, e):
+        if not self.ready.done():
+            self.ready.set_exception(e)
+            if self.transport:
+                self.transport.close()
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+    def data_received(self, data):
+        self.buf += data
+        if not self.authenticated:
+            self.authenticate()
+        while self.authenticated and len(self.buf) >= 16:
+            buf = self.buf
+            endian = '<' if buf[0:1] == b'l' else '>'
+            length, serial, fields = struct.unpack_from(endian + 'III',
+                                                        buf, 4)
+            total = 16 + fields + (-fields % 8) + length
+            if len(buf) < total:
+                break
+            data = bytes(buf[:total])
+            del buf[:total]
+            self.received += 1
+            try:
+                self.handle(Message.parse(data))
+            except Exception:
+                log.exception("Error handling D-Bus message")
+
+    def authenticate(self):
+        while not self.authenticated:
+            end = self.buf.find(b'\r\n')
+            if end < 0:
+                return
+            line = bytes(self.buf[:end])
+            del self.buf[:end + 2]
+            if line.startswith(b'OK '):
+                self.authenticated = True
+                self.transport.write(b'BEGIN\r\n')
+                self.call(DBUS_NAME, DBUS_PATH, DBUS_NAME, 'Hello',
+                          reply_handler=self.hello,
+                          error_handler=self.fail)
+            elif line.startswith(b'REJECTED') and self.mechanisms:
+                self.transport.write(b'AUTH ' + self.mechanisms.pop(0) +
+                                     b'\r\n')
+            else:
+                self.fail(error("AuthFailed", "authentication failed: %s" %
+                                line.decode('ascii', 'replace')))
+                return
+
+    def hello(self, unique_name):
+        self.unique_name = unique_name
+        if not self.ready.done():
+            self.ready.set_result(self)
+
+    def send(self, data):
+        if self.transport is None:
+            raise error("Disconnected", "not connected to the bus")
+        self.transport.write(data)
+        self.sent += 1
+
+    # Outgoing calls
+
+    def call(self, destination, path, interface, member, signature='',
+             args=(), reply_handler=None, error_handler=None,
+             timeout=DEFAULT_TIMEOUT):
+        """Call a method, without handlers no reply is expected."""
+        self.serial += 1
+        serial = self.serial
+        fields = [(PATH, path), (MEMBER, member)]
+        if interface:
+            fields.append((INTERFACE, interface))
+        if destination:
+            fields.append((DESTINATION, destination))
+        flags = 0
+        if reply_handler is None and error_handler is None:
+            flags = NO_REPLY_EXPECTED
+        self.send(encode_message(METHOD_CALL, serial, fields, signature,
+                                 args, flags))
+        if not flags:
+            timer = None
+            if timeout is not None:
+                timer = self.loop.call_later(timeout, self.timed_out,
+                                             serial)
+            self.pending[serial] = (reply_handler, error_handler, timer)
+        return serial
+
+    def timed_out(self, serial):
+        reply_handler, error_handler, timer = self.pending.pop(serial)
+        if error_handler:
+            error_handler(error("NoReply", "Did not receive a reply"))
+
+    def get_object(self, bus_name, path, introspect=False):
+        """A proxy; unlike dbus-python's, it never introspects."""
+        return ProxyObject(self, bus_name, path)
+
+    # Signals
+
+    def add_signal_receiver(self, handler, signal_name=None,
+                            dbus_interface=None, bus_name=None, path=None,
+                            arg0=None):
+        """Call handler with the arguments of matching signals.
+
+        bus_name is only passed on to the bus daemon, matching it
+        against well-known names needs a lookup which is not done here.
+        """
+        rule = {'type': 'signal'}
+        for key, value in [('member', signal_name),
+                           ('interface', dbus_interface),
+                           ('sender', bus_name), ('path', path),
+                           ('arg0', arg0)]:
+            if value is not None:
+                rule[key] = value
+        self.matches.append((signal_name, dbus_interface, path, arg0,
+                             handler))
+        self.call(DBUS_NAME, DBUS_PATH, DBUS_NAME, 'AddMatch', 's',
+                  [match_rule(rule)],
+                  error_handler=lambda e: log.error(
+                      "AddMatch failed: %s", e.get_dbus_message()))
+
+    def watch_name_owner(self, bus_name, callback):
+        """callback(owner) now and whenever the owner changes.
+
+        owner is the unique name of the new owner or '' if there is
+        none, like with dbus-python.
+        """
+        self.add_signal_receiver(lambda name, old, new: callback(new),
+                                 'NameOwnerChanged', DBUS_NAME, DBUS_NAME,
+                                 DBUS_PATH, arg0=bus_name)
+        self.call(DBUS_NAME, DBUS_PATH, DBUS_NAME, 'GetNameOwner', 's',
+                  [bus_name], reply_handler=callback,
+                  error_handler=lambda e: callback(''))
+
+    # Exported objects
+
+    def add_object(self, path, interface, methods, fallback=False):
+        """Export methods {member: (in_signature, out_signature, f)}.
+
+        f is called with the arguments and the object path as 'path'
+        keyword. With fallback=True calls to paths below 'path' are
+        handled too, unless a more specific object is exported.
+        """
+        objects = self.fallbacks if fallback else self.objects
+        objects.setdefault(path, {})[interface] = methods
+
+    def lookup(self, path):
+        interfaces = self.objects.get(path)
+        while interfaces is None:
+            interfaces = self.fallbacks.get(path)
+            if path == '/':
+                break
+            path = path.rsplit('/', 1)[0] or '/'
+        return interfaces
+
+    def dispatch(self, msg):
+        path = msg.fields.get(PATH)
+        interface = msg.fields.get(INTERFACE)
+        member = msg.fields.get(MEMBER)
+
+        method = None
+        interfaces = self.lookup(path)
+        if interfaces:
+            if interface:
+                method = interfaces.get(interface, {}).get(member)
+            else:
+                for methods in interfaces.values():
+                    method = methods.get(member)
+                    if method:
+                        break
+
+        if method is None:
+            if interface == 'org.freedesktop.DBus.Peer' and \
+                    member == 'Ping':
+                self.reply(msg)
+                return
+            self.reply_error(msg, error(
+                "UnknownMethod", "No method %s.%s at %s" %
+                (interface, member, path)))
+            return
+
+        in_signature, out_signature, function = method
+        if msg.fields.get(SIGNATURE, '') != in_signature:
+            self.reply_error(msg, error(
+                "InvalidArgs", "%s expects signature %r" %
+                (member, in_signature)))
+            return
+
+        try:
+            result = function(*msg.body, path=path)
+        except DBusException as e:
+            self.reply_error(msg, e)
+            return
+        except Exception as e:
+            log.exception("%s.%s failed", interface, member, path=path)
+            self.reply_error(msg, error("Failed", str(e)))
+            return
+
+        if len(split_signature(out_signature)) == 1:
+            result = (result,)
+        self.reply(msg, out_signature, result or ())
+
+    def reply(self, msg, signature='', body=()):
+        if msg.flags & NO_REPLY_EXPECTED:
+            return
+        self.serial += 1
+        fields = [(REPLY_SERIAL, msg.serial)]
+        if SENDER in msg.fields:
+            fields.append((DESTINATION, msg.fields[SENDER]))
+        self.send(encode_message(METHOD_RETURN, self.serial, fields,
+                                 signature, body))
+
+    def reply_error(self, msg, e):
+        if msg.flags & NO_REPLY_EXPECTED:
+            return
+        self.serial += 1
+        name = e.get_dbus_name() or 'org.freedesktop.DBus.Error.Failed'
+        fields = [(REPLY_SERIAL, msg.serial), (ERROR_NAME, name)]
+        if SENDER in msg.fields:
+            fields.append((DESTINATION, msg.fields[SENDER]))
+        self.send(encode_message(ERROR, self.serial, fields, 's',
+                                 [e.get_dbus_message() or name]))
+
+    # Incoming messages
+
+    def handle(self, msg):
+        if msg.type == METHOD_RETURN or msg.type == ERROR:
+            entry = self.pending.pop(msg.fields.get(REPLY_SERIAL), None)
+            if entry is None:
+                return
+            reply_handler, error_handler, timer = entry
+            if timer:
+                timer.cancel()
+            if msg.type == METHOD_RETURN:
+                if reply_handler:
+                    reply_handler(*msg.body)
+            elif error_handler:
+                message = msg.body[0] if msg.body else ''
+                error_handler(DBusException(
+                    message, name=msg.fields.get(ERROR_NAME)))
+        elif msg.type == METHOD_CALL:
+            self.dispatch(msg)
+        elif msg.type == SIGNAL:
+            member = msg.fields.get(MEMBER)
+            interface = msg.fields.get(INTERFACE)
+            path = msg.fields.get(PATH)
+            arg0 = msg.body[0] if msg.body else None
+            for m, i, p, a, handler in self.matches:
+                if (m is None or m == member) and \
+                        (i is None or i == interface) and \
+                        (p is None or p == path) and \
+                        (a is None or a == arg0):
+                    handler(*msg.body)
+
+
+class ProxyObject(object):
+    """A remote object; calls go through Interface."""
+
+    def __init__(self, connection, bus_name, path):
+        self.connection = connection
+        self.bus_name = bus_name
+        self.path = path
+
+    def get_dbus_method(self, member, dbus_interface=None, signature=None):
+        return Method(self, dbus_interface, member, signature)
+
+
+class Interface(object):
+    """Like dbus.Interface, with the argument signatures given.
+
+    signatures maps method names to their argument signature; methods
+    without an entry get a signature guessed from their arguments.
+    """
+
+    def __init__(self, obj, dbus_interface, signatures=None):
+        self.obj = obj
+        self.dbus_interface = dbus_interface
+        self.signatures = signatures or {}
+
+    def get_dbus_method(self, member, dbus_interface=None):
+        return Method(self.obj, dbus_interface or self.dbus_interface,
+                      member, self.signatures.get(member))
+
+    def __getattr__(self, member):
+        if member.startswith('__'):
+            raise AttributeError(member)
+        method = self.get_dbus_method(member)
+        setattr(self, member, method)
+        return method
+
+
+class Method(object):
+    """A remote method, called asynchronously only.
+
+    Takes dbus-python's reply_handler, error_handler, timeout and
+    signature keywords.
+    """
+
+    def __init__(self, obj, dbus_interface, member, signature=None):
+        self.obj = obj
+        self.dbus_interface = dbus_interface
+        self.member = member
+        self.signature = signature
+
+    def __call__(self, *args, **kwargs):
+        reply_handler = kwargs.pop('reply_handler', None)
+        error_handler = kwargs.pop('error_handler', None)
+        timeout = kwargs.pop('timeout', DEFAULT_TIMEOUT)
+        signature = kwargs.pop('signature', None)
+        if kwargs:
+            raise TypeError("unexpected keywords %s" % ", ".join(kwargs))
+        if reply_handler is None and error_handler is None:
+            raise TypeError("%s: blocking calls are not supported" %
+                            self.member)
+        if signature is None:
+            signature = self.signature
+        if signature is None:
+            signature = ''.join([guess_signature(a) for a in args])
+        obj = self.obj
+        obj.connection.call(obj.bus_name, obj.path, self.dbus_interface,
+                            self.member, signature, args,
+                            reply_handler=reply_handler,
+                            error_handler=error_handler, timeout=timeout)
+
+
+def bus_address(address=None):
+    """The D-Bus address of 'system' (default), 'session' or address."""
+    if not address or address == 'system':
+        return os.environ.get('DBUS_SYSTEM_BUS_ADDRESS',
+                              SYSTEM_BUS_ADDRESS)
+    if address == 'session':
+        try:
+            return os.environ['DBUS_SESSION_BUS_ADDRESS']
+        except KeyError:
+            raise error("NoServer", "DBUS_SESSION_BUS_ADDRESS is not set")
+    return address
+
+
+def parse_address(address):
+    """(transport, {key: value}) for each of the ';' separated parts."""
+    for part in address.split(';'):
+        if not part:
+            continue
+        transport, _, params = part.partition(':')
+        values = {}
+        for param in params.split(','):
+            if param:
+                key, _, value = param.partition('=')
+                values[key] = unquote(value)
+        yield transport, values
+
+
+async def connect(address=None, loop=None):
+    """Connect and authenticate to a bus, see bus.get_bus()."""
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    address = bus_address(address)
+    reason = "no usable address"
+    for transport, values in parse_address(address):
+        try:
+            if transport == 'unix' and 'path' in values:
+                t, connection = await loop.create_unix_connection(
+                    lambda: Connection(loop), values['path'])
+            elif transport == 'unix' and 'abstract' in values:
+                t, connection = await loop.create_unix_connection(
+                    lambda: Connection(loop), '\0' + values['abstract'])
+            elif transport == 'tcp':
+                t, connection = await loop.create_connection(
+                    lambda: Connection(loop), values.get('host'),
+                    int(values['port']))
+            else:
+                reason = "unsupported transport %s" % transport
+                continue
+        except (OSError, KeyError, ValueError) as e:
+            reason = str(e)
+            continue
+        await connection.ready
+        return connection
+    raise error("NoServer", "can't connect to %s: %s" % (address, reason))
@@ -0,0 +1,61 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import dbus
+import dbus.bus
+import dbus.service
+
+if __package__:
+    from . import notification
+else:
+    import notification
+
+
+def get_bus(address=None):
+    """Return the connection to the bus ConnMan lives on.
+
+    address is 'system' (the default), 'session' or the D-Bus address
+    of another bus, e.g. a private dbus-daemon running mock_connman.
+    """
+    if not address or address == 'system':
+        return dbus.SystemBus()
+    if address == 'session':
+        return dbus.SessionBus()
+    return dbus.bus.BusConnection(address)
+
+
+class NotificationDispatcher(notification.NotificationRouter,
+                             dbus.service.FallbackObject):
+    """NotificationRouter exported on a dbus-python connection.
+
+    The dispatcher is exported once as a fallback object for all
+    sessions of the connection.
+    """
+
+    def __init__(self, bus, prefix='/'):
+        dbus.service.FallbackObject.__init__(self, bus, prefix)
+        notification.NotificationRouter.__init__(self)
+
+    @dbus.service.method("net.connman.Notification",
+                         in_signature='', out_signature='',
+                         path_keyword='path')
+    def Release(self, path):
+        self.release(path)
+
+    @dbus.service.method("net.connman.Notification",
+                         in_signature='a{sv}', out_signature='',
+                         path_keyword='path')
+    def Update(self, settings, path):
+        self.update(settings, path)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import json
+import sys
+import time
+from functools import partial
+
+from PyQt5.QtCore import QTimer, QCoreApplication
+
+from dbus.mainloop.pyqt5 import DBusQtMainLoop
+
+if __package__:
+    from . import bus
+    from . import metrics
+    from . import session_pool
+else:
+    import bus
+    import metrics
+    import session_pool
+
+PHASES = ["create", "connect", "destroy", "cycle"]
+
+
+class Cycle(object):
+    """Progress of the create/connect/destroy cycle a session is in."""
+
+    __slots__ = ('phase', 't_start', 't_phase')
+
+    def __init__(self):
+        self.phase = 'create'
+        self.t_start = time.monotonic()
+        self.t_phase = self.t_start
+
+
+class ChurnPool(session_pool.SessionPool):
+    """Cycles 'concurrency' sessions through create, connect, destroy.
+
+    Every session slot starts its next cycle as soon as the previous
+    one is finished, until 'cycles' cycles have been started. A cycle
+    is connected once the Connect() reply arrived (wait='reply') or
+    the session reached the given State ('connected' or 'online').
+
+    A slot whose CreateSession timed out waits for the late reply and
+    destroys the session it brings before its next cycle, for at most
+    another 'timeout'.
+    """
+
+    def __init__(self, bus, concurrency, cycles, templates, wait='reply',
+                 timeout=30.0, prefix=session_pool.NOTIFY_PREFIX):
+        session_pool.SessionPool.__init__(self, bus, concurrency, templates,
+                                          prefix=prefix)
+        self.prefix = prefix
+        self.cycles = cycles
+        self.wait = wait
+        self.timeout = timeout
+
+        self.started = 0
+        self.completed = 0
+        self.errors = {}
+        # Sessions created after their cycle timed out, and
+        # CreateSession calls which were never answered
+        self.late_creates = 0
+        self.unanswered_creates = 0
+        self.histograms = dict((phase, metrics.Histogram())
+                               for phase in PHASES)
+        self.cycle = {}
+
+        self.watchdog = QTimer()
+        self.watchdog.timeout.connect(self.check_timeouts)
+
+    def create_all(self):
+        self.t_start = time.monotonic()
+        self.t_end = None
+        self.watchdog.start(100)
+        for s in self.sessions:
+            self.next_cycle(s)
+
+    def next_cycle(self, s):
+        self.cycle.pop(s.index, None)
+        if self.started >= self.cycles:
+            self.check_finished()
+            return
+
+        self.started += 1
+        self.cycle[s.index] = Cycle()
+        s.create()
+
+    def next_phase(self, s, phase):
+        c = self.cycle[s.index]
+        now = time.monotonic()
+        self.histograms[c.phase].observe(now - c.t_phase)
+        c.phase = phase
+        c.t_phase = now
+
+    def session_done(self, s):
+        if s.lifecycle == 'failed':
+            self.cycle_failed(s, 'create', s.error)
+            return
+
+        self.next_phase(s, 'connect')
+        s.connect(on_done=partial(self.connect_replied, s),
+                  on_error=partial(self.connect_failed, s))
+
+    def connect_replied(self, s):
+        if self.wait == 'reply':
+            self.connected(s)
+
+    def connect_failed(self, s, e):
+        self.cycle_failed(s, 'connect', e.get_dbus_name())
+
+    def state_changed(self, s):
+        if self.wait == 'reply':
+            return
+        if s.state.state == self.wait or \
+                (self.wait == 'connected' and s.state.state == 'online'):
+            self.connected(s)
+
+    def connected(self, s):
+        c = self.cycle.get(s.index)
+        if c is None or c.phase != 'connect':
+            return
+        self.next_phase(s, 'destroy')
+        s.destroy(partial(self.destroyed, s))
+
+    def destroyed(self, s, error):
+        if error is not None:
+            self.cycle_failed(s, 'destroy', error.get_dbus_name())
+            return
+
+        c = self.cycle[s.index]
+        self.next_phase(s, 'cycle')
+        self.histograms['cycle'].observe(c.t_phase - c.t_start)
+        self.completed += 1
+        self.next_cycle(s)
+
+    def cycle_failed(self, s, phase, reason):
+        key = "%s: %s" % (phase, reason)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+        c = self.cycle.get(s.index)
+        if c is not None:
+            c.phase = 'failed'
+        if phase == 'create' and s.lifecycle == 'creating':
+            # Keep the notification path until ConnMan answered, it
+            # may still create the session
+            if c is not None:
+                c.phase = 'late'
+                c.t_phase = time.monotonic()
+            s.on_created = self.late_created
+            return
+
+        s.ops.clear()
+        if s.session_path:
+            s.destroy(lambda error: self.next_cycle(s))
+        else:
+            s.remove_notify()
+            self.next_cycle(s)
+
+    def late_created(self, s):
+        self.cycle[s.index].phase = 'failed'
+        if s.lifecycle == 'created':
+            self.late_creates += 1
+            s.destroy(lambda error: self.next_cycle(s))
+        else:
+            self.next_cycle(s)
+
+    def check_timeouts(self):
+        now = time.monotonic()
+        for s in self.sessions:
+            c = self.cycle.get(s.index)
+            if c is None or c.phase == 'failed':
+                continue
+            if c.phase == 'late':
+                if now - c.t_phase > self.timeout:
+                    self.unanswered_creates += 1
+                    c.phase = 'failed'
+                    s.on_created = None
+                    s.ops.clear()
+                    s.remove_notify()
+                    self.next_cycle(s)
+            elif now - c.t_start > self.timeout:
+                self.cycle_failed(s, c.phase, 'timeout')
+
+    def check_finished(self):
+        if self.t_end is not None or self.cycle:
+            return
+        self.t_end = time.monotonic()
+        self.watchdog.stop()
+        if self.cb_finished:
+            self.cb_finished()
+
+    def leaked(self):
+        return sorted(path for path in self.dispatcher.sessions
+                      if path.startswith(self.prefix + '/'))
+
+    def result(self):
+        elapsed = (self.t_end or time.monotonic()) - self.t_start
+        errors = sum(self.errors.values())
+        finished = self.completed + errors
+
+        latency = {}
+        for phase in PHASES:
+            h = self.histograms[phase]
+            if h.count == 0:
+                latency[phase] = None
+                continue
+            latency[phase] = {'count': h.count,
+                              'mean': h.sum / h.count,
+                              'p50': h.percentile(50),
+                              'p99': h.percentile(99),
+                              'max': h.max}
+
+        return {'timestamp': time.time(),
+                'concurrency': len(self.sessions),
+                'cycles': self.cycles,
+                'wait': self.wait,
+                'completed': self.completed,
+                'errors': errors,
+                'error_rate': float(errors) / finished if finished else 0.0,
+                'error_kinds': self.errors,
+                'late_creates': self.late_creates,
+                'unanswered_creates': self.unanswered_creates,
+                'elapsed': elapsed,
+                'cycles_per_second':
+                    self.completed / elapsed if elapsed > 0 else 0.0,
+                'latency': latency,
+                'leaked_notifications': self.leaked()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how fast sessions can be created, connected "
+        "and destroyed")
+    parser.add_argument('-b', '--bus', default='system',
+                        help="bus ConnMan is on: 'system', 'session' or a "
+                        "D-Bus address")
+    parser.add_argument('-c', '--concurrency', type=int, default=10,
+                        help="sessions cycling at the same time")
+    parser.add_argument('-n', '--cycles', type=int, default=1000,
+                        help="total number of cycles")
+    parser.add_argument('-w', '--wait', default='reply',
+                        choices=['reply', 'connected', 'online'],
+                        help="what ends the connect phase: the Connect() "
+                        "reply or the session reaching that State")
+    parser.add_argument('-t', '--timeout', type=float, default=30.0,
+                        help="seconds after which a cycle counts as failed")
+    parser.add_argument('-s', '--setting', action='append', default=[],
+                        metavar='KEY=VALUE', help="session setting")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="append the JSON result to FILE instead of "
+                        "printing it")
+    args = parser.parse_args()
+    args.template = None
+
+    DBusQtMainLoop(set_as_default=True)
+    app = QCoreApplication(sys.argv)
+
+    pool = ChurnPool(bus.get_bus(args.bus), args.concurrency, args.cycles,
+                     session_pool.parse_templates(args), wait=args.wait,
+                     timeout=args.timeout,
+                     prefix=session_pool.NOTIFY_PREFIX + '/churn')
+    pool.start(app.quit)
+    app.exec_()
+
+    result = pool.result()
+    line = json.dumps(result, sort_keys=True)
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(line + "\n")
+    else:
+        print(line)
+
+    if result['leaked_notifications']:
+        sys.stderr.write("LEAK: %d notification paths still registered: "
+                         "%s\n" % (len(result['leaked_notifications']),
+                                   " ".join(result['leaked_notifications'])))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
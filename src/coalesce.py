@@ -0,0 +1,124 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import time
+from collections import deque
+
+# The same clock as metrics.clock, without importing the histograms
+clock = getattr(time, 'monotonic', time.time)
+
+# Milliseconds changes are collected before they are sent
+DEFAULT_WINDOW = 100
+
+
+def qt_timer():
+    """A QTimer; Qt is only imported when one is needed."""
+    try:
+        from PyQt5.QtCore import QTimer
+    except ImportError:
+        from PyQt4.QtCore import QTimer
+    return QTimer()
+
+
+class ChangeScheduler(object):
+    """Flushes the ChangeCoalescers of any number of sessions.
+
+    A coalescer which got its first change of a window is due
+    'window' milliseconds later. All of them share one single shot
+    timer, which fires when the oldest one is due and flushes every
+    coalescer due by then. A window of 0 flushes on every change and
+    never needs the timer.
+
+    'timer' is a single shot timer with QTimer's interface, by default
+    a QTimer created on first use.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, timer=None):
+        self.window = window
+        self.timer = timer
+        # (due time, coalescer), oldest first
+        self.due = deque()
+
+    def schedule(self, coalescer):
+        if self.timer is None:
+            self.timer = qt_timer()
+            self.timer.setSingleShot(True)
+            self.timer.timeout.connect(self.run)
+        coalescer.due = clock() + self.window / 1000.0
+        self.due.append((coalescer.due, coalescer))
+        if not self.timer.isActive():
+            self.timer.start(self.window)
+
+    def run(self):
+        now = clock()
+        while self.due and self.due[0][0] <= now:
+            due, coalescer = self.due.popleft()
+            # Flushed or reset since, maybe scheduled again
+            if coalescer.due == due:
+                coalescer.flush()
+        if self.due:
+            self.timer.start(int((self.due[0][0] - now) * 1000) + 1)
+
+
+class ChangeCoalescer(object):
+    """Collects setting changes of one session before sending them.
+
+    Changes arriving within the scheduler's window are buffered per
+    key, so only the last value of a key survives. When the window
+    expires each buffered value is compared against the value last
+    sent for that key (or passed to CreateSession) and only real
+    differences are handed to send(key, value). A window of 0 sends
+    on every change, which still filters out no-op changes.
+    """
+
+    def __init__(self, send, scheduler):
+        self.send = send
+        self.scheduler = scheduler
+        self.pending = {}
+        self.sent = {}
+        # When the scheduler flushes the pending changes
+        self.due = None
+
+        self.requested = 0
+        self.flushed = 0
+
+    def change(self, key, value):
+        self.requested += 1
+        self.pending[key] = value
+
+        if self.scheduler.window <= 0:
+            self.flush()
+        elif self.due is None:
+            self.scheduler.schedule(self)
+
+    def flush(self):
+        self.due = None
+        pending, self.pending = self.pending, {}
+
+        for key, value in pending.items():
+            if key in self.sent and self.sent[key] == value:
+                continue
+            self.sent[key] = value
+            self.flushed += 1
+            self.send(key, value)
+
+    def reset(self, settings=None):
+        """Forget pending changes, settings is what ConnMan has now."""
+        self.due = None
+        self.pending = {}
+        self.sent = dict(settings or {})
+
+    def saved(self):
+        return self.requested - self.flushed - len(self.pending)
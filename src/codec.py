@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import sys
+import time
+
+if __package__:
+    from . import dbustypes
+else:
+    import dbustypes
+
+# Conversion between the D-Bus representation of the ConnMan session
+# settings, plain Python values and the strings shown to (and typed by)
+# the user. Each key has its own converter, formatter and encoder,
+# unknown keys are converted with str() and not encoded at all.
+
+
+def to_list(value):
+    return tuple([str(i) for i in value])
+
+
+def format_list(value):
+    return " ".join(value)
+
+
+def format_bool(value):
+    if value:
+        return '1'
+    return '0'
+
+
+CONVERTERS = {
+    "AllowedBearers":  to_list,
+    "Priority":        bool,
+    "AvoidHandover":   bool,
+    "StayConnected":   bool,
+    "EmergencyCall":   bool,
+    "SourceIPRule":    bool,
+    "PeriodicConnect": int,
+    "IdleTimeout":     int,
+    "SessionMarker":   int,
+}
+
+FORMATTERS = {
+    "AllowedBearers":  format_list,
+    "Priority":        format_bool,
+    "AvoidHandover":   format_bool,
+    "StayConnected":   format_bool,
+    "EmergencyCall":   format_bool,
+    "SourceIPRule":    format_bool,
+}
+
+# Keys of the IPv4 and IPv6 dictionaries
+IPCONFIG_CONVERTERS = {
+    "PrefixLength": int,
+    "Servers":      to_list,
+    "Excludes":     to_list,
+}
+
+IPCONFIG_FORMATTERS = {
+    "Servers":      format_list,
+    "Excludes":     format_list,
+}
+
+IPCONFIG_KEYS = ["IPv4", "IPv6"]
+
+
+def decode_ipconfig(value):
+    return " ".join(["%s=%s" % (key, IPCONFIG_FORMATTERS.get(key, str)(
+                     IPCONFIG_CONVERTERS.get(key, str)(val)))
+                     for key, val in value.items()])
+
+
+def encode_array(value):
+    if value is not None and len(value) > 0:
+        return dbustypes.binding().Array(value.split(' '), signature='s')
+    return dbustypes.binding().Array(signature='s')
+
+
+def encode_string(value):
+    if value is not None and len(value) > 0:
+        return dbustypes.binding().String(str(value))
+    return dbustypes.binding().String('')
+
+
+def encode_bool(value):
+    return dbustypes.binding().Boolean(str(value) not in ['0'])
+
+
+def encode_uint(value):
+    if value is not None and len(str(value)) > 0:
+        return dbustypes.binding().UInt32(value)
+    return None
+
+
+ENCODERS = {
+    "AllowedBearers":    encode_array,
+    "ConnectionType":    encode_string,
+    "AllowedInterface":  encode_string,
+    "ContextIdentifier": encode_string,
+    "Priority":          encode_bool,
+    "AvoidHandover":     encode_bool,
+    "StayConnected":     encode_bool,
+    "EmergencyCall":     encode_bool,
+    "SourceIPRule":      encode_bool,
+    "PeriodicConnect":   encode_uint,
+    "IdleTimeout":       encode_uint,
+}
+
+
+def convert(key, value):
+    """Return the D-Bus value of setting key as plain Python type."""
+    return CONVERTERS.get(key, str)(value)
+
+
+def display(key, value):
+    """Return the display string of a converted value of setting key."""
+    return FORMATTERS.get(key, str)(value)
+
+
+def decode(key, value):
+    """Return the display string of the D-Bus value of setting key."""
+    if key in IPCONFIG_KEYS:
+        return decode_ipconfig(value)
+    return display(key, convert(key, value))
+
+
+def encode(key, value):
+    """Return the D-Bus value for the display string of setting key.
+
+    Returns None for settings which can not be changed by the client.
+    """
+    encoder = ENCODERS.get(key)
+    if encoder is None:
+        return None
+    return encoder(value)
+
+
+def synthetic_update(i):
+    dbus = dbustypes.binding()
+    ipv4 = dbus.Dictionary({
+        "Method":       dbus.String("dhcp"),
+        "Address":      dbus.String("10.0.%d.%d" % (i // 250 % 250,
+                                                    i % 250 + 1)),
+        "Netmask":      dbus.String("255.255.0.0"),
+        "Gateway":      dbus.String("10.0.0.1"),
+    }, signature='sv')
+    ipv6 = dbus.Dictionary({
+        "Method":       dbus.String("auto"),
+        "Address":      dbus.String("fd00::%x" % i),
+        "PrefixLength": dbus.Byte(64),
+        "Privacy":      dbus.String("disabled"),
+    }, signature='sv')
+
+    return dbus.Dictionary({
+        "State":          dbus.String(["connected", "online"][i % 2]),
+        "Name":           dbus.String("ethernet_%012x_cable" % i),
+        "Bearer":         dbus.String("ethernet"),
+        "Interface":      dbus.String("eth%d" % (i % 4)),
+        "IPv4":           ipv4,
+        "IPv6":           ipv6,
+        "AllowedBearers": dbus.Array(["ethernet", "wifi"], signature='s'),
+        "ConnectionType": dbus.String("any"),
+        "SourceIPRule":   dbus.Boolean(i % 2),
+        "SessionMarker":  dbus.UInt32(i),
+    }, signature='sv')
+
+
+def bench(count):
+    updates = [synthetic_update(i) for i in range(256)]
+    keys = sum([len(u) for u in updates])
+
+    t = time.time()
+    for i in range(count // len(updates)):
+        for settings in updates:
+            for key, value in settings.items():
+                decode(key, value)
+    elapsed = time.time() - t
+
+    rounds = count // len(updates)
+    print("decoded %d updates (%d settings) in %.3f s: "
+          "%.0f updates/s, %.0f settings/s" %
+          (rounds * len(updates), rounds * keys, elapsed,
+           rounds * len(updates) / elapsed, rounds * keys / elapsed))
+
+
+def main():
+    count = 100000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    bench(count)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import os
+import signal
+import sys
+
+from PyQt5.QtCore import (Qt, QAbstractTableModel, QModelIndex,
+                          QSortFilterProxyModel, QTimer)
+from PyQt5.QtWidgets import QApplication, QHeaderView, QWidget
+
+from dbus.mainloop.pyqt5 import DBusQtMainLoop
+
+if __package__:
+    from . import bus
+    from . import session_pool
+    from . import uiloader
+else:
+    import bus
+    import session_pool
+    import uiloader
+
+# Settings shown per session, in column order
+KEYS = ["State", "Bearer", "Interface", "IPv4", "IPv6", "Name",
+        "AllowedBearers", "ConnectionType", "AllowedInterface",
+        "ContextIdentifier"]
+
+COLUMNS = ["#", "Notification", "Lifecycle"] + KEYS + ["Updates"]
+STATE_COLUMN = COLUMNS.index("State")
+BEARER_COLUMN = COLUMNS.index("Bearer")
+
+# Changed rows are announced at most once per frame (60 Hz)
+FRAME_INTERVAL = 1000 // 60
+
+# Lifecycle and Update counts are compared once per second
+REFRESH_INTERVAL = 1000
+
+
+def get_resource_path(filename):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        filename)
+
+
+class SessionTableModel(QAbstractTableModel):
+    """One row per session of a SessionPool.
+
+    The rows hold the values as they are displayed, so data() and
+    sorting are list lookups. session_changed() only marks a row; the
+    marked rows are re-read once per frame and every run of adjacent
+    rows which really changed is announced with one dataChanged().
+    """
+
+    def __init__(self, sessions, parent=None):
+        QAbstractTableModel.__init__(self, parent)
+        self.sessions = sessions
+        self.positions = dict((s.index, i) for i, s in enumerate(sessions))
+        self.rows = [self.row(s) for s in sessions]
+        self.dirty = set()
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def row(self, s):
+        return ([s.index, s.notify_path, s.lifecycle] +
+                [s.state.display(key) for key in KEYS] + [s.updates])
+
+    def session_changed(self, s):
+        self.dirty.add(self.positions[s.index])
+        if not self.timer.isActive():
+            self.timer.start(FRAME_INTERVAL)
+
+    def refresh(self):
+        """Pick up what no hook reports: Release and Update counts."""
+        for i, s in enumerate(self.sessions):
+            row = self.rows[i]
+            if row[2] != s.lifecycle or row[-1] != s.updates:
+                self.dirty.add(i)
+        self.flush()
+
+    def flush(self):
+        dirty, self.dirty = sorted(self.dirty), set()
+
+        changed = []
+        for i in dirty:
+            row = self.row(self.sessions[i])
+            if row != self.rows[i]:
+                self.rows[i] = row
+                changed.append(i)
+
+        last_column = len(COLUMNS) - 1
+        while changed:
+            first = last = changed.pop(0)
+            while changed and changed[0] == last + 1:
+                last = changed.pop(0)
+            self.dataChanged.emit(self.createIndex(first, 0),
+                                  self.createIndex(last, last_column))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.rows[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+
+class SessionFilter(QSortFilterProxyModel):
+    """Shows the sessions in one State and/or with a Bearer matching."""
+
+    def __init__(self, parent=None):
+        QSortFilterProxyModel.__init__(self, parent)
+        self.state = ""
+        self.bearer = ""
+        self.setDynamicSortFilter(True)
+
+    def set_state(self, state):
+        self.state = state
+        self.invalidateFilter()
+
+    def set_bearer(self, bearer):
+        self.bearer = bearer.lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        row = self.sourceModel().rows[source_row]
+        if self.state and row[STATE_COLUMN] != self.state:
+            return False
+        if self.bearer and self.bearer not in row[BEARER_COLUMN].lower():
+            return False
+        return True
+
+
+class DashboardPool(session_pool.SessionPool):
+    """SessionPool which tells the dashboard's model about changes."""
+
+    model = None
+
+    def session_done(self, session):
+        session_pool.SessionPool.session_done(self, session)
+        if self.model:
+            self.model.session_changed(session)
+
+    def settings_changed(self, session, keys):
+        if self.model:
+            self.model.session_changed(session)
+
+
+class Dashboard(QWidget):
+
+    def __init__(self, pool, parent=None):
+        QWidget.__init__(self, parent)
+        self.pool = pool
+        self.closing = False
+
+        ui_class = uiloader.load_ui_class(
+            get_resource_path('ui/dashboard.ui'), 'Dashboard')
+        self.ui = ui_class()
+        self.ui.setupUi(self)
+
+        self.model = SessionTableModel(pool.sessions, self)
+        pool.model = self.model
+        self.proxy = SessionFilter(self)
+        self.proxy.setSourceModel(self.model)
+
+        view = self.ui.tv_Sessions
+        view.setModel(self.proxy)
+        view.sortByColumn(0, Qt.AscendingOrder)
+        # Measuring thousands of rows on every change is what makes
+        # big tables slow, all rows have the same height
+        view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        view.verticalHeader().setDefaultSectionSize(
+            view.fontMetrics().height() + 6)
+        view.verticalHeader().hide()
+        view.horizontalHeader().setSectionResizeMode(
+            QHeaderView.Interactive)
+        view.horizontalHeader().setStretchLastSection(True)
+
+        self.ui.cb_State.currentTextChanged.connect(self.cb_State)
+        self.ui.le_Bearer.textChanged.connect(self.proxy.set_bearer)
+        self.ui.pb_Quit.clicked.connect(self.close)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(REFRESH_INTERVAL)
+        self.refresh()
+
+    def cb_State(self, text):
+        self.proxy.set_state("" if text == "all" else text)
+
+    def refresh(self):
+        self.model.refresh()
+        online = len([row for row in self.model.rows
+                      if row[STATE_COLUMN] == "online"])
+        self.ui.lb_Count.setText("%d of %d sessions shown, %d online" %
+                                 (self.proxy.rowCount(),
+                                  len(self.model.rows), online))
+
+    def closeEvent(self, event):
+        # Destroy the sessions first, then quit
+        event.ignore()
+        if self.closing:
+            return
+        self.closing = True
+        self.refresh_timer.stop()
+        self.hide()
+        app = QApplication.instance()
+        self.pool.destroy_all(app.quit)
+        QTimer.singleShot(5000, app.quit)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create many ConnMan sessions and show them in a table")
+    parser.add_argument('-b', '--bus', default='system',
+                        help="bus ConnMan is on: 'system', 'session' or a "
+                        "D-Bus address")
+    parser.add_argument('-n', '--sessions', type=int, default=100,
+                        help="number of sessions to create")
+    parser.add_argument('-w', '--window', type=int, default=0,
+                        help="maximum CreateSession calls in flight "
+                        "(0: no limit)")
+    parser.add_argument('-t', '--template',
+                        help="JSON file with a settings dict, or a list "
+                        "of dicts used round robin across the sessions")
+    parser.add_argument('-s', '--setting', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help="session setting, '{index}' is replaced by "
+                        "the session number")
+    parser.add_argument('-p', '--prefix',
+                        default=session_pool.NOTIFY_PREFIX + '/dashboard',
+                        help="notification object path prefix")
+    parser.add_argument('-c', '--connect', action='store_true',
+                        help="call Connect() on every created session")
+    args = parser.parse_args()
+
+    DBusQtMainLoop(set_as_default=True)
+    app = QApplication(sys.argv)
+
+    pool = DashboardPool(bus.get_bus(args.bus), args.sessions,
+                         session_pool.parse_templates(args),
+                         prefix=args.prefix, window=args.window,
+                         autoconnect=args.connect)
+    dashboard = Dashboard(pool)
+    dashboard.show()
+
+    signal.signal(signal.SIGINT, lambda *unused: dashboard.close())
+    wakeup = QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(200)
+
+    pool.start()
+    sys.exit(app.exec_())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+# The D-Bus types (String, Array, UInt32, ...) and DBusException the
+# modules shared by all clients create and catch. They are
+# dbus-python's, imported on first use, unless the client runs on
+# another binding with the same names and called use() before, like
+# session_aio.py with aiodbus. That way a client on aiodbus never
+# loads dbus-python and libdbus.
+
+_binding = None
+
+
+def use(module):
+    """Take the types and DBusException from module from now on."""
+    global _binding
+    _binding = module
+
+
+def binding():
+    """The module with the D-Bus types and DBusException in use."""
+    global _binding
+    if _binding is None:
+        import dbus
+        _binding = dbus
+    return _binding
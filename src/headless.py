@@ -0,0 +1,323 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import sys
+
+if __package__:
+    from . import codec
+    from . import dbustypes
+    from . import log
+    from . import netbind
+    from . import operations
+    from . import proxies
+    from . import recovery
+    from . import session_state
+    from . import traffic
+    from . import udp_probe
+else:
+    import codec
+    import dbustypes
+    import log
+    import netbind
+    import operations
+    import proxies
+    import recovery
+    import session_state
+    import traffic
+    import udp_probe
+
+class HeadlessSession(object):
+    """One ConnMan session generating traffic while it is online.
+
+    This is session_cl's session, independent of the main loop and
+    D-Bus binding it runs on. 'bus' provides watch_name_owner() and
+    get_object(), 'cache' is the proxies.ProxyCache for it (by default
+    one with dbus-python proxies), timer() returns a new single shot
+    timer with QTimer's interface and 'dispatcher' is the
+    notification.NotificationRouter exported on the bus.
+    """
+
+    def __init__(self, bus, dispatcher, url, connections=1, rate=0.0,
+                 bulk=False, report=0, udp=None, udp_rate=100.0,
+                 udp_size=64, bind="device", cache=None, timer=None,
+                 profile=None):
+        self.notify = None
+        self.notify_path = "/foo"
+
+        self.bus = bus
+        self.dispatcher = dispatcher
+        self.proxies = cache or proxies.ProxyCache(bus)
+        self.timer = timer or recovery.qt_timer
+        self.profile = profile
+        self.manager = None
+        self.session = None
+        self.session_path = None
+        self.ops = operations.OperationQueue()
+
+        # Traffic leaves through the session's interface
+        self.binder = netbind.SessionBinder(lambda: self.state, bind)
+        self.traffic = None
+        if url:
+            self.traffic = traffic.TrafficGenerator(
+                url, connections=connections, rate=rate, bulk=bulk,
+                connection_factory=self.binder.http_connection)
+        self.probe = None
+        if udp:
+            self.probe = udp_probe.UdpProbe(
+                udp, rate=udp_rate, size=udp_size,
+                socket_factory=self.binder.socket)
+        self.online = False
+        self.report_timer = self.timer()
+        self.report_timer.timeout.connect(self.print_traffic)
+        self.report = report
+
+        # After a ConnMan restart the session is re-created, retried
+        # with backoff and spread out like the other clients'
+        self.restarted = False
+        self.recovery = recovery.RecoveryScheduler(
+            concurrency=1, on_finished=self.recovered, timer=self.timer())
+        self.recovery.add(self.notify_path, self.recover)
+
+        try:
+            self.bus.watch_name_owner('net.connman',
+                                      self.connman_name_owner_changed)
+        except dbustypes.binding().DBusException:
+            log.exception("watch_name_owner failed")
+            sys.exit(1)
+
+    def connman_name_owner_changed(self, proxy):
+        if self.profile:
+            self.profile.mark("first watch_name_owner callback")
+        self.recovery.cancel()
+        self.ops.clear()
+        self.proxies.set_owner(proxy)
+        if proxy:
+            log.info("ConnMan appeared on D-Bus %s", proxy)
+            self.recovery.start(spread=None if self.restarted else 0)
+        else:
+            self.manager = None
+            log.info("ConnMan disappeared on D-Bus")
+            self.restarted = True
+            self.reset()
+
+    def recover(self, done):
+        try:
+            self.manager = self.proxies.manager()
+        except dbustypes.binding().DBusException as e:
+            log.exception("Manager not available")
+            done(e)
+            return
+
+        self.reset()
+        self.create_session(done)
+
+    def recovered(self):
+        if self.restarted or self.recovery.failures:
+            log.info(self.recovery.summary())
+
+    def create_session(self, done=None):
+        def created(path):
+            self.handle_session_create(path)
+            if done:
+                done()
+
+        def failed(e):
+            self.handle_error(e)
+            if done:
+                done(e)
+
+        self.dispatcher.register(self.notify_path,
+                                 self.cb_updateSettings, self.cb_Release)
+        self.notify = self.notify_path
+
+        self.ops.call(self.manager.CreateSession,
+                      self.settings, self.notify_path,
+                      timeout=operations.INFINITE,
+                      on_done=created, on_error=failed)
+
+    def print_traffic(self):
+        if self.traffic:
+            print("Traffic: %s" % self.traffic.stats.summary())
+        if self.probe:
+            print("UDP: %s" % self.probe.summary())
+        print("Sockets bound: %s" % self.binder.summary())
+
+    def start_traffic(self):
+        self.online = True
+        if self.traffic:
+            self.traffic.resume()
+        if self.probe:
+            self.probe.resume()
+        if self.report > 0:
+            self.report_timer.start(int(self.report * 1000))
+
+    def stop_traffic(self):
+        if not self.online:
+            return
+        self.online = False
+        self.report_timer.stop()
+        if self.traffic:
+            self.traffic.pause()
+        if self.probe:
+            self.probe.pause()
+        self.print_traffic()
+
+    def shutdown(self):
+        self.stop_traffic()
+        if self.traffic:
+            self.traffic.stop()
+        if self.probe:
+            self.probe.stop()
+
+    def reset(self):
+        self.settings = {}
+        self.state = session_state.SessionState()
+        self.proxies.evict(self.session_path)
+        self.session_path = None
+        if self.notify:
+            self.dispatcher.unregister(self.notify)
+            self.notify = None
+        if self.session:
+            self.session = None
+        self.stop_traffic()
+
+    def session_change(self, key, value):
+        if key not in self.settings:
+            self.settings[key] = codec.encode(key, value)
+        elif self.settings[key] != value:
+            val = codec.encode(key, value)
+
+            if self.session is not None:
+                self.ops.call(self.session.Change, key, val)
+
+    def cb_Release(self):
+        log.info("Release", path=self.notify)
+        self.reset()
+
+    def cb_updateSettings(self, settings):
+        log.debug("Update called", path=self.notify)
+        try:
+            changed = self.state.update(settings)
+            if log.enabled(log.DEBUG):
+                for key in changed:
+                    log.debug("\t  %s = %s", key, self.state.display(key),
+                              path=self.notify)
+
+            if "State" in changed:
+                if self.state.state == "online":
+                    self.start_traffic()
+                else:
+                    self.stop_traffic()
+        except:
+            log.exception("Exception:", path=self.notify)
+
+    def handle_session_create(self, path):
+        self.session_path = path
+        log.info("Session Path: %s", self.session_path, path=self.notify)
+        if self.profile:
+            self.profile.mark("CreateSession")
+            self.profile.report()
+            self.profile = None
+
+        self.session = self.proxies.session(self.session_path)
+        self.cb_Connect()
+
+    def handle_error(self, e):
+        log.error("%s %s", e.get_dbus_name(), e.get_dbus_message(),
+                  path=self.notify)
+
+    def cb_Create(self):
+        self.create_session()
+
+    def cb_Destroy(self):
+        if self.session_path:
+            self.ops.call(self.manager.DestroySession, self.session_path,
+                          on_error=self.handle_error)
+        self.reset()
+
+    def cb_Connect(self):
+        if not self.session:
+            return
+        self.ops.call(self.session.Connect, on_error=self.handle_error)
+
+    def cb_Disconnect(self):
+        if not self.session:
+            return
+        self.ops.call(self.session.Disconnect, on_error=self.handle_error)
+
+    def cb_Quit(self):
+        self.shutdown()
+        sys.exit()
+
+
+def add_arguments(parser):
+    """Add the options of session_cl.py and session_aio.py to parser."""
+    parser.add_argument('url', nargs='?', help="HTTP URL to GET")
+    parser.add_argument('-b', '--bus', default='system',
+                        help="bus ConnMan is on: 'system', 'session' or a "
+                        "D-Bus address")
+    parser.add_argument('-c', '--connections', type=int, default=1,
+                        help="persistent connections to fetch over")
+    parser.add_argument('-r', '--rate', type=float, default=0.0,
+                        metavar='HZ', help="GET requests per second, by "
+                        "default one GET is made per online transition")
+    parser.add_argument('--bulk', action='store_true',
+                        help="download back to back on every connection")
+    parser.add_argument('--report', type=float, default=0,
+                        metavar='SECONDS',
+                        help="print the traffic statistics periodically")
+    parser.add_argument('-u', '--udp', metavar='HOST:PORT',
+                        help="send UDP probes to a udp-server.py --reflect")
+    parser.add_argument('--udp-rate', type=float, default=100.0,
+                        metavar='PPS', help="UDP packets per second")
+    parser.add_argument('--udp-size', type=int, default=64,
+                        metavar='BYTES', help="UDP payload size")
+    parser.add_argument('--bind', default='device', choices=netbind.MODES,
+                        help="tie the traffic to the session's interface "
+                        "(falling back to its address), to its address or "
+                        "not at all")
+    parser.add_argument('--log-level', default='info',
+                        choices=sorted(log.LEVELS, key=log.LEVELS.get),
+                        help="'debug' shows every Update")
+    parser.add_argument('--log-json', action='store_true',
+                        help="log JSON lines with timestamp and session "
+                        "path")
+    parser.add_argument('--record', metavar='FILE',
+                        help="append every Update and Release to FILE, "
+                        "see replay.py")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print how long it took until the session "
+                        "was created, and the peak RSS")
+
+
+def session_options(parser, args):
+    """HeadlessSession keyword arguments for the parsed options."""
+    if not args.url and not args.udp:
+        parser.error("nothing to do, give a URL and/or --udp")
+
+    udp = None
+    if args.udp:
+        host, _, port = args.udp.rpartition(':')
+        udp = (host.strip('[]'), int(port))
+
+    return {'url': args.url,
+            'connections': args.connections,
+            'rate': args.rate,
+            'bulk': args.bulk,
+            'report': args.report,
+            'udp': udp,
+            'udp_rate': args.udp_rate,
+            'udp_size': args.udp_size,
+            'bind': args.bind}
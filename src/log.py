@@ -0,0 +1,226 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import atexit
+import sys
+import time
+
+# The same clock as metrics.clock, without importing the histograms
+clock = getattr(time, 'monotonic', time.time)
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+NAMES = dict((level, name) for name, level in LEVELS.items())
+
+# Messages waiting for the writer, further ones are dropped
+QUEUE_SIZE = 10000
+
+# Messages written with one write() at most
+BATCH = 256
+
+
+class Logger(object):
+    """Levelled logger which never blocks the caller on the terminal.
+
+    Messages below 'level' are discarded right away. The others are
+    formatted on the calling thread, so that the arguments (settings
+    dicts, session states) are shown as they were, and once start()ed
+    queued with a monotonic timestamp and the session path they are
+    about. A background thread writes them, many at a time. When the
+    queue is full messages are dropped and counted in 'dropped'
+    instead of waiting. Before start(), messages are written right
+    away, so that a tool which never configures logging pays for
+    neither the thread nor its imports.
+    With json=True every message is one compact JSON object per line:
+    t, level, path (if any) and msg.
+    """
+
+    def __init__(self, level=INFO, stream=None, json=False,
+                 queue_size=QUEUE_SIZE):
+        self.level = level
+        self.stream = stream
+        self.json = json
+        self.queue_size = queue_size
+        self.queue = None
+        self.full = None
+        self.empty = None
+        self.dropped = 0
+        self.thread = None
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, msg, *args, **kwargs):
+        if level < self.level:
+            return
+        if args:
+            msg = msg % args
+        record = (clock(), level, kwargs.get('path'), msg)
+        if self.queue is None:
+            self.write([record])
+            return
+        try:
+            self.queue.put_nowait(record)
+        except self.full:
+            self.dropped += 1
+
+    def debug(self, msg, *args, **kwargs):
+        if DEBUG >= self.level:
+            self.log(DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        if INFO >= self.level:
+            self.log(INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        if WARNING >= self.level:
+            self.log(WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        if ERROR >= self.level:
+            self.log(ERROR, msg, *args, **kwargs)
+
+    def exception(self, msg, *args, **kwargs):
+        """error() with the traceback of the exception being handled."""
+        import traceback
+
+        # The traceback is gone once the caller returns
+        self.error("%s\n%s", msg % args if args else msg,
+                   traceback.format_exc().rstrip(), **kwargs)
+
+    def start(self):
+        """Hand messages to the background writer from now on.
+
+        Call it from the main thread before any other thread logs.
+        """
+        if self.thread is not None:
+            return
+        import threading
+        try:
+            import queue
+        except ImportError:
+            import Queue as queue
+
+        self.full = queue.Full
+        self.empty = queue.Empty
+        self.queue = queue.Queue(self.queue_size)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def format(self, record):
+        t, level, path, msg = record
+        if not self.json:
+            return msg + "\n"
+        import json
+        data = {'t': round(t, 6), 'level': NAMES[level], 'msg': msg}
+        if path:
+            data['path'] = path
+        return json.dumps(data, separators=(',', ':'),
+                          sort_keys=True) + "\n"
+
+    def write(self, records):
+        lines = [self.format(r) for r in records if r is not None]
+        if lines:
+            stream = self.stream or sys.stdout
+            stream.write("".join(lines))
+            stream.flush()
+
+    def run(self):
+        while True:
+            records = [self.queue.get()]
+            try:
+                while len(records) < BATCH:
+                    records.append(self.queue.get_nowait())
+            except self.empty:
+                pass
+
+            self.write(records)
+            for r in records:
+                self.queue.task_done()
+            if None in records:
+                return
+
+    def flush(self):
+        """Wait until everything queued so far has been written."""
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(5.0)
+        self.thread = None
+        if self.dropped:
+            stream = self.stream or sys.stdout
+            stream.write("%d log messages dropped\n" % self.dropped)
+            stream.flush()
+
+
+logger = Logger()
+atexit.register(logger.close)
+
+
+def configure(level=None, json=None, stream=None):
+    """Set up the logger used by the functions below.
+
+    From now on its messages are written by the background thread.
+    """
+    if level is not None:
+        if not isinstance(level, int):
+            level = LEVELS[level]
+        logger.level = level
+    if json is not None:
+        logger.json = json
+    if stream is not None:
+        logger.stream = stream
+    logger.start()
+
+
+def enabled(level):
+    return level >= logger.level
+
+
+def debug(msg, *args, **kwargs):
+    if DEBUG >= logger.level:
+        logger.log(DEBUG, msg, *args, **kwargs)
+
+
+def info(msg, *args, **kwargs):
+    if INFO >= logger.level:
+        logger.log(INFO, msg, *args, **kwargs)
+
+
+def warning(msg, *args, **kwargs):
+    if WARNING >= logger.level:
+        logger.log(WARNING, msg, *args, **kwargs)
+
+
+def error(msg, *args, **kwargs):
+    if ERROR >= logger.level:
+        logger.log(ERROR, msg, *args, **kwargs)
+
+
+def exception(msg, *args, **kwargs):
+    logger.exception(msg, *args, **kwargs)
+
+
+def flush():
+    logger.flush()
@@ -0,0 +1,190 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import bisect
+import os
+import time
+
+clock = getattr(time, 'monotonic', time.time)
+
+# Ten logarithmic buckets per decade from 10us to 1000s, the last
+# bucket (+Inf) catches everything above. Percentiles are exact to
+# within one bucket (~26%), min and max are exact.
+BOUNDS = [10.0 ** (e / 10.0) for e in range(-50, 31)]
+
+# Lifecycle edges of a session, in the order they usually happen
+EDGES = ["create_requested", "create_replied", "first_update",
+         "connect_requested", "online", "disconnect_requested",
+         "disconnected", "released"]
+
+# name, start edge, end edge
+TRANSITIONS = [("create", "create_requested", "create_replied"),
+               ("first_update", "create_requested", "first_update"),
+               ("connect", "connect_requested", "online"),
+               ("disconnect", "disconnect_requested", "disconnected"),
+               ("lifetime", "create_replied", "released")]
+
+
+class Histogram(object):
+    """Fixed bucket latency histogram, histograms can be merged."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or
+                                      other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or
+                                      other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile."""
+        if self.count == 0:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if i < len(BOUNDS):
+                    return min(BOUNDS[i], self.max)
+                return self.max
+        return self.max
+
+    def to_dict(self):
+        return {'buckets': self.buckets, 'count': self.count,
+                'sum': self.sum, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        h = cls()
+        h.buckets = list(data['buckets'])
+        h.count = data['count']
+        h.sum = data['sum']
+        h.min = data['min']
+        h.max = data['max']
+        return h
+
+
+class LifecycleTracker(object):
+    """Timestamps the lifecycle edges of many sessions.
+
+    mark(path, edge) records when a session (identified by its
+    notification path) passed an edge. Whenever an edge ends a
+    transition which the same session started before, the time between
+    the two goes into that transition's histogram; every start is
+    measured once.
+    """
+
+    def __init__(self):
+        self.marks = {}
+        self.armed = {}
+        self.events = dict((edge, 0) for edge in EDGES)
+        self.histograms = dict((name, Histogram())
+                               for name, start, end in TRANSITIONS)
+
+    def mark(self, path, edge):
+        now = clock()
+        marks = self.marks.setdefault(path, {})
+        armed = self.armed.setdefault(path, set())
+        marks[edge] = now
+        self.events[edge] += 1
+
+        for name, start, end in TRANSITIONS:
+            if edge == end and name in armed:
+                armed.discard(name)
+                self.histograms[name].observe(now - marks[start])
+            if edge == start:
+                armed.add(name)
+
+    def seen(self, path, edge):
+        return edge in self.marks.get(path, ())
+
+    def forget(self, path):
+        self.marks.pop(path, None)
+        self.armed.pop(path, None)
+
+    def merge(self, events, histograms):
+        for edge, n in events.items():
+            self.events[edge] = self.events.get(edge, 0) + n
+        for name, h in histograms.items():
+            self.histograms[name].merge(h)
+
+    def prometheus(self, prefix="session_ui"):
+        lines = ["# HELP %s_transition_seconds Time between session "
+                 "lifecycle edges" % prefix,
+                 "# TYPE %s_transition_seconds histogram" % prefix]
+        for name, start, end in TRANSITIONS:
+            h = self.histograms[name]
+            seen = 0
+            for bound, n in zip(BOUNDS, h.buckets):
+                seen += n
+                lines.append('%s_transition_seconds_bucket{transition="%s",'
+                             'le="%.6g"} %d' % (prefix, name, bound, seen))
+            lines.append('%s_transition_seconds_bucket{transition="%s",'
+                         'le="+Inf"} %d' % (prefix, name, h.count))
+            lines.append('%s_transition_seconds_sum{transition="%s"} %.9f'
+                         % (prefix, name, h.sum))
+            lines.append('%s_transition_seconds_count{transition="%s"} %d'
+                         % (prefix, name, h.count))
+
+        lines.append("# HELP %s_events_total Session lifecycle edges "
+                     "passed" % prefix)
+        lines.append("# TYPE %s_events_total counter" % prefix)
+        for edge in EDGES:
+            lines.append('%s_events_total{edge="%s"} %d' %
+                         (prefix, edge, self.events.get(edge, 0)))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename):
+        """Write the text exposition format, atomically replacing filename."""
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.prometheus())
+        os.rename(tmp, filename)
+
+    def print_summary(self):
+        print("%-14s %7s %10s %10s %10s" %
+              ("transition", "count", "p50", "p99", "max"))
+        for name, start, end in TRANSITIONS:
+            h = self.histograms[name]
+            if h.count == 0:
+                print("%-14s %7d %10s %10s %10s" % (name, 0, "-", "-", "-"))
+                continue
+            print("%-14s %7d %8.1fms %8.1fms %8.1fms" %
+                  (name, h.count, h.percentile(50) * 1000.0,
+                   h.percentile(99) * 1000.0, h.max * 1000.0))
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import signal
+import subprocess
+import sys
+
+from PyQt5.QtCore import QTimer, QCoreApplication
+
+import dbus
+import dbus.service
+from dbus.mainloop.pyqt5 import DBusQtMainLoop
+
+if __package__:
+    from . import bus
+else:
+    import bus
+
+# Stand-in for ConnMan's Manager and Session API. It owns net.connman
+# on the session bus or a private dbus-daemon so the clients can be
+# run and benchmarked without a real ConnMan.
+
+
+class Config(object):
+
+    def __init__(self, latency=0, transitions=None, update_rate=0.0,
+                 bearers=None, interface='lo', address='127.0.0.1'):
+        # Milliseconds before a method call is answered
+        self.latency = latency
+        # [(state, ms after Connect)], applied in order
+        self.transitions = transitions or [('connected', 0), ('online', 0)]
+        # Update calls per second and online session, 0 disables them
+        self.update_rate = update_rate
+        # Periodic Updates flap the Bearer through these
+        self.bearers = bearers or ['ethernet']
+        self.interface = interface
+        self.address = address
+
+
+def later(ms, func, *args):
+    if ms <= 0:
+        func(*args)
+    else:
+        QTimer.singleShot(ms, lambda: func(*args))
+
+
+def ignore_reply(*args):
+    pass
+
+
+class MockSession(dbus.service.Object):
+
+    def __init__(self, manager, path, owner, notify_path, settings):
+        dbus.service.Object.__init__(self, manager.bus, path)
+        self.manager = manager
+        self.config = manager.config
+        self.path = path
+        self.owner = owner
+
+        self.notify = dbus.Interface(
+            manager.bus.get_object(owner, notify_path, introspect=False),
+            "net.connman.Notification")
+
+        self.settings = {
+            "State":          dbus.String("disconnected"),
+            "Name":           dbus.String(""),
+            "Bearer":         dbus.String(""),
+            "Interface":      dbus.String(""),
+            "IPv4":           dbus.Dictionary({}, signature='sv'),
+            "IPv6":           dbus.Dictionary({}, signature='sv'),
+            "AllowedBearers": dbus.Array(["*"], signature='s'),
+            "ConnectionType": dbus.String("any"),
+        }
+        self.settings.update(settings)
+
+        self.generation = 0
+        self.flap = 0
+
+    def update(self, keys=None):
+        if keys is None:
+            keys = self.settings.keys()
+        changed = dbus.Dictionary(dict((key, self.settings[key])
+                                       for key in keys), signature='sv')
+        self.manager.updates += 1
+        self.notify.Update(changed, reply_handler=ignore_reply,
+                           error_handler=ignore_reply)
+
+    def set_state(self, generation, state):
+        # A Disconnect in the meantime cancels the pending transitions
+        if generation != self.generation:
+            return
+
+        self.settings["State"] = dbus.String(state)
+        keys = ["State"]
+        if state in ["connected", "online"] and not self.settings["Name"]:
+            self.settings["Name"] = dbus.String("%s_mock" %
+                                                self.config.bearers[0])
+            self.settings["Bearer"] = dbus.String(self.config.bearers[0])
+            self.settings["Interface"] = dbus.String(self.config.interface)
+            self.settings["IPv4"] = dbus.Dictionary({
+                "Method":  dbus.String("fixed"),
+                "Address": dbus.String(self.config.address),
+                "Netmask": dbus.String("255.0.0.0"),
+            }, signature='sv')
+            keys += ["Name", "Bearer", "Interface", "IPv4"]
+        self.update(keys)
+
+    def flap_bearer(self):
+        if self.settings["State"] != "online":
+            return
+        self.flap += 1
+        bearers = self.config.bearers
+        self.settings["Bearer"] = dbus.String(bearers[self.flap %
+                                                      len(bearers)])
+        self.update(["Bearer"])
+
+    def release(self):
+        self.generation += 1
+        self.remove_from_connection()
+
+    @dbus.service.method("net.connman.Session",
+                         in_signature='', out_signature='',
+                         async_callbacks=('reply', 'error'))
+    def Connect(self, reply, error):
+        self.generation += 1
+        generation = self.generation
+        for state, delay in self.config.transitions:
+            later(delay, self.set_state, generation, state)
+        later(self.config.latency, reply)
+
+    @dbus.service.method("net.connman.Session",
+                         in_signature='', out_signature='',
+                         async_callbacks=('reply', 'error'))
+    def Disconnect(self, reply, error):
+        self.generation += 1
+        self.settings["Name"] = dbus.String("")
+        self.settings["Bearer"] = dbus.String("")
+        self.settings["Interface"] = dbus.String("")
+        self.settings["IPv4"] = dbus.Dictionary({}, signature='sv')
+        self.set_state(self.generation, "disconnected")
+        later(self.config.latency, reply)
+
+    @dbus.service.method("net.connman.Session",
+                         in_signature='sv', out_signature='',
+                         async_callbacks=('reply', 'error'))
+    def Change(self, key, value, reply, error):
+        if key not in ["AllowedBearers", "ConnectionType"]:
+            error(dbus.DBusException("Unknown setting %s" % key,
+                                     name="net.connman.Error."
+                                     "InvalidArguments"))
+            return
+        self.settings[key] = value
+        self.update([key])
+        later(self.config.latency, reply)
+
+
+class MockManager(dbus.service.Object):
+
+    def __init__(self, conn, config):
+        dbus.service.Object.__init__(self, conn, "/")
+        self.bus = conn
+        self.config = config
+        self.sessions = {}
+        self.owners = {}
+        self.next_id = 0
+
+        self.created = 0
+        self.destroyed = 0
+        self.updates = 0
+
+        self.flap_timer = QTimer()
+        self.flap_timer.timeout.connect(self.flap)
+        if config.update_rate > 0:
+            self.flap_timer.start(max(1, int(1000.0 / config.update_rate)))
+
+    def flap(self):
+        for session in list(self.sessions.values()):
+            session.flap_bearer()
+
+    def watch_owner(self, owner):
+        if owner in self.owners:
+            return
+
+        def owner_changed(name):
+            if name:
+                return
+            for path, session in list(self.sessions.items()):
+                if session.owner == owner:
+                    self.destroy(path)
+            self.owners.pop(owner).cancel()
+
+        self.owners[owner] = self.bus.watch_name_owner(owner, owner_changed)
+
+    def create(self, settings, notify_path, owner, reply):
+        path = "/sessions/mock%d" % self.next_id
+        self.next_id += 1
+
+        session = MockSession(self, path, owner, notify_path, settings)
+        self.sessions[path] = session
+        self.created += 1
+        self.watch_owner(owner)
+
+        reply(dbus.ObjectPath(path))
+        session.update()
+
+    def destroy(self, path):
+        session = self.sessions.pop(path)
+        session.release()
+        self.destroyed += 1
+
+    @dbus.service.method("net.connman.Manager",
+                         in_signature='a{sv}o', out_signature='o',
+                         sender_keyword='sender',
+                         async_callbacks=('reply', 'error'))
+    def CreateSession(self, settings, notify_path, sender, reply, error):
+        later(self.config.latency, self.create, settings, notify_path,
+              sender, reply)
+
+    @dbus.service.method("net.connman.Manager",
+                         in_signature='o', out_signature='',
+                         sender_keyword='sender',
+                         async_callbacks=('reply', 'error'))
+    def DestroySession(self, path, sender, reply, error):
+        session = self.sessions.get(path)
+        if session is None or session.owner != sender:
+            error(dbus.DBusException("No such session",
+                                     name="net.connman.Error."
+                                     "InvalidArguments"))
+            return
+        self.destroy(path)
+        later(self.config.latency, reply)
+
+    @dbus.service.method("net.connman.Manager",
+                         in_signature='sv', out_signature='')
+    def SetProperty(self, name, value):
+        if name != "SessionMode":
+            raise dbus.DBusException("Unknown property %s" % name,
+                                     name="net.connman.Error."
+                                     "InvalidArguments")
+
+
+def parse_transitions(text):
+    transitions = []
+    for item in text.split(','):
+        state, _, delay = item.partition(':')
+        transitions.append((state, int(delay or 0)))
+    return transitions
+
+
+def spawn_bus():
+    daemon = subprocess.Popen(['dbus-daemon', '--session', '--nofork',
+                               '--print-address=1'],
+                              stdout=subprocess.PIPE,
+                              universal_newlines=True)
+    address = daemon.stdout.readline().strip()
+    return daemon, address
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mock ConnMan Manager and Session service")
+    parser.add_argument('-b', '--bus', default='session',
+                        help="bus to register net.connman on: 'session', "
+                        "'system' or a D-Bus address")
+    parser.add_argument('--spawn-bus', action='store_true',
+                        help="start a private dbus-daemon and print "
+                        "its address")
+    parser.add_argument('-l', '--latency', type=int, default=0,
+                        metavar='MS', help="delay of every method reply")
+    parser.add_argument('-t', '--transitions',
+                        default='connected:50,online:100',
+                        metavar='STATE:MS,...',
+                        help="states a session goes through after "
+                        "Connect(), with their delay")
+    parser.add_argument('-u', '--update-rate', type=float, default=0,
+                        metavar='HZ',
+                        help="Update calls per second to every online "
+                        "session, flapping the bearer")
+    parser.add_argument('--bearers', default='ethernet,wifi',
+                        help="bearers to report (and flap between)")
+    parser.add_argument('--interface', default='lo',
+                        help="interface reported for online sessions")
+    parser.add_argument('--address', default='127.0.0.1',
+                        help="IPv4 address reported for online sessions")
+    args = parser.parse_args()
+
+    daemon = None
+    address = args.bus
+    if args.spawn_bus:
+        daemon, address = spawn_bus()
+        print("DBUS address: %s" % address)
+        sys.stdout.flush()
+
+    DBusQtMainLoop(set_as_default=True)
+    app = QCoreApplication(sys.argv)
+
+    conn = bus.get_bus(address)
+    name = dbus.service.BusName("net.connman", conn)
+    config = Config(latency=args.latency,
+                    transitions=parse_transitions(args.transitions),
+                    update_rate=args.update_rate,
+                    bearers=args.bearers.split(','),
+                    interface=args.interface,
+                    address=args.address)
+    manager = MockManager(conn, config)
+
+    def shutdown(*args):
+        app.quit()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    wakeup = QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(200)
+
+    app.exec_()
+
+    print("sessions created %d, destroyed %d, updates sent %d" %
+          (manager.created, manager.destroyed, manager.updates))
+    if daemon:
+        daemon.terminate()
+        daemon.wait()
+
+if __name__ == "__main__":
+    main()
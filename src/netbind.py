@@ -0,0 +1,126 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import errno
+import socket
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+# Not exported by the socket module before Python 3.3
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+
+# How sockets are tied to a session, in order of preference
+MODES = ["device", "address", "none"]
+
+
+class SessionBinder(object):
+    """Creates sockets which leave through one session's connection.
+
+    get_state() returns the session's current SessionState. With mode
+    'device' sockets are bound to its Interface with SO_BINDTODEVICE;
+    if that is not permitted (it needs CAP_NET_RAW on older kernels)
+    or no Interface is known, they are bound to the session's IPv4 or
+    IPv6 Address instead, which ConnMan's SourceIPRule routes through
+    the session's interface. Mode 'address' only does the latter,
+    'none' leaves routing alone.
+
+    'binds' counts how each socket ended up being bound.
+    """
+
+    def __init__(self, get_state, mode="device"):
+        self.get_state = get_state
+        self.mode = mode
+        self.device_denied = False
+        self.binds = dict((m, 0) for m in MODES)
+
+    def source_address(self, family):
+        state = self.get_state()
+        if family == socket.AF_INET6:
+            return state.ipv6.address
+        return state.ipv4.address
+
+    def bind(self, sock):
+        """Bind sock to the session, return how it was bound."""
+        state = self.get_state()
+        how = "none"
+        if self.mode == "device" and state.interface and \
+                not self.device_denied:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE,
+                                state.interface.encode('ascii') + b'\0')
+                how = "device"
+            except socket.error as e:
+                # No point in asking for every socket again
+                if e.errno == errno.EPERM:
+                    self.device_denied = True
+
+        if how == "none" and self.mode != "none":
+            address = self.source_address(sock.family)
+            if address:
+                sock.bind((address, 0))
+                how = "address"
+
+        self.binds[how] += 1
+        return how
+
+    def socket(self, family=socket.AF_INET, type=socket.SOCK_DGRAM):
+        sock = socket.socket(family, type)
+        try:
+            self.bind(sock)
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+    def create_connection(self, address, timeout):
+        """socket.create_connection() with a session bound socket."""
+        error = None
+        for family, type_, proto, _, sockaddr in socket.getaddrinfo(
+                address[0], address[1], 0, socket.SOCK_STREAM):
+            sock = None
+            try:
+                sock = self.socket(family, type_)
+                sock.settimeout(timeout)
+                sock.connect(sockaddr)
+                return sock
+            except socket.error as e:
+                error = e
+                if sock is not None:
+                    sock.close()
+        if error is None:
+            error = socket.error("getaddrinfo returned nothing")
+        raise error
+
+    def http_connection(self, host, port, timeout):
+        """connection_factory for traffic.TrafficGenerator."""
+        return BoundHTTPConnection(self, host, port, timeout=timeout)
+
+    def summary(self):
+        return ", ".join(["%d %s" % (self.binds[m], m) for m in MODES
+                          if self.binds[m]]) or "no sockets"
+
+
+class BoundHTTPConnection(httplib.HTTPConnection):
+
+    def __init__(self, binder, host, port, timeout):
+        httplib.HTTPConnection.__init__(self, host, port, timeout=timeout)
+        self.binder = binder
+
+    def connect(self):
+        self.sock = self.binder.create_connection((self.host, self.port),
+                                                  self.timeout)
@@ -0,0 +1,82 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+if __package__:
+    from . import dbustypes
+else:
+    import dbustypes
+
+UNKNOWN_OBJECT = 'org.freedesktop.DBus.Error.UnknownObject'
+
+
+class NotificationRouter(object):
+    """Routes net.connman.Notification calls to the owning session.
+
+    ConnMan's Update/Release calls are handed to the session by looking
+    up the object path they were sent to. Adding or removing a session
+    is a dict operation and does not talk to the bus.
+
+    With a 'recorder' (updatelog.Recorder) every Update and Release is
+    appended to its log before it is handed on.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.recorder = None
+
+    def register(self, notify_path, cb_settings, cb_release):
+        self.sessions[notify_path] = (cb_settings, cb_release)
+
+    def unregister(self, notify_path):
+        self.sessions.pop(notify_path, None)
+
+    def lookup(self, path):
+        try:
+            return self.sessions[path]
+        except KeyError:
+            raise dbustypes.binding().DBusException(
+                "No session at %s" % path, name=UNKNOWN_OBJECT)
+
+    def release(self, path):
+        if self.recorder:
+            self.recorder.release(path)
+        cb_settings, cb_release = self.lookup(path)
+        cb_release()
+
+    def update(self, settings, path):
+        if self.recorder:
+            self.recorder.update(path, settings)
+        cb_settings, cb_release = self.lookup(path)
+        cb_settings(settings)
+
+
+_dispatchers = {}
+
+
+def get_dispatcher(connection):
+    """Return the dispatcher exported on a dbus-python connection.
+
+    It is created on first use; bus.py with its dbus-python import is
+    only loaded then.
+    """
+    dispatcher = _dispatchers.get(connection)
+    if dispatcher is None:
+        if __package__:
+            from . import bus
+        else:
+            import bus
+        dispatcher = bus.NotificationDispatcher(connection)
+        _dispatchers[connection] = dispatcher
+    return dispatcher
@@ -0,0 +1,133 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+from collections import deque
+from functools import partial
+
+if __package__:
+    from . import dbustypes
+    from . import log
+else:
+    import dbustypes
+    import log
+
+# Same as libdbus' default reply timeout
+DEFAULT_TIMEOUT = 25.0
+
+# CreateSession waits for the policy engine, never time it out
+INFINITE = 2147483647.0 / 1000.0
+
+# Error name of calls which raised something else than a DBusException
+CALL_FAILED = "org.freedesktop.DBus.Error.Failed"
+
+
+def print_error(e):
+    if isinstance(e, dbustypes.binding().DBusException):
+        log.error(e.get_dbus_message())
+    else:
+        log.error(str(e))
+
+
+class OperationQueue(object):
+    """Non-blocking D-Bus calls for one session.
+
+    Calls are issued with reply/error handlers so the main loop never
+    waits for ConnMan. The operations of a session run one after the
+    other in the order they were queued, operations of different
+    sessions (different queues) are in flight at the same time.
+
+    Every operation takes an optional on_done/on_error completion
+    callback and a timeout in seconds; an operation which runs into
+    its timeout completes through on_error with a NoReply error.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.pending = deque()
+        self.busy = False
+        self.generation = 0
+
+        self.completed = 0
+        self.failed = 0
+
+    def call(self, method, *args, **kwargs):
+        on_done = kwargs.pop('on_done', None)
+        on_error = kwargs.pop('on_error', print_error)
+        timeout = kwargs.pop('timeout', self.timeout)
+
+        self.pending.append((method, args, on_done, on_error, timeout))
+        self.run()
+
+    def barrier(self, on_done):
+        """Call on_done once everything queued so far has completed."""
+        self.pending.append((None, (), on_done, None, None))
+        self.run()
+
+    def run(self):
+        while self.pending and not self.busy:
+            method, args, on_done, on_error, timeout = self.pending.popleft()
+            if method is None:
+                on_done()
+                continue
+
+            self.busy = True
+            try:
+                method(*args, timeout=timeout,
+                       reply_handler=partial(self.handle_reply,
+                                             self.generation, on_done),
+                       error_handler=partial(self.handle_error,
+                                             self.generation, on_error))
+            except Exception as e:
+                # A call which can't even be sent (e.g. arguments which
+                # don't match the signature) fails like a D-Bus error
+                # instead of stalling the queue
+                DBusException = dbustypes.binding().DBusException
+                if not isinstance(e, DBusException):
+                    log.exception("Calling %s failed",
+                                  getattr(method, '__name__', method))
+                    e = DBusException(str(e), name=CALL_FAILED)
+                self.busy = False
+                self.failed += 1
+                if on_error:
+                    on_error(e)
+
+    def handle_reply(self, generation, on_done, *result):
+        if generation != self.generation:
+            return
+
+        self.busy = False
+        self.completed += 1
+        if on_done:
+            on_done(*result)
+        self.run()
+
+    def handle_error(self, generation, on_error, e):
+        if generation != self.generation:
+            return
+
+        self.busy = False
+        self.failed += 1
+        if on_error:
+            on_error(e)
+        self.run()
+
+    def clear(self):
+        """Drop all queued operations and ignore the one in flight."""
+        self.pending.clear()
+        self.busy = False
+        self.generation += 1
+
+    def idle(self):
+        return not self.busy and not self.pending
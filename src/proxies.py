@@ -0,0 +1,138 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+from functools import partial
+
+CONNMAN = "net.connman"
+MANAGER = "net.connman.Manager"
+SESSION = "net.connman.Session"
+
+# Argument signatures of the ConnMan methods we call. With them the
+# proxies need no introspection and the binding does not guess the
+# types from the arguments on every call.
+SIGNATURES = {
+    "CreateSession":  "a{sv}o",
+    "DestroySession": "o",
+    "SetProperty":    "sv",
+    "Change":         "sv",
+    "Connect":        "",
+    "Disconnect":     "",
+}
+
+# Messages a default dbus-python get_object("net.connman", path) costs
+# on top of ours: Introspect, and GetNameOwner to bind the proxy to
+# the current owner unless it is given by its unique name. Each is a
+# call and a reply.
+INTROSPECT_MESSAGES = 2
+NAME_OWNER_MESSAGES = 2
+
+
+class Interface(object):
+    """dbus.Interface which calls with the signatures given.
+
+    The methods are looked up once and kept; methods without an entry
+    in 'signatures' have their signature guessed by dbus-python.
+    """
+
+    def __init__(self, obj, dbus_interface, signatures=None):
+        self.obj = obj
+        self.dbus_interface = dbus_interface
+        self.signatures = signatures or {}
+
+    def __getattr__(self, member):
+        if member.startswith('__'):
+            raise AttributeError(member)
+        method = self.obj.get_dbus_method(member, self.dbus_interface)
+        signature = self.signatures.get(member)
+        if signature is not None:
+            method = partial(method, signature=signature)
+        setattr(self, member, method)
+        return method
+
+
+class ProxyCache(object):
+    """ConnMan Manager and Session proxies, one per object path.
+
+    Proxies are created with introspection disabled and for the unique
+    name of the current ConnMan (set_owner(), from watch_name_owner()),
+    so creating one sends nothing over the bus. A ConnMan restart drops
+    them all; a session's proxy is dropped with evict() once it is
+    released or destroyed. 'interface' wraps the objects, by default
+    in Interface.
+
+    'created' and 'reused' count the proxies handed out and
+    'lifecycles' the session proxies created. saved() is the number
+    of messages the created proxies did not send: an Introspect for
+    each, and a GetNameOwner for those bound to a unique name (with
+    ConnMan gone the well-known name is used, which dbus-python
+    resolves). Reused proxies are not credited, the clients kept
+    their proxies before as well.
+    """
+
+    def __init__(self, bus, interface=None, signatures=SIGNATURES):
+        self.bus = bus
+        self.interface = interface or Interface
+        self.signatures = signatures
+        self.owner = CONNMAN
+        self.proxies = {}
+
+        self.created = 0
+        self.reused = 0
+        self.lifecycles = 0
+        self.avoided = 0
+
+    def set_owner(self, owner):
+        """ConnMan's unique name changed, '' if it is gone."""
+        self.proxies.clear()
+        self.owner = owner or CONNMAN
+
+    def get(self, path, dbus_interface):
+        key = (path, dbus_interface)
+        proxy = self.proxies.get(key)
+        if proxy is not None:
+            self.reused += 1
+            return proxy
+
+        obj = self.bus.get_object(self.owner, path, introspect=False)
+        proxy = self.interface(obj, dbus_interface, self.signatures)
+        self.proxies[key] = proxy
+        self.created += 1
+        self.avoided += INTROSPECT_MESSAGES
+        if self.owner.startswith(':'):
+            self.avoided += NAME_OWNER_MESSAGES
+        return proxy
+
+    def manager(self):
+        return self.get("/", MANAGER)
+
+    def session(self, path):
+        if (path, SESSION) not in self.proxies:
+            self.lifecycles += 1
+        return self.get(path, SESSION)
+
+    def evict(self, path):
+        if path:
+            self.proxies.pop((path, SESSION), None)
+
+    def saved(self):
+        return self.avoided
+
+    def summary(self):
+        text = "Proxies: %d created, %d reused, %d bus messages saved" % \
+            (self.created, self.reused, self.saved())
+        if self.lifecycles:
+            text += " (%.1f per session lifecycle)" % \
+                (float(self.saved()) / self.lifecycles)
+        return text
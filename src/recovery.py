@@ -0,0 +1,199 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import heapq
+import random
+from functools import partial
+
+if __package__:
+    from . import metrics
+else:
+    import metrics
+
+clock = metrics.clock
+
+# Sessions being re-established at the same time
+DEFAULT_CONCURRENCY = 10
+
+# Seconds the first attempts are spread over, so that many clients
+# don't all hit a freshly started ConnMan at once
+DEFAULT_SPREAD = 1.0
+
+# Retry delays grow from BACKOFF_BASE seconds up to BACKOFF_CAP
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+
+def qt_timer():
+    """A QTimer; Qt is only imported when one is needed."""
+    try:
+        from PyQt5.QtCore import QTimer
+    except ImportError:
+        from PyQt4.QtCore import QTimer
+    return QTimer()
+
+
+class RecoveryScheduler(object):
+    """Re-establishes sessions after ConnMan came back.
+
+    Every session registers a recover(done) function with add(). It
+    re-creates (and re-connects) the session and calls done() once
+    that worked or done(error) if it did not. start() runs the
+    recover functions of the given sessions, each one after a random
+    delay of up to 'spread' seconds and never more than 'concurrency'
+    at a time. Failed attempts are retried after a random delay of up
+    to BACKOFF_BASE * 2^(attempts - 1) seconds, at most BACKOFF_CAP
+    ("full jitter"). cancel() stops everything, e.g. when ConnMan
+    disappears again.
+
+    on_finished() is called when all sessions are recovered; the time
+    that took is in time_to_recovery, per session times in 'latency'.
+
+    'timer' is a single shot timer with QTimer's interface, by default
+    a QTimer.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY,
+                 spread=DEFAULT_SPREAD, base=BACKOFF_BASE,
+                 cap=BACKOFF_CAP, on_finished=None, timer=None):
+        self.concurrency = concurrency
+        self.spread = spread
+        self.base = base
+        self.cap = cap
+        self.on_finished = on_finished
+
+        self.items = {}
+        self.attempts = {}
+        self.ready = []
+        self.in_flight = 0
+        self.remaining = 0
+        self.generation = 0
+        self.pumping = False
+
+        self.t_start = None
+        self.time_to_recovery = None
+        self.tries = 0
+        self.failures = 0
+        self.latency = metrics.Histogram()
+
+        self.timer = timer if timer is not None else qt_timer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.pump)
+
+    def add(self, key, recover):
+        self.items[key] = recover
+
+    def remove(self, key):
+        self.items.pop(key, None)
+
+    def start(self, keys=None, spread=None):
+        """Recover the sessions 'keys' (all registered ones if None)."""
+        self.cancel()
+        if keys is None:
+            keys = list(self.items.keys())
+        if spread is None:
+            spread = self.spread
+
+        now = clock()
+        self.t_start = now
+        self.time_to_recovery = None
+        self.tries = 0
+        self.failures = 0
+        self.latency = metrics.Histogram()
+        self.remaining = len(keys)
+        for key in keys:
+            self.attempts[key] = 0
+            heapq.heappush(self.ready, (now + random.random() * spread, key))
+
+        if not keys:
+            self.finished()
+        self.pump()
+
+    def cancel(self):
+        self.generation += 1
+        self.timer.stop()
+        self.ready = []
+        self.attempts = {}
+        self.in_flight = 0
+        self.remaining = 0
+
+    def active(self):
+        return self.remaining > 0
+
+    def pump(self):
+        # done() may be called from within recover()
+        if self.pumping:
+            return
+        self.pumping = True
+        try:
+            now = clock()
+            while self.ready and self.in_flight < self.concurrency and \
+                    self.ready[0][0] <= now:
+                t, key = heapq.heappop(self.ready)
+                self.run(key)
+                now = clock()
+        finally:
+            self.pumping = False
+
+        self.timer.stop()
+        if self.ready and self.in_flight < self.concurrency:
+            delay = max(self.ready[0][0] - clock(), 0)
+            self.timer.start(int(delay * 1000) + 1)
+
+    def run(self, key):
+        recover = self.items.get(key)
+        if recover is None:
+            # Removed in the meantime
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.finished()
+            return
+
+        self.in_flight += 1
+        self.tries += 1
+        self.attempts[key] += 1
+        recover(partial(self.done, self.generation, key))
+
+    def done(self, generation, key, error=None):
+        if generation != self.generation:
+            return
+
+        self.in_flight -= 1
+        if error is None:
+            self.remaining -= 1
+            self.latency.observe(clock() - self.t_start)
+            if self.remaining == 0:
+                self.finished()
+        else:
+            self.failures += 1
+            delay = min(self.cap, self.base * 2 ** (self.attempts[key] - 1))
+            heapq.heappush(self.ready,
+                           (clock() + random.random() * delay, key))
+        self.pump()
+
+    def finished(self):
+        self.time_to_recovery = clock() - self.t_start
+        if self.on_finished:
+            self.on_finished()
+
+    def summary(self):
+        text = "Recovered %d sessions in %.3f s (%d attempts, %d failed)" % \
+            (self.latency.count, self.time_to_recovery or 0.0,
+             self.tries, self.failures)
+        if self.latency.count:
+            text += ", per session p50 %.1fms p99 %.1fms" % \
+                (self.latency.percentile(50) * 1000.0,
+                 self.latency.percentile(99) * 1000.0)
+        return text
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import json
+import sys
+import time
+
+from PyQt5.QtCore import QCoreApplication
+
+if __package__:
+    from . import metrics
+    from . import session_pool
+    from . import updatelog
+else:
+    import metrics
+    import session_pool
+    import updatelog
+
+
+class ReplayPool(session_pool.SessionPool):
+    """Sessions without a bus, one per notification path of a log."""
+
+    def __init__(self, paths):
+        session_pool.SessionPool.__init__(self, None, len(paths), [{}],
+                                          prefix=session_pool.NOTIFY_PREFIX
+                                          + '/replay', change_window=0)
+        self.by_path = dict(zip(paths, self.sessions))
+
+
+class Replay(object):
+    """Feeds a log into the sessions' cb_updateSettings and cb_Release.
+
+    With speed None the records follow each other as fast as possible,
+    otherwise at their recorded pace divided by speed. The time spent
+    in the callbacks goes into 'handler', how late records were
+    delivered into 'late'.
+    """
+
+    def __init__(self, reader, pool):
+        self.reader = reader
+        self.pool = pool
+        self.updates = 0
+        self.releases = 0
+        self.elapsed = 0.0
+        self.handler = metrics.Histogram()
+        self.late = metrics.Histogram()
+
+    def run(self, speed=None):
+        clock = metrics.clock
+        t_start = clock()
+        first = None
+        for kind, t, path, settings in self.reader:
+            if speed:
+                if first is None:
+                    first = t
+                delay = t_start + (t - first) / speed - clock()
+                if delay > 0:
+                    time.sleep(delay)
+                self.late.observe(max(-delay, 0.0))
+
+            s = self.pool.by_path[path]
+            start = clock()
+            if kind == updatelog.UPDATE:
+                s.cb_updateSettings(settings)
+                self.updates += 1
+            else:
+                s.cb_Release()
+                self.releases += 1
+            self.handler.observe(clock() - start)
+        self.elapsed += clock() - t_start
+
+    def result(self):
+        records = self.updates + self.releases
+
+        def ms(h, q):
+            value = h.percentile(q)
+            return None if value is None else value * 1000.0
+
+        return {'sessions': len(self.pool.sessions),
+                'updates': self.updates,
+                'releases': self.releases,
+                'elapsed': self.elapsed,
+                'records_per_s': records / self.elapsed
+                if self.elapsed else 0.0,
+                'handler_per_s': records / self.handler.sum
+                if self.handler.sum else 0.0,
+                'handler_p50_ms': ms(self.handler, 50),
+                'handler_p99_ms': ms(self.handler, 99),
+                'handler_max_ms': (self.handler.max or 0.0) * 1000.0,
+                'late_p99_ms': ms(self.late, 99)}
+
+    def print_result(self):
+        r = self.result()
+        print("Replayed %d updates and %d releases of %d sessions in "
+              "%.3f s, %.0f records/s" %
+              (r['updates'], r['releases'], r['sessions'], r['elapsed'],
+               r['records_per_s']))
+        if r['handler_p50_ms'] is not None:
+            print("Handlers: %.0f records/s, p50 %.3fms p99 %.3fms "
+                  "max %.3fms" %
+                  (r['handler_per_s'], r['handler_p50_ms'],
+                   r['handler_p99_ms'], r['handler_max_ms']))
+        if r['late_p99_ms'] is not None:
+            print("Delivered late by p99 %.3fms" % r['late_p99_ms'])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay an Update log recorded with --record into "
+        "session_pool sessions and measure how fast they handle it")
+    parser.add_argument('log', help="log written by --record")
+    parser.add_argument('-s', '--speed', type=float, metavar='FACTOR',
+                        help="keep the recorded timing, sped up by FACTOR "
+                        "(default: as fast as possible)")
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help="replay the log this many times")
+    parser.add_argument('--states', action='store_true',
+                        help="print the sessions' final states")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="append the results as a JSON line")
+    args = parser.parse_args()
+
+    try:
+        reader = updatelog.Reader(args.log)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+
+    app = QCoreApplication(sys.argv)
+
+    paths = []
+    seen = set()
+    for kind, t, path, settings in reader.records(False):
+        if path not in seen:
+            seen.add(path)
+            paths.append(path)
+
+    pool = ReplayPool(paths)
+    replay = Replay(reader, pool)
+    for i in range(args.repeat):
+        replay.run(args.speed)
+
+    replay.print_result()
+    if args.states:
+        pool.print_states()
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(dict(replay.result(), log=args.log,
+                                    timestamp=time.time(),
+                                    speed=args.speed),
+                               sort_keys=True) + "\n")
+    reader.close()
+
+if __name__ == "__main__":
+    main()
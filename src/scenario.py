@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import json
+import signal
+import sys
+import time
+from functools import partial
+
+from PyQt5.QtCore import Qt, QTimer, QCoreApplication
+
+from dbus.mainloop.pyqt5 import DBusQtMainLoop
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+if __package__:
+    from . import bus
+    from . import codec
+    from . import session_pool
+else:
+    import bus
+    import codec
+    import session_pool
+
+# A scenario is a dict (JSON or YAML):
+#
+#   sessions:  number of sessions (default 1)
+#   settings:  settings dict, or list of dicts used round robin, as
+#              for session_pool.py --template
+#   steps:     list of steps, run one after the other
+#
+# Every step has an 'action' and optionally
+#
+#   sessions:  "all" (default), an index, "FIRST-LAST" or a list
+#   at:        start at this many ms after the scenario started
+#   after:     start this many ms after the previous step finished
+#              (default 0, ignored if 'at' is given)
+#   timeout:   ms the step may take (default 30000)
+#   expect:    {key: value} every session must show when the step
+#              finished, e.g. {"State": "online"}
+#
+# Actions: create, connect, disconnect, destroy, change (with 'key'
+# and 'value') and wait (with 'until', a dict like 'expect' that is
+# waited for). A step finishes when ConnMan answered all its calls;
+# 'expect' is checked right then, so settings ConnMan only reports
+# later through Update need a wait step instead.
+#
+# Setting values in 'settings', 'value', 'expect' and 'until' are
+# strings as the UI shows them; booleans, numbers and lists of bearers
+# are turned into those ('1', "ethernet wifi") when loading.
+
+ACTIONS = ["create", "connect", "disconnect", "destroy", "change", "wait"]
+
+DEFAULT_TIMEOUT = 30000
+
+
+def display(key, value):
+    """The display string a setting value in the scenario stands for.
+
+    Strings are taken as they are, other values (true, 1, a list of
+    bearers) are formatted like the codec formats ConnMan's values.
+    Raises ValueError for values no setting could have.
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        if codec.FORMATTERS.get(key) is not codec.format_list or \
+                not all(isinstance(v, str) for v in value):
+            raise ValueError("%s can not be %r" % (key, value))
+        return codec.format_list(value)
+    if not isinstance(value, (bool, int, float)):
+        raise ValueError("%s can not be %r" % (key, value))
+    if codec.FORMATTERS.get(key) is codec.format_list:
+        return str(value)
+    return codec.display(key, value)
+
+
+def load(filename):
+    with open(filename) as f:
+        if filename.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError("PyYAML is needed for %s" % filename)
+            scenario = yaml.safe_load(f)
+        else:
+            scenario = json.load(f)
+
+    count = scenario.get('sessions', 1)
+    if not isinstance(count, int) or count < 1:
+        raise ValueError("sessions must be a positive number")
+    for i, step in enumerate(scenario.get('steps', [])):
+        action = step.get('action')
+        if action not in ACTIONS:
+            raise ValueError("step %d: unknown action %r" % (i, action))
+        if action == 'change' and ('key' not in step or
+                                   'value' not in step):
+            raise ValueError("step %d: change needs key and value" % i)
+        if action == 'wait' and not step.get('until'):
+            raise ValueError("step %d: wait needs until" % i)
+        try:
+            indices = select(step.get('sessions'), count)
+        except (TypeError, ValueError):
+            raise ValueError("step %d: invalid sessions %r" %
+                             (i, step.get('sessions')))
+        bad = [index for index in indices if not 0 <= index < count]
+        if bad or not indices:
+            raise ValueError("step %d: sessions %r not within 0-%d" %
+                             (i, step.get('sessions'), count - 1))
+        try:
+            if action == 'change':
+                step['value'] = display(step['key'], step['value'])
+            for name in ('expect', 'until'):
+                if step.get(name) and not isinstance(step[name], dict):
+                    raise ValueError("%s must be a dict" % name)
+                if step.get(name):
+                    step[name] = dict((key, display(key, value))
+                                      for key, value in step[name].items())
+        except ValueError as e:
+            raise ValueError("step %d: %s" % (i, e))
+
+    templates = scenario.get('settings') or [{}]
+    if isinstance(templates, dict):
+        templates = [templates]
+    if not isinstance(templates, list) or \
+            not all(isinstance(t, dict) for t in templates):
+        raise ValueError("settings must be a dict or a list of dicts")
+    try:
+        scenario['settings'] = [dict((str(key), display(key, value))
+                                     for key, value in t.items())
+                                for t in templates]
+    except ValueError as e:
+        raise ValueError("settings: %s" % e)
+    return scenario
+
+
+def select(spec, count):
+    """Session indices a step applies to."""
+    if spec is None or spec == "all":
+        return list(range(count))
+    if isinstance(spec, int):
+        return [spec]
+    if isinstance(spec, list):
+        return [int(i) for i in spec]
+    first, _, last = str(spec).partition('-')
+    return list(range(int(first), int(last or first) + 1))
+
+
+class Step(object):
+    """Timing and outcome of one scenario step."""
+
+    def __init__(self, index, spec, sessions):
+        self.index = index
+        self.spec = spec
+        self.action = spec['action']
+        self.sessions = sessions
+        self.pending = set(sessions)
+        self.scheduled = None
+        self.started = None
+        self.finished = None
+        self.errors = {}
+        self.deviations = []
+
+    def fail(self, index, reason):
+        self.errors[index] = str(reason)
+
+    def result(self):
+        def ms(t):
+            return None if t is None else t * 1000.0
+
+        late = None
+        if self.started is not None:
+            late = ms(self.started - self.scheduled)
+        duration = None
+        if self.finished is not None:
+            duration = ms(self.finished - self.started)
+        return {'step': self.index,
+                'action': self.action,
+                'sessions': len(self.sessions),
+                'scheduled': ms(self.scheduled),
+                'started': ms(self.started),
+                'late': late,
+                'duration': duration,
+                'errors': self.errors,
+                'deviations': self.deviations}
+
+
+class ScenarioPool(session_pool.SessionPool):
+    """Runs the steps of a scenario on a pool of sessions.
+
+    Steps are started by precise single shot timers, relative to the
+    start of the scenario ('at') or to the end of the previous step
+    ('after'). Every step records how late it started, how long it
+    took, the calls that failed and the sessions whose settings did
+    not match 'expect' (or 'until') when it finished.
+    """
+
+    def __init__(self, bus, scenario, prefix=session_pool.NOTIFY_PREFIX):
+        templates = [dict(t) for t in scenario['settings']]
+        for t in templates:
+            t.setdefault('AllowedBearers', '*')
+            t.setdefault('ConnectionType', 'any')
+
+        count = scenario.get('sessions', 1)
+        session_pool.SessionPool.__init__(self, bus, count, templates,
+                                          prefix=prefix, change_window=0)
+
+        self.steps = [Step(i, spec, select(spec.get('sessions'), count))
+                      for i, spec in enumerate(scenario.get('steps', []))]
+        self.current = None
+        self.t_start = None
+
+        self.timer = QTimer()
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.start_step)
+
+        self.watchdog = QTimer()
+        self.watchdog.setSingleShot(True)
+        self.watchdog.timeout.connect(self.step_timeout)
+
+    def create_all(self):
+        # ConnMan (re)appeared
+        if self.t_start is not None:
+            return
+        self.t_start = time.monotonic()
+        self.schedule(0)
+
+    def now(self):
+        return time.monotonic() - self.t_start
+
+    def schedule(self, i):
+        if i >= len(self.steps):
+            self.finished()
+            return
+
+        step = self.steps[i]
+        self.current = step
+        if 'at' in step.spec:
+            step.scheduled = step.spec['at'] / 1000.0
+        else:
+            previous = 0.0
+            if i > 0:
+                previous = self.steps[i - 1].finished
+            step.scheduled = previous + step.spec.get('after', 0) / 1000.0
+
+        delay = step.scheduled - self.now()
+        self.timer.start(max(int(round(delay * 1000.0)), 0))
+
+    def start_step(self):
+        step = self.current
+        step.started = self.now()
+        self.watchdog.start(step.spec.get('timeout', DEFAULT_TIMEOUT))
+
+        for i in step.sessions:
+            s = self.sessions[i]
+            getattr(self, 'do_' + step.action)(step, s)
+        if step is self.current:
+            self.check_step()
+
+    def do_create(self, step, s):
+        if s.lifecycle in ('creating', 'created'):
+            step.fail(s.index, "already %s" % s.lifecycle)
+            self.session_finished(step, s)
+            return
+        # The reply goes to this step, even if it timed out meanwhile
+        s.create(on_done=partial(self.session_created, step))
+
+    def do_connect(self, step, s):
+        if not s.session:
+            step.fail(s.index, "no session")
+            self.session_finished(step, s)
+            return
+        s.connect(on_done=partial(self.session_finished, step, s),
+                  on_error=partial(self.session_failed, step, s))
+
+    def do_disconnect(self, step, s):
+        if not s.session:
+            step.fail(s.index, "no session")
+            self.session_finished(step, s)
+            return
+        s.disconnect(on_done=partial(self.session_finished, step, s),
+                     on_error=partial(self.session_failed, step, s))
+
+    def do_change(self, step, s):
+        s.change(step.spec['key'], step.spec['value'])
+        s.ops.barrier(partial(self.session_finished, step, s))
+
+    def do_destroy(self, step, s):
+        def done(error):
+            if error is not None:
+                step.fail(s.index, error.get_dbus_name())
+            self.session_finished(step, s)
+
+        s.destroy(done)
+
+    def do_wait(self, step, s):
+        if self.matches(s, step.spec['until']):
+            self.session_finished(step, s)
+
+    def matches(self, s, expected):
+        return all(s.state.display(key) == value
+                   for key, value in expected.items())
+
+    def session_created(self, step, s):
+        if s.index not in step.pending:
+            # Too late, the step timed out
+            return
+        if s.lifecycle == 'failed':
+            step.fail(s.index, s.error)
+        self.session_finished(step, s)
+
+    def settings_changed(self, s, keys):
+        step = self.current
+        if step is not None and step.action == 'wait' and \
+                s.index in step.pending and \
+                self.matches(s, step.spec['until']):
+            self.session_finished(step, s)
+
+    def operation_failed(self, s, name, e):
+        step = self.current
+        if step is not None and s.index in step.sessions:
+            step.fail(s.index, "%s: %s" % (name, e.get_dbus_name()))
+
+    def session_failed(self, step, s, e):
+        if s.index not in step.pending:
+            return
+        step.fail(s.index, e.get_dbus_name())
+        self.session_finished(step, s)
+
+    def session_finished(self, step, s):
+        step.pending.discard(s.index)
+        if step is self.current and step.started is not None:
+            self.check_step()
+
+    def check_step(self):
+        step = self.current
+        if step.started is None or step.pending or \
+                step.finished is not None:
+            return
+        self.watchdog.stop()
+        step.finished = self.now()
+
+        expected = step.spec.get('expect')
+        if step.action == 'wait':
+            expected = step.spec['until']
+        if expected:
+            for i in step.sessions:
+                s = self.sessions[i]
+                for key, value in expected.items():
+                    actual = s.state.display(key)
+                    if actual != value:
+                        step.deviations.append(
+                            {'session': i, 'key': key,
+                             'expected': value, 'actual': actual})
+
+        self.schedule(step.index + 1)
+
+    def step_timeout(self):
+        step = self.current
+        for i in step.pending:
+            step.fail(i, "timeout")
+        step.pending.clear()
+        self.check_step()
+
+    def finished(self):
+        self.current = None
+        if self.cb_finished:
+            self.cb_finished()
+
+    def print_report(self):
+        print("%-4s %-10s %8s %10s %10s %9s %10s %6s %10s" %
+              ("#", "action", "sessions", "scheduled", "started", "late",
+               "duration", "errors", "deviations"))
+        for step in self.steps:
+            r = step.result()
+
+            def ms(value):
+                return "-" if value is None else "%.1fms" % value
+
+            print("%-4d %-10s %8d %10s %10s %9s %10s %6d %10d" %
+                  (r['step'], r['action'], r['sessions'],
+                   ms(r['scheduled']), ms(r['started']), ms(r['late']),
+                   ms(r['duration']), len(r['errors']),
+                   len(r['deviations'])))
+
+        for step in self.steps:
+            for i, reason in sorted(step.errors.items()):
+                print("step %d session %d: %s" % (step.index, i, reason))
+            for d in step.deviations:
+                print("step %d session %d: %s is %r, expected %r" %
+                      (step.index, d['session'], d['key'], d['actual'],
+                       d['expected']))
+
+    def failed(self):
+        return any(step.errors or step.deviations or step.finished is None
+                   for step in self.steps)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a scripted sequence of session operations")
+    parser.add_argument('scenario',
+                        help="JSON or YAML (.yaml, .yml) scenario file")
+    parser.add_argument('-b', '--bus', default='system',
+                        help="bus ConnMan is on: 'system', 'session' or a "
+                        "D-Bus address")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="append the step results as a JSON line")
+    args = parser.parse_args()
+
+    try:
+        scenario = load(args.scenario)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+
+    DBusQtMainLoop(set_as_default=True)
+    app = QCoreApplication(sys.argv)
+
+    pool = ScenarioPool(bus.get_bus(args.bus), scenario,
+                        prefix=session_pool.NOTIFY_PREFIX + '/scenario')
+
+    def finished():
+        pool.destroy_all(app.quit)
+        QTimer.singleShot(5000, app.quit)
+
+    def interrupt(*args):
+        pool.timer.stop()
+        pool.watchdog.stop()
+        finished()
+
+    signal.signal(signal.SIGINT, interrupt)
+    wakeup = QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(200)
+
+    pool.start(finished)
+    app.exec_()
+
+    pool.print_report()
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps({'timestamp': time.time(),
+                                'scenario': args.scenario,
+                                'steps': [step.result()
+                                          for step in pool.steps]},
+                               sort_keys=True) + "\n")
+    sys.exit(1 if pool.failed() else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import time
+t_start = time.monotonic()
+
+import argparse
+import asyncio
+import signal
+import sys
+
+if __package__:
+    from . import aiodbus
+    from . import dbustypes
+    from . import headless
+    from . import log
+    from . import notification
+    from . import proxies
+    from . import startup
+else:
+    import aiodbus
+    import dbustypes
+    import headless
+    import log
+    import notification
+    import proxies
+    import startup
+
+# codec, operations and friends create and catch aiodbus' D-Bus types
+# instead of loading dbus-python
+dbustypes.use(aiodbus)
+
+
+class Signal(object):
+
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self, *args):
+        for slot in list(self.slots):
+            slot(*args)
+
+
+class Timer(object):
+    """The part of QTimer the headless session uses, on asyncio."""
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.timeout = Signal()
+        self.single_shot = False
+        self.interval = 0
+        self.handle = None
+
+    def setSingleShot(self, single_shot):
+        self.single_shot = single_shot
+
+    def isActive(self):
+        return self.handle is not None
+
+    def start(self, msec=None):
+        self.stop()
+        if msec is not None:
+            self.interval = msec
+        self.handle = self.loop.call_later(self.interval / 1000.0, self.fire)
+
+    def stop(self):
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+
+    def fire(self):
+        self.handle = None
+        if not self.single_shot:
+            self.start()
+        self.timeout.emit()
+
+
+def export_notifications(connection):
+    """Export a NotificationRouter for all paths of connection."""
+    router = notification.NotificationRouter()
+    connection.add_object('/', 'net.connman.Notification',
+                          {'Update': ('a{sv}', '', router.update),
+                           'Release': ('', '', router.release)},
+                          fallback=True)
+    return router
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create a ConnMan session and generate traffic "
+        "while it is online, without Qt")
+    headless.add_arguments(parser)
+    args = parser.parse_args()
+    log.configure(level=args.log_level, json=args.log_json)
+    options = headless.session_options(parser, args)
+
+    profile = None
+    if args.profile_startup:
+        profile = startup.StartupProfile(t_start)
+        profile.mark("imports")
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        connection = loop.run_until_complete(aiodbus.connect(args.bus))
+    except aiodbus.DBusException as e:
+        log.error("%s", e.get_dbus_message())
+        log.flush()
+        sys.exit(1)
+    if profile:
+        profile.mark("D-Bus connection")
+    dispatcher = export_notifications(connection)
+    recorder = None
+    if args.record:
+        if __package__:
+            from . import updatelog
+        else:
+            import updatelog
+        recorder = updatelog.Recorder(args.record)
+        dispatcher.recorder = recorder
+
+    session = headless.HeadlessSession(
+        connection, dispatcher,
+        cache=proxies.ProxyCache(connection, interface=aiodbus.Interface),
+        timer=Timer, profile=profile, **options)
+
+    connection.on_disconnected = loop.stop
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, loop.stop)
+    loop.run_forever()
+
+    session.shutdown()
+    connection.close()
+    if recorder:
+        recorder.close()
+    loop.close()
+
+if __name__ == "__main__":
+    main()
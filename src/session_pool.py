@@ -0,0 +1,805 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from functools import partial
+
+from PyQt5.QtCore import QObject, QTimer, QCoreApplication
+
+from dbus.mainloop.pyqt5 import DBusQtMainLoop
+
+if __package__:
+    from . import bus
+    from . import codec
+    from . import coalesce
+    from . import log
+    from . import metrics
+    from . import netbind
+    from . import notification
+    from . import operations
+    from . import proxies
+    from . import recovery
+    from . import session_state
+    from . import snapshot
+    from . import traffic
+    from . import updatelog
+else:
+    import bus
+    import codec
+    import coalesce
+    import log
+    import metrics
+    import netbind
+    import notification
+    import operations
+    import proxies
+    import recovery
+    import session_state
+    import snapshot
+    import traffic
+    import updatelog
+
+# Paths below this prefix are handed out to the pool sessions,
+# one per session, e.g. /session_ui/pool/s42
+NOTIFY_PREFIX = "/session_ui/pool"
+
+
+class PoolSession(object):
+    """One ConnMan session owned by a SessionPool."""
+
+    def __init__(self, pool, index, notify_path, template):
+        self.pool = pool
+        self.index = index
+        self.notify_path = notify_path
+        self.template = template
+
+        self.settings = {}
+        for key, value in template.items():
+            val = codec.encode(key, value)
+            if val is not None:
+                self.settings[key] = val
+
+        self.notify = False
+        self.session_path = None
+        self.session = None
+        self.on_created = None
+        self.ops = operations.OperationQueue()
+        self.changes = coalesce.ChangeCoalescer(self.send_change,
+                                                pool.change_scheduler)
+
+        # idle -> creating -> created | failed
+        self.lifecycle = 'idle'
+        # What to restore after ConnMan restarted
+        self.want_connected = False
+        self.lost = False
+        self.error = None
+        self.state = session_state.SessionState()
+        self.updates = 0
+
+        self.t_create = None
+        self.t_created = None
+
+        self.binder = netbind.SessionBinder(lambda: self.state, pool.bind)
+        self.traffic = None
+        if pool.traffic_options:
+            self.traffic = traffic.TrafficGenerator(
+                connection_factory=self.binder.http_connection,
+                **pool.traffic_options)
+
+    def create(self, on_done=None):
+        """CreateSession, on_done(self) replaces pool.session_done()."""
+        self.on_created = on_done
+        self.pool.dispatcher.register(self.notify_path,
+                                      self.cb_updateSettings, self.cb_Release)
+        self.notify = True
+
+        self.lifecycle = 'creating'
+        self.error = None
+        self.state = session_state.SessionState()
+        self.updates = 0
+        self.changes.reset(self.settings)
+        self.t_create = time.monotonic()
+        self.pool.tracker.mark(self.notify_path, "create_requested")
+        self.ops.call(self.pool.manager.CreateSession,
+                      self.settings, self.notify_path,
+                      timeout=operations.INFINITE,
+                      on_done=self.handle_session_create,
+                      on_error=self.handle_session_create_error)
+
+    def handle_session_create(self, path):
+        self.t_created = time.monotonic()
+        self.pool.tracker.mark(self.notify_path, "create_replied")
+        self.session_path = path
+        self.session = self.pool.proxies.session(path)
+        self.lifecycle = 'created'
+        if self.on_created:
+            self.created()
+            return
+        if self.pool.autoconnect:
+            self.connect()
+        self.pool.session_done(self)
+
+    def handle_session_create_error(self, e):
+        self.t_created = time.monotonic()
+        self.lifecycle = 'failed'
+        self.error = str(e)
+        self.remove_notify()
+        if self.on_created:
+            self.created()
+            return
+        self.pool.session_done(self)
+
+    def created(self):
+        on_created, self.on_created = self.on_created, None
+        on_created(self)
+
+    def recover(self, done):
+        """Re-create the session, and re-connect it if it was."""
+        def connected(*args):
+            self.lost = False
+            done()
+
+        def created(s):
+            if self.lifecycle == 'failed':
+                done(self.error)
+            elif self.want_connected:
+                self.connect(on_done=connected, on_error=done)
+            else:
+                connected()
+
+        if self.session is None:
+            self.create(on_done=created)
+        else:
+            created(self)
+
+    def cb_updateSettings(self, settings):
+        tracker = self.pool.tracker
+        self.updates += 1
+        if self.updates == 1:
+            tracker.mark(self.notify_path, "first_update")
+
+        changed = self.state.update(settings)
+        if changed:
+            self.pool.settings_changed(self, changed)
+        if "State" in changed:
+            if self.state.state == "online":
+                tracker.mark(self.notify_path, "online")
+            elif self.state.state == "disconnected":
+                tracker.mark(self.notify_path, "disconnected")
+            if self.traffic:
+                if self.state.state == "online":
+                    self.traffic.resume()
+                else:
+                    self.traffic.pause()
+            self.pool.state_changed(self)
+
+    def change(self, key, value):
+        val = codec.encode(key, value)
+        if val is None:
+            return
+
+        self.settings[key] = val
+        if self.pool.snapshot is not None:
+            self.pool.snapshot.put(self.notify_path, self.settings)
+        if self.session:
+            self.changes.change(key, val)
+
+    def send_change(self, key, val):
+        if self.session:
+            self.ops.call(self.session.Change, key, val,
+                          on_error=partial(self.pool.operation_failed,
+                                           self, "Change"))
+
+    def connect(self, on_done=None, on_error=operations.print_error):
+        self.want_connected = True
+        if self.session:
+            self.pool.tracker.mark(self.notify_path, "connect_requested")
+            self.ops.call(self.session.Connect, on_done=on_done,
+                          on_error=on_error)
+
+    def disconnect(self, on_done=None, on_error=operations.print_error):
+        self.want_connected = False
+        if self.session:
+            self.pool.tracker.mark(self.notify_path, "disconnect_requested")
+            self.ops.call(self.session.Disconnect, on_done=on_done,
+                          on_error=on_error)
+
+    def cb_Release(self):
+        self.pool.tracker.mark(self.notify_path, "released")
+        if self.traffic:
+            self.traffic.pause()
+        self.lifecycle = 'released'
+        self.pool.proxies.evict(self.session_path)
+        self.session_path = None
+        self.session = None
+        self.remove_notify()
+
+    def remove_notify(self):
+        if self.notify:
+            self.pool.dispatcher.unregister(self.notify_path)
+            self.pool.tracker.forget(self.notify_path)
+            self.notify = False
+
+    def destroy(self, cb_done):
+        if not self.session_path or not self.pool.manager:
+            self.remove_notify()
+            cb_done(None)
+            return
+
+        if self.traffic:
+            self.traffic.pause()
+
+        def done(error=None):
+            self.lifecycle = 'destroyed'
+            self.pool.proxies.evict(self.session_path)
+            self.session_path = None
+            self.session = None
+            self.remove_notify()
+            cb_done(error)
+
+        self.ops.call(self.pool.manager.DestroySession, self.session_path,
+                      on_done=done, on_error=done)
+
+    def duration(self):
+        if self.t_create is None or self.t_created is None:
+            return None
+        return self.t_created - self.t_create
+
+
+class SessionPool(QObject):
+    """Creates and tracks many sessions from a single bus connection.
+
+    CreateSession calls are pipelined: up to 'window' calls are in
+    flight at any time (all of them if window is 0) and each reply
+    kicks off the next one.
+
+    With a recovery.RecoveryScheduler the sessions which existed when
+    ConnMan disappeared are re-created (and re-connected) through it
+    once ConnMan is back, instead of all at once.
+
+    With traffic_options (the keyword arguments of
+    traffic.TrafficGenerator, including the url) every session
+    generates its own traffic while it is online, bound to the
+    session's interface or address according to 'bind'.
+
+    Sessions are numbered from 'first' on, so that several pools (see
+    shard.py) can share the settings templates and a notification
+    path prefix.
+
+    'restore', a list of (notification path, template) such as
+    restore_templates() returns, replaces count, templates and
+    prefix. A snapshot.Snapshot is kept up to date with the settings
+    of all sessions; committing it is up to the caller.
+    """
+
+    def __init__(self, bus, count, templates, prefix=NOTIFY_PREFIX,
+                 window=0, autoconnect=False,
+                 change_window=coalesce.DEFAULT_WINDOW,
+                 traffic_options=None, bind="device", recovery=None,
+                 first=0, restore=None, snapshot=None, parent=None):
+        QObject.__init__(self, parent)
+
+        self.bus = bus
+        # Without a bus notifications are only fed in by replay.py
+        self.dispatcher = None
+        if bus is not None:
+            self.dispatcher = notification.get_dispatcher(bus)
+        self.proxies = proxies.ProxyCache(bus)
+        self.manager = None
+        self.window = window
+        self.autoconnect = autoconnect
+        self.tracker = metrics.LifecycleTracker()
+        # One timer flushes the coalesced changes of all sessions
+        self.change_scheduler = coalesce.ChangeScheduler(change_window)
+        self.traffic_options = traffic_options
+        self.bind = bind
+
+        if restore is None:
+            restore = []
+            for i in range(first, first + count):
+                template = dict((key, value.format(index=i))
+                                for key, value in
+                                templates[i % len(templates)].items())
+                restore.append(("%s/s%d" % (prefix, i), template))
+        self.sessions = [PoolSession(self, first + i, path, template)
+                         for i, (path, template) in enumerate(restore)]
+
+        self.snapshot = snapshot
+        if snapshot is not None:
+            for s in self.sessions:
+                snapshot.put(s.notify_path, s.settings)
+
+        self.recovery = recovery
+        if recovery is not None:
+            recovery.on_finished = self.recovered
+            for s in self.sessions:
+                recovery.add(s.index, s.recover)
+
+        self.backlog = []
+        self.target = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.t_start = None
+        self.t_end = None
+        self.cb_finished = None
+
+    def start(self, cb_finished=None):
+        self.cb_finished = cb_finished
+        self.bus.watch_name_owner('net.connman',
+                                  self.connman_name_owner_changed)
+
+    def connman_name_owner_changed(self, proxy):
+        self.proxies.set_owner(proxy)
+        if proxy:
+            log.info("ConnMan appeared on D-Bus %s", proxy)
+            self.manager = self.proxies.manager()
+            lost = [s.index for s in self.sessions if s.lost]
+            if self.recovery is not None and lost:
+                self.recovery.start(lost)
+                # Sessions the pool did not get to yet
+                self.pump()
+            else:
+                self.create_all()
+        else:
+            log.info("ConnMan disappeared on D-Bus")
+            self.manager = None
+            if self.recovery is not None:
+                self.recovery.cancel()
+            for s in self.sessions:
+                s.ops.clear()
+                if s.lifecycle == 'creating' and s.on_created is None:
+                    # The reply to the pool's CreateSession is gone
+                    # with the queue, the session is left to recovery
+                    self.in_flight -= 1
+                    self.target -= 1
+                if s.lifecycle in ('creating', 'created'):
+                    s.lost = True
+                s.cb_Release()
+
+    def create_all(self):
+        self.backlog = [s for s in reversed(self.sessions)
+                        if s.lifecycle != 'created']
+        self.target = len(self.backlog)
+        self.in_flight = 0
+        self.completed = 0
+        self.t_start = time.monotonic()
+        self.t_end = None
+        self.pump()
+
+    def pump(self):
+        while self.backlog and self.manager and \
+                (self.window <= 0 or self.in_flight < self.window):
+            s = self.backlog.pop()
+            self.in_flight += 1
+            s.create()
+
+    def session_done(self, session):
+        self.in_flight -= 1
+        self.completed += 1
+        if session.lifecycle == 'failed':
+            log.error("Session %s: %s", session.notify_path, session.error,
+                      path=session.notify_path)
+        self.pump()
+        self.check_finished()
+
+    def check_finished(self):
+        if self.completed < self.target or self.t_end is not None:
+            return
+        self.t_end = time.monotonic()
+        self.print_summary()
+        # Only the first time, not whenever create_all() runs again
+        # after a ConnMan restart
+        if self.cb_finished:
+            cb_finished, self.cb_finished = self.cb_finished, None
+            cb_finished()
+
+    def recovered(self):
+        log.info(self.recovery.summary())
+        # The sessions the pool lost while creating them are back
+        self.check_finished()
+
+    def state_changed(self, session):
+        pass
+
+    def settings_changed(self, session, keys):
+        pass
+
+    def operation_failed(self, session, name, e):
+        log.error("Session %s: %s failed: %s", session.notify_path, name, e,
+                  path=session.notify_path)
+
+    def change_all(self, key, value):
+        for s in self.sessions:
+            s.change(key, value)
+
+    def connect_all(self):
+        for s in self.sessions:
+            s.connect()
+
+    def disconnect_all(self):
+        for s in self.sessions:
+            s.disconnect()
+
+    def destroy_all(self, cb_done):
+        pending = [len(self.sessions)]
+
+        def done(error):
+            pending[0] -= 1
+            if pending[0] == 0:
+                cb_done()
+
+        if not self.sessions:
+            cb_done()
+        for s in self.sessions:
+            s.destroy(done)
+
+    def stats(self):
+        """Compact, JSON serializable counters of the whole pool."""
+        lifecycle = {}
+        states = {}
+        for s in self.sessions:
+            lifecycle[s.lifecycle] = lifecycle.get(s.lifecycle, 0) + 1
+            if s.lifecycle == 'created':
+                state = s.state.state or '-'
+                states[state] = states.get(state, 0) + 1
+
+        data = {'sessions': len(self.sessions),
+                'lifecycle': lifecycle,
+                'states': states,
+                'updates': sum(s.updates for s in self.sessions),
+                'events': dict(self.tracker.events),
+                'histograms': dict((name, h.to_dict()) for name, h in
+                                   self.tracker.histograms.items()
+                                   if h.count)}
+
+        if self.traffic_options:
+            requests = errors = nbytes = 0
+            for s in self.sessions:
+                with s.traffic.stats.lock:
+                    requests += s.traffic.stats.requests
+                    errors += s.traffic.stats.errors
+                    nbytes += s.traffic.stats.bytes
+            data['traffic'] = {'requests': requests, 'errors': errors,
+                               'bytes': nbytes}
+        return data
+
+    def count(self, lifecycle):
+        return len([s for s in self.sessions if s.lifecycle == lifecycle])
+
+    def print_summary(self):
+        log.flush()
+        elapsed = (self.t_end or time.monotonic()) - self.t_start
+        created = self.count('created')
+        failed = self.count('failed')
+        rate = 0.0
+        if elapsed > 0:
+            rate = (created + failed) / elapsed
+        print("Created %d/%d sessions (%d failed) in %.3f s, %.1f sessions/s"
+              % (created, len(self.sessions), failed, elapsed, rate))
+
+    def print_changes(self):
+        requested = sum(s.changes.requested for s in self.sessions)
+        sent = sum(s.changes.flushed for s in self.sessions)
+        saved = sum(s.changes.saved() for s in self.sessions)
+        print("Change calls: %d requested, %d sent, %d saved" %
+              (requested, sent, saved))
+
+    def stop_traffic(self):
+        for s in self.sessions:
+            if s.traffic:
+                s.traffic.stop()
+
+    def print_traffic(self):
+        print("%-5s %-12s %-24s %8s %6s %12s %10s %9s" %
+              ("#", "Interface", "Sockets", "Requests", "Errors", "Bytes",
+               "KiB/s", "TTFB p50"))
+        requests = errors = nbytes = 0
+        throughput = 0.0
+        for s in self.sessions:
+            if not s.traffic:
+                continue
+            stats = s.traffic.stats
+            with stats.lock:
+                ttfb = stats.ttfb.percentile(50)
+                ttfb = "-" if ttfb is None else "%.1fms" % (ttfb * 1000.0)
+                print("%-5d %-12s %-24s %8d %6d %12d %10.1f %9s" %
+                      (s.index, s.state.interface or "-",
+                       s.binder.summary(), stats.requests, stats.errors,
+                       stats.bytes, stats.throughput() / 1024.0, ttfb))
+                requests += stats.requests
+                errors += stats.errors
+                nbytes += stats.bytes
+                throughput += stats.throughput()
+        print("Traffic: %d requests, %d errors, %d bytes, %.1f KiB/s over "
+              "all sessions" % (requests, errors, nbytes,
+                                throughput / 1024.0))
+
+    def print_states(self):
+        print("%-5s %-24s %-32s %-10s %-12s %8s %7s" %
+              ("#", "Notification", "Session", "Lifecycle", "State",
+               "Create", "Updates"))
+        for s in self.sessions:
+            duration = s.duration()
+            if duration is None:
+                duration = "-"
+            else:
+                duration = "%.1fms" % (duration * 1000.0)
+            print("%-5d %-24s %-32s %-10s %-12s %8s %7d" %
+                  (s.index, s.notify_path, s.session_path or "-",
+                   s.lifecycle, s.state.state or '-',
+                   duration, s.updates))
+
+
+def parse_templates(args):
+    templates = [{}]
+    if args.template:
+        with open(args.template) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [data]
+        templates = [dict((str(k), str(v)) for k, v in t.items())
+                     for t in data]
+
+    for setting in args.setting:
+        key, _, value = setting.partition('=')
+        for t in templates:
+            t[key] = value
+
+    for t in templates:
+        t.setdefault('AllowedBearers', '*')
+        t.setdefault('ConnectionType', 'any')
+
+    return templates
+
+
+def restore_templates(snap):
+    """(notification path, template) of every session in snap.
+
+    The settings are turned back into the strings they were encoded
+    from, so that they get exactly the D-Bus types of settings given
+    on the command line.
+    """
+    return [(path, dict((str(key), codec.decode(key, value))
+                        for key, value in settings.items()))
+            for path, settings in snap.sessions()]
+
+
+def main():
+    t_start = time.monotonic()
+    parser = argparse.ArgumentParser(
+        description="Create many ConnMan sessions from one process")
+    parser.add_argument('-b', '--bus', default='system',
+                        help="bus ConnMan is on: 'system', 'session' or a "
+                        "D-Bus address")
+    parser.add_argument('-n', '--sessions', type=int, default=100,
+                        help="number of sessions to create")
+    parser.add_argument('-w', '--window', type=int, default=0,
+                        help="maximum CreateSession calls in flight "
+                        "(0: no limit)")
+    parser.add_argument('-t', '--template',
+                        help="JSON file with a settings dict, or a list "
+                        "of dicts used round robin across the sessions")
+    parser.add_argument('-s', '--setting', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help="session setting, '{index}' is replaced by "
+                        "the session number")
+    parser.add_argument('-p', '--prefix', default=NOTIFY_PREFIX,
+                        help="notification object path prefix")
+    parser.add_argument('--first', type=int, default=0, metavar='INDEX',
+                        help="number of the first session")
+    parser.add_argument('-c', '--connect', action='store_true',
+                        help="call Connect() on every created session")
+    parser.add_argument('--change-window', type=int,
+                        default=coalesce.DEFAULT_WINDOW, metavar='MS',
+                        help="collect setting changes for MS milliseconds "
+                        "before sending them")
+    parser.add_argument('-r', '--rotate', metavar='KEY=V1|V2|...',
+                        help="cycle a setting of all sessions through the "
+                        "given values")
+    parser.add_argument('--rotate-interval', type=float, default=1.0,
+                        metavar='SECONDS',
+                        help="time between two rotation steps")
+    parser.add_argument('-m', '--metrics', metavar='FILE',
+                        help="write lifecycle latency histograms to FILE "
+                        "in Prometheus text format")
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        metavar='SECONDS',
+                        help="how often the metrics file is rewritten")
+    parser.add_argument('-u', '--url',
+                        help="HTTP URL every online session fetches")
+    parser.add_argument('--connections', type=int, default=1,
+                        help="persistent connections per session")
+    parser.add_argument('--rate', type=float, default=0.0, metavar='HZ',
+                        help="GET requests per second and session, by "
+                        "default one per online transition")
+    parser.add_argument('--bulk', action='store_true',
+                        help="download back to back on every connection")
+    parser.add_argument('--bind', default='device', choices=netbind.MODES,
+                        help="tie the traffic to the session's interface "
+                        "(falling back to its address), to its address "
+                        "or not at all")
+    parser.add_argument('--recover-concurrency', type=int,
+                        default=recovery.DEFAULT_CONCURRENCY, metavar='N',
+                        help="sessions re-created at the same time after "
+                        "ConnMan restarted (0: all at once)")
+    parser.add_argument('--recover-spread', type=float,
+                        default=recovery.DEFAULT_SPREAD, metavar='SECONDS',
+                        help="spread the first re-creation attempts over "
+                        "that time")
+    parser.add_argument('-d', '--duration', type=float, default=0,
+                        help="seconds to keep the sessions after they "
+                        "have been created (0: until interrupted)")
+    parser.add_argument('--log-level', default='info',
+                        choices=sorted(log.LEVELS, key=log.LEVELS.get))
+    parser.add_argument('--log-json', action='store_true',
+                        help="log JSON lines with timestamp and session "
+                        "path")
+    parser.add_argument('--stats-fd', type=int, metavar='FD',
+                        help="write the pool's counters as JSON lines to "
+                        "file descriptor FD (used by shard.py)")
+    parser.add_argument('--stats-interval', type=float, default=1.0,
+                        metavar='SECONDS',
+                        help="how often the counters are written")
+    parser.add_argument('--record', metavar='FILE',
+                        help="append every Update and Release to FILE, "
+                        "see replay.py")
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help="keep the sessions' notification paths and "
+                        "settings in FILE; if it has sessions they are "
+                        "created instead of -n/-t/-s/-p ones")
+    parser.add_argument('--snapshot-interval', type=float, default=1.0,
+                        metavar='SECONDS',
+                        help="how often changed settings are written to "
+                        "the snapshot")
+    args = parser.parse_args()
+    log.configure(level=args.log_level, json=args.log_json)
+
+    snap = None
+    restore = None
+    t_load = 0.0
+    if args.snapshot:
+        t = time.monotonic()
+        snap = snapshot.Snapshot(args.snapshot)
+        if len(snap):
+            restore = restore_templates(snap)
+        t_load = time.monotonic() - t
+
+    DBusQtMainLoop(set_as_default=True)
+    app = QCoreApplication(sys.argv)
+
+    traffic_options = None
+    if args.url:
+        traffic_options = {'url': args.url,
+                           'connections': args.connections,
+                           'rate': args.rate,
+                           'bulk': args.bulk}
+
+    scheduler = None
+    if args.recover_concurrency > 0:
+        scheduler = recovery.RecoveryScheduler(
+            concurrency=args.recover_concurrency,
+            spread=args.recover_spread)
+
+    pool = SessionPool(bus.get_bus(args.bus), args.sessions,
+                       parse_templates(args), prefix=args.prefix,
+                       window=args.window, autoconnect=args.connect,
+                       change_window=args.change_window,
+                       traffic_options=traffic_options, bind=args.bind,
+                       recovery=scheduler, first=args.first,
+                       restore=restore, snapshot=snap)
+
+    recorder = None
+    if args.record:
+        recorder = updatelog.Recorder(args.record)
+        pool.dispatcher.recorder = recorder
+
+    rotate = QTimer()
+    if args.rotate:
+        key, _, values = args.rotate.partition('=')
+        values = values.split('|')
+        step = [0]
+
+        def rotate_step():
+            step[0] += 1
+            pool.change_all(key, values[step[0] % len(values)])
+
+        rotate.timeout.connect(rotate_step)
+
+    export = QTimer()
+    if args.metrics:
+        export.timeout.connect(
+            lambda: pool.tracker.write_prometheus(args.metrics))
+        export.start(int(args.metrics_interval * 1000))
+
+    save = QTimer()
+    if snap is not None:
+        snap.commit()
+        save.timeout.connect(snap.commit)
+        save.start(int(args.snapshot_interval * 1000))
+
+    stats = QTimer()
+    stats_file = None
+    if args.stats_fd is not None:
+        stats_file = os.fdopen(args.stats_fd, 'w')
+
+        def write_stats():
+            stats_file.write(json.dumps(pool.stats()) + "\n")
+            stats_file.flush()
+
+        stats.timeout.connect(write_stats)
+        stats.start(int(args.stats_interval * 1000))
+
+    def shutdown(*unused):
+        rotate.stop()
+        export.stop()
+        save.stop()
+        stats.stop()
+        pool.stop_traffic()
+        log.flush()
+        pool.print_states()
+        if traffic_options:
+            pool.print_traffic()
+        pool.print_changes()
+        print(pool.proxies.summary())
+        pool.tracker.print_summary()
+        if args.metrics:
+            pool.tracker.write_prometheus(args.metrics)
+        pool.destroy_all(app.quit)
+        QTimer.singleShot(5000, app.quit)
+
+    ready = []
+
+    def finished():
+        if snap is not None and not ready:
+            ready.append(time.monotonic() - t_start)
+            if restore:
+                print("Warm start: %d sessions restored from %s (read in "
+                      "%.1f ms), ready after %.3f s" %
+                      (len(restore), args.snapshot, t_load * 1000.0,
+                       ready[0]))
+            else:
+                print("Cold start: %d sessions saved to %s, ready after "
+                      "%.3f s" % (len(pool.sessions), args.snapshot,
+                                  ready[0]))
+        if args.rotate:
+            rotate.start(int(args.rotate_interval * 1000))
+        if args.duration > 0:
+            QTimer.singleShot(int(args.duration * 1000), shutdown)
+
+    signal.signal(signal.SIGINT, shutdown)
+    # Let the interpreter run the Python signal handler now and then
+    wakeup = QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(200)
+
+    pool.start(finished)
+    ret = app.exec_()
+    if stats_file:
+        write_stats()
+        stats_file.close()
+    if recorder:
+        recorder.close()
+    if snap is not None:
+        snap.close()
+    sys.exit(ret)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+if __package__:
+    from . import codec
+else:
+    import codec
+
+
+class IPConfig(object):
+    """Contents of the IPv4 or IPv6 dictionary of a session."""
+
+    # D-Bus key -> attribute, in display order
+    KEYS = [("Method", "method"),
+            ("Address", "address"),
+            ("Netmask", "netmask"),
+            ("PrefixLength", "prefix_length"),
+            ("Gateway", "gateway"),
+            ("Privacy", "privacy"),
+            ("Servers", "servers"),
+            ("Excludes", "excludes")]
+
+    __slots__ = tuple(attr for key, attr in KEYS)
+
+    def __init__(self):
+        for key, attr in self.KEYS:
+            setattr(self, attr, None)
+
+    def update(self, values):
+        """Replace the contents with values, return True if they differ."""
+        changed = False
+        for key, attr in self.KEYS:
+            val = values.get(key)
+            if val is not None:
+                val = codec.IPCONFIG_CONVERTERS.get(key, str)(val)
+            if getattr(self, attr) != val:
+                setattr(self, attr, val)
+                changed = True
+        return changed
+
+    def fields(self):
+        return tuple([getattr(self, attr) for key, attr in self.KEYS])
+
+    def __eq__(self, other):
+        if not isinstance(other, IPConfig):
+            return NotImplemented
+        return self.fields() == other.fields()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __str__(self):
+        return " ".join(["%s=%s" % (key, codec.IPCONFIG_FORMATTERS.get(
+                         key, str)(getattr(self, attr)))
+                         for key, attr in self.KEYS
+                         if getattr(self, attr) is not None])
+
+
+class SessionState(object):
+    """Settings ConnMan reported for a session through Update.
+
+    Values are kept as plain Python types (bool, int, str, tuples of
+    str, IPConfig) and only turned into strings by display(). update()
+    changes the record in place and returns the keys whose value
+    actually changed.
+    """
+
+    # D-Bus key -> attribute
+    KEYS = [("State", "state"),
+            ("Name", "name"),
+            ("Bearer", "bearer"),
+            ("Interface", "interface"),
+            ("IPv4", "ipv4"),
+            ("IPv6", "ipv6"),
+            ("AllowedBearers", "allowed_bearers"),
+            ("ConnectionType", "connection_type"),
+            ("AllowedInterface", "allowed_interface"),
+            ("SourceIPRule", "source_ip_rule"),
+            ("ContextIdentifier", "context_identifier"),
+            ("Priority", "priority"),
+            ("AvoidHandover", "avoid_handover"),
+            ("StayConnected", "stay_connected"),
+            ("EmergencyCall", "emergency_call"),
+            ("PeriodicConnect", "periodic_connect"),
+            ("IdleTimeout", "idle_timeout"),
+            ("SessionMarker", "session_marker")]
+
+    ATTRS = dict(KEYS)
+
+    __slots__ = tuple(attr for key, attr in KEYS)
+
+    def __init__(self):
+        for key, attr in self.KEYS:
+            setattr(self, attr, None)
+        self.ipv4 = IPConfig()
+        self.ipv6 = IPConfig()
+
+    def update(self, settings):
+        changed = []
+        for key, value in settings.items():
+            attr = self.ATTRS.get(key)
+            if attr is None:
+                continue
+
+            if key in codec.IPCONFIG_KEYS:
+                if getattr(self, attr).update(value):
+                    changed.append(key)
+                continue
+
+            val = codec.convert(key, value)
+            if getattr(self, attr) != val:
+                setattr(self, attr, val)
+                changed.append(key)
+        return changed
+
+    def get(self, key):
+        return getattr(self, self.ATTRS[key])
+
+    def display(self, key):
+        val = getattr(self, self.ATTRS[key])
+        if val is None:
+            return ""
+        if key in codec.IPCONFIG_KEYS:
+            return str(val)
+        return codec.display(key, val)
+
+    def fields(self):
+        return tuple([getattr(self, attr) for key, attr in self.KEYS])
+
+    def __eq__(self, other):
+        if not isinstance(other, SessionState):
+            return NotImplemented
+        return self.fields() == other.fields()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
@@ -14,83 +14,75 @@
 #  along with this program; if not, write to the Free Software
 #  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import time
+t_start = time.monotonic()
+
+import argparse
 import os
 import signal
 import sys
-from functools import partial
 
-from PyQt5 import uic
-from PyQt5.QtCore import pyqtSignal, QObject
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer
 from PyQt5.QtWidgets import QWidget, QApplication
 
-import distutils.sysconfig
-
-import traceback
-
 import dbus
-import dbus.service
-import dbus.mainloop.qt
 from dbus.mainloop.pyqt5 import DBusQtMainLoop
 
-signal.signal(signal.SIGINT, signal.SIG_DFL)
-
-
-def get_resource_path(filename):
-    if __name__ == '__main__':
-        return filename
-
-    return os.path.join(distutils.sysconfig.get_python_lib(),
-                        'session_ui', filename)
-
-
-def extract_list(list):
-    val = ""
-    for i in list:
-        val += " " + str(i)
-    return val.strip()
-
-
-def extract_values(values):
-    val = ""
-    for key in list(values.keys()):
-        val += " " + key + "="
-        if key in ["PrefixLength"]:
-            val += "%s" % (int(values[key]))
-        else:
-            if key in ["Servers", "Excludes"]:
-                val += extract_list(values[key])
-            else:
-                val += str(values[key])
-    return val.strip()
+if __package__:
+    from . import bus
+    from . import codec
+    from . import coalesce
+    from . import log
+    from . import notification
+    from . import operations
+    from . import proxies
+    from . import session_state
+    from . import uiloader
+else:
+    import bus
+    import codec
+    import coalesce
+    import log
+    import notification
+    import operations
+    import proxies
+    import session_state
+    import uiloader
 
+signal.signal(signal.SIGINT, signal.SIG_DFL)
 
-class Notification(dbus.service.Object):
+# Settings shown in a le_<key> line edit
+DISPLAY_KEYS = ["State", "Name", "Bearer", "Interface", "IPv4", "IPv6",
+                "AllowedBearers", "ConnectionType", "AllowedInterface",
+                "ContextIdentifier"]
 
-    def __init__(self, bus, notify_path, cb_settings, cb_release):
-        dbus.service.Object.__init__(self)
-        self.cb_settings = cb_settings
-        self.cb_release = cb_release
+# Update bursts are painted at most once per frame (60 Hz)
+FRAME_INTERVAL = 1000 // 60
 
-    @dbus.service.method("net.connman.Notification",
-                         in_signature='', out_signature='')
-    def Release(self):
-        print("Release")
-        self.cb_release()
 
-    @dbus.service.method("net.connman.Notification",
-                         in_signature='a{sv}', out_signature='')
-    def Update(self, settings):
-        print("Update called")
-        self.cb_settings(settings)
+def get_resource_path(filename):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        filename)
 
 
 class Session(QWidget):
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, profile=None, address=None,
+                 metrics_file=None):
         QWidget.__init__(self, parent)
+        self.profile = profile
+        # Lifecycle latencies are only tracked for --metrics
+        self.tracker = None
+        self.metrics_file = metrics_file
+        if metrics_file:
+            if __package__:
+                from . import metrics
+            else:
+                import metrics
+            self.tracker = metrics.LifecycleTracker()
 
-        ui_class, widget_class = uic.loadUiType(
-            get_resource_path('ui/session.ui'))
+        ui_class = uiloader.load_ui_class(
+            get_resource_path('ui/session.ui'), 'Session')
         self.ui = ui_class()
         self.ui.setupUi(self)
 
@@ -110,35 +102,115 @@ class Session(QWidget):
             self.cb_AllowedInterface)
         self.ui.cbox_SourceIPRRule.stateChanged.connect(
             self.cb_SourceIPRule)
+
+        self.widgets = dict((key, getattr(self.ui, 'le_' + key))
+                            for key in DISPLAY_KEYS)
+        self.rendered = {}
+        self.dirty = set()
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.timeout.connect(self.render)
+
+        # ConnMan may not be on the bus yet, settings can be edited
+        # before reset() runs for the first time
+        self.settings = {}
+        self.state = session_state.SessionState()
         self.session_path = None
         self.notify = None
         self.notify_path = "/foo"
         self.ui.le_SessionName.setText(self.notify_path)
+        if self.profile:
+            self.profile.mark("UI construction")
 
-        self.bus = dbus.SystemBus()
+        self.bus = bus.get_bus(address)
+        self.dispatcher = notification.get_dispatcher(self.bus)
+        self.proxies = proxies.ProxyCache(self.bus)
         self.manager = None
         self.session = None
+        self.ops = operations.OperationQueue()
+        self.changes = coalesce.ChangeCoalescer(self.send_change,
+                                                coalesce.ChangeScheduler())
+
+        # The session is re-created (and re-connected) with the same
+        # settings when ConnMan comes back; with many clients their
+        # first attempts are spread out and failures backed off
+        self.want_connected = False
+        self.lost = False
+        self.recovery = None
 
         try:
             self.bus.watch_name_owner(
                 'net.connman', self.connman_name_owner_changed)
         except dbus.DBusException as e:
-            print(e.get_dbus_message())
+            log.error(e.get_dbus_message())
             exit(1)
+        if self.profile:
+            self.profile.mark("D-Bus connection")
 
     def connman_name_owner_changed(self, proxy):
-        try:
-            if proxy:
-                print("ConnMan appeared on D-Bus ", str(proxy))
-                self.manager = dbus.Interface(self.bus.get_object(
-                    "net.connman", "/"), "net.connman.Manager")
+        if self.profile:
+            self.profile.mark("first watch_name_owner callback")
+            self.profile.report()
+            self.profile = None
+        if self.recovery is not None:
+            self.recovery.cancel()
+        self.ops.clear()
+        self.proxies.set_owner(proxy)
+        if proxy:
+            log.info("ConnMan appeared on D-Bus %s", proxy)
+            if self.lost:
+                self.recovery_scheduler().start()
             else:
-                self.manager = None
-                print("ConnMan disappeared on D-Bus")
-            self.reset()
+                # Nothing to restore
+                self.recover(lambda error=None: None)
+        else:
+            log.info("ConnMan disappeared on D-Bus")
+            self.manager = None
+            self.lost = self.notify is not None
+            self.forget_session()
+            self.clear_status()
+            self.set_controls(False)
+
+    def recovery_scheduler(self):
+        """The RecoveryScheduler, only needed once a session was lost."""
+        if self.recovery is None:
+            if __package__:
+                from . import recovery
+            else:
+                import recovery
+            self.recovery = recovery.RecoveryScheduler(
+                concurrency=1, on_finished=self.recovered)
+            self.recovery.add(self.notify_path, self.recover)
+        return self.recovery
+
+    def recover(self, done):
+        try:
+            self.manager = self.proxies.manager()
         except dbus.DBusException as e:
-            print(e.get_dbus_message())
-            exit(1)
+            log.error(e.get_dbus_message())
+            done(e)
+            return
+
+        if not self.lost:
+            self.reset()
+            done()
+            return
+
+        def connected(*args):
+            self.lost = False
+            done()
+
+        def created():
+            if self.want_connected:
+                self.connect_session(on_done=connected, on_error=done)
+            else:
+                connected()
+
+        self.create_session(on_done=created, on_error=done)
+
+    def recovered(self):
+        if self.session is not None or self.recovery.failures:
+            log.info(self.recovery.summary())
 
     def set_controls(self, enable):
         self.ui.pb_Create.setEnabled(not enable)
@@ -146,13 +218,20 @@ class Session(QWidget):
         self.ui.pb_Disconnect.setEnabled(enable)
         self.ui.pb_Destroy.setEnabled(enable)
 
-    def reset_fields(self):
+    def clear_status(self):
+        self.render_timer.stop()
+        self.rendered = {}
+        self.dirty = set()
+
         self.ui.le_State.setText("")
         self.ui.le_Name.setText("")
         self.ui.le_Bearer.setText("")
         self.ui.le_Interface.setText("")
         self.ui.le_IPv4.setText("")
         self.ui.le_IPv6.setText("")
+
+    def reset_fields(self):
+        self.clear_status()
         self.ui.le_AllowedBearers.setText("*")
         self.ui.le_ConnectionType.setText("any")
         self.ui.le_AllowedInterface.setText("*")
@@ -160,33 +239,46 @@ class Session(QWidget):
 
     def reset(self):
         self.settings = {}
+        self.changes.reset()
 
-        if self.manager and self.session_path:
-            self.manager.DestroySession(self.session_path)
+        self.want_connected = False
+        self.lost = False
 
-        if self.notify:
-            try:
-                self.notify.remove_from_connection(self.bus, self.notify_path)
-            except:
-                pass
-            self.notify = None
-        if self.session:
-            self.session = None
+        if self.manager and self.session_path:
+            self.ops.call(self.manager.DestroySession, self.session_path)
+        self.forget_session()
         self.reset_fields()
         self.cb_AllowedBearers()
         self.cb_ConnectionType()
 
         self.set_controls(False)
 
+    def mark(self, edge):
+        if self.tracker is not None:
+            self.tracker.mark(self.notify, edge)
+
+    def forget_session(self):
+        self.proxies.evict(self.session_path)
+        self.session_path = None
+        self.session = None
+        self.state = session_state.SessionState()
+
+        if self.notify:
+            self.dispatcher.unregister(self.notify)
+            if self.tracker is not None:
+                self.tracker.forget(self.notify)
+            self.notify = None
+
     def session_change(self, key, value):
-        val = self.convert_type_to_dbus(key, value)
+        val = codec.encode(key, value)
+
+        self.settings[key] = val
+        if (self.session is not None):
+            self.changes.change(key, val)
 
-        if key not in self.settings:
-            self.settings[key] = val
-        elif self.settings[key] != val:
-            self.settings[key] = val
-            if (self.session is not None):
-                self.session.Change(key, val)
+    def send_change(self, key, val):
+        if (self.session is not None):
+            self.ops.call(self.session.Change, key, val)
 
     def cb_AllowedBearers(self):
         value = str(self.ui.le_AllowedBearers.displayText())
@@ -203,6 +295,9 @@ class Session(QWidget):
         pass
 
     def cb_Release(self):
+        log.info("Release", path=self.notify)
+        if self.notify:
+            self.mark("released")
         self.reset()
 
     def cb_SessionName(self):
@@ -211,10 +306,7 @@ class Session(QWidget):
     def set_session_mode(self, enable):
         if not self.manager:
             return
-        try:
-            self.manager.SetProperty("SessionMode", enable)
-        except dbus.DBusException as e:
-            print(e.get_dbus_message())
+        self.ops.call(self.manager.SetProperty, "SessionMode", enable)
 
     def cb_SessionEnable(self):
         self.set_session_mode(True)
@@ -222,134 +314,194 @@ class Session(QWidget):
     def cb_SessionDisable(self):
         self.set_session_mode(False)
 
-    def convert_type_from_dbus(self, key, settings):
-        val = None
-
-        if key in ["IPv4", "IPv6"]:
-            val = extract_values(settings[key])
-        elif key in ["AllowedBearers"]:
-            val = extract_list(settings[key])
-        else:
-            val = str(settings[key])
-
-        return val
-
-    def convert_type_to_dbus(self, key, value):
-        val = None
-        if key in ["AllowedBearers"]:
-            if value is not None and len(value) > 0:
-                val = dbus.Array(value.split(' '),
-                                 signature='s')
-            else:
-                val = dbus.Array(signature='s')
-        elif key in ["ConnectionType"]:
-            if value is not None and len(value) > 0:
-                val = dbus.String(str(value))
-            else:
-                val = dbus.String('')
-
-        return val
-
     def cb_updateSettings(self, settings):
+        log.debug("Update called", path=self.notify)
+        if self.tracker is not None and \
+                not self.tracker.seen(self.notify, "first_update"):
+            self.mark("first_update")
         try:
-            for key in list(settings.keys()):
-                val = self.convert_type_from_dbus(key, settings)
-                print("	  %s = %s" % (key, val))
-
-                self.settings[key] = val
-
-                if key == 'SourceIPRule':
-                    state = 0
-                    if val:
-                        state = 2
-                    self.ui.cbox_SourceIPRRule.setCheckState(state)
-                    continue
-
-                lineEdit = getattr(self.ui, 'le_' + key)
-                lineEdit.setText(str(val))
+            changed = self.state.update(settings)
+            self.dirty.update(changed)
+
+            if "State" in changed:
+                if self.state.state == "online":
+                    self.mark("online")
+                elif self.state.state == "disconnected":
+                    self.mark("disconnected")
         except:
-            print("Exception:")
-            traceback.print_exc()
+            log.exception("Exception:", path=self.notify)
+
+        if self.dirty and not self.render_timer.isActive():
+            self.render_timer.start(FRAME_INTERVAL)
+
+    def render(self):
+        dirty, self.dirty = self.dirty, set()
+
+        for key in dirty:
+            val = self.state.display(key)
+            if key in self.rendered and self.rendered[key] == val:
+                continue
+            self.rendered[key] = val
+            log.debug("	  %s = %s", key, val, path=self.notify)
+
+            if key == 'SourceIPRule':
+                state = 0
+                if val == '1':
+                    state = 2
+                self.ui.cbox_SourceIPRRule.setCheckState(state)
+                continue
+
+            lineEdit = self.widgets.get(key)
+            if lineEdit is not None:
+                lineEdit.setText(str(val))
 
     def handle_session_create(self, path):
-        print("Session Path %s" % path)
+        log.info("Session Path %s", path, path=self.notify)
+        self.mark("create_replied")
 
         self.session_path = path
-        self.session = dbus.Interface(
-            self.bus.get_object(
-                "net.connman",
-                self.session_path),
-            "net.connman.Session")
+        self.session = self.proxies.session(self.session_path)
         self.set_controls(True)
 
     def handle_session_create_error(self, e):
-        print("RaiseException raised an exception as expected:")
-        print("\t", str(e))
+        log.error(e.get_dbus_message(), path=self.notify)
 
-    def cb_Create(self):
-        if not self.manager:
+        if e.get_dbus_name() in ['net.connman.Error.AlreadyExists']:
             return
-        try:
-            self.notify = Notification(self.bus, self.notify_path,
-                                       self.cb_updateSettings, self.cb_Release)
-            self.notify.add_to_connection(self.bus, self.notify_path)
-
-            infinite = 2147483647.0 / 1000.0
-            self.manager.CreateSession(
-                self.settings,
-                self.notify_path,
-                timeout=infinite,
-                reply_handler=self.handle_session_create,
-                error_handler=self.handle_session_create_error)
-        except dbus.DBusException as e:
-            print(e.get_dbus_message())
 
-            if e.get_dbus_name() in ['net.connman.Error.AlreadyExists']:
-                return
+        if self.notify:
+            self.dispatcher.unregister(self.notify)
+            self.notify = None
+
+    def create_session(self, on_done=None, on_error=None):
+        def created(path):
+            self.handle_session_create(path)
+            if on_done:
+                on_done()
+
+        def failed(e):
+            self.handle_session_create_error(e)
+            if on_error:
+                on_error(e)
+
+        self.dispatcher.register(self.notify_path,
+                                 self.cb_updateSettings, self.cb_Release)
+        self.notify = self.notify_path
+
+        self.changes.reset(self.settings)
+        self.mark("create_requested")
+        self.ops.call(self.manager.CreateSession,
+                      self.settings, self.notify_path,
+                      timeout=operations.INFINITE,
+                      on_done=created, on_error=failed)
+
+    def connect_session(self, on_done=None, on_error=operations.print_error):
+        self.want_connected = True
+        self.mark("connect_requested")
+        self.ops.call(self.session.Connect, on_done=on_done,
+                      on_error=on_error)
 
-            if self.notify:
-                self.notify.remove_from_connection(self.bus, self.notify_path)
-                self.notify = None
-                return
+    def cb_Create(self):
+        if not self.manager:
+            return
+        self.create_session()
 
     def cb_Destroy(self):
-        try:
-            self.reset()
-        except dbus.DBusException as e:
-            print(e.get_dbus_message())
+        self.reset()
 
     def cb_Connect(self):
         if not self.session:
             return
-        try:
-            self.session.Connect()
-        except dbus.DBusException as e:
-            print(e.get_dbus_message())
+        self.connect_session()
 
     def cb_Disconnect(self):
         if not self.session:
             return
-        try:
-            self.session.Disconnect()
-        except dbus.DBusException as e:
-            print(e.get_dbus_message())
+        self.want_connected = False
+        self.mark("disconnect_requested")
+        self.ops.call(self.session.Disconnect)
+
+    def print_stats(self):
+        log.flush()
+        print("Change calls: %d requested, %d sent, %d saved" %
+              (self.changes.requested, self.changes.flushed,
+               self.changes.saved()))
+        print(self.proxies.summary())
+        if self.tracker is not None:
+            self.tracker.print_summary()
+            self.tracker.write_prometheus(self.metrics_file)
 
     def cb_Quit(self):
+        self.print_stats()
         sys.exit()
 
 
-def main():
+def print_selinux_context():
     try:
         import selinux
         print(selinux.getcon())
     except:
         print("no SELinux available")
 
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Interactive UI for one ConnMan session; options "
+        "not listed here are handed to Qt", allow_abbrev=False)
+    parser.add_argument('--bus',
+                        help="bus ConnMan is on: 'system', 'session' or a "
+                        "D-Bus address")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write lifecycle latency histograms to FILE "
+                        "in Prometheus text format on exit")
+    parser.add_argument('--log-level',
+                        choices=sorted(log.LEVELS, key=log.LEVELS.get),
+                        help="'debug' shows every Update")
+    parser.add_argument('--log-json', action='store_true',
+                        help="log JSON lines with timestamp and session "
+                        "path")
+    parser.add_argument('--record', metavar='FILE',
+                        help="append every Update and Release to FILE, "
+                        "see replay.py")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print the time until ConnMan was first "
+                        "looked up, and the peak RSS")
+    args, qt_args = parser.parse_known_args()
+    if args.log_level or args.log_json:
+        log.configure(level=args.log_level, json=args.log_json)
+
+    profile = None
+    if args.profile_startup:
+        if __package__:
+            from . import startup
+        else:
+            import startup
+        profile = startup.StartupProfile(t_start)
+        profile.mark("imports")
+
     DBusQtMainLoop(set_as_default = True)
-    app = QApplication(sys.argv)
-    myapp = Session()
+    app = QApplication(sys.argv[:1] + qt_args)
+    if profile:
+        profile.mark("QApplication")
+    myapp = Session(profile=profile, address=args.bus,
+                    metrics_file=args.metrics)
+    recorder = None
+    if args.record:
+        if __package__:
+            from . import updatelog
+        else:
+            import updatelog
+        recorder = updatelog.Recorder(args.record)
+        myapp.dispatcher.recorder = recorder
     myapp.show()
-    sys.exit(app.exec_())
+
+    # Nothing below needs the context, look it up once we are running
+    QTimer.singleShot(0, print_selinux_context)
+    ret = app.exec_()
+    myapp.print_stats()
+    if recorder:
+        recorder.close()
+    sys.exit(ret)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import json
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import time
+
+if __package__:
+    from . import metrics
+    from . import session_pool
+else:
+    import metrics
+    import session_pool
+
+# Seconds the workers get to destroy their sessions before they are
+# killed
+SHUTDOWN_TIMEOUT = 15.0
+
+
+class Worker(object):
+    """A session_pool.py process running one shard of the sessions."""
+
+    def __init__(self, index, first, count, prefix, options, verbose):
+        self.index = index
+        self.first = first
+        self.count = count
+        self.stats = None
+        self.buf = b''
+        self.status = None
+
+        rfd, wfd = os.pipe()
+        command = [sys.executable, session_pool.__file__,
+                   '-n', str(count), '--first', str(first),
+                   '-p', "%s/w%d" % (prefix, index),
+                   '--stats-fd', str(wfd)] + options
+        # In a session of its own so that only we forward ^C
+        self.proc = subprocess.Popen(
+            command, pass_fds=(wfd,), start_new_session=True,
+            stdout=None if verbose else subprocess.DEVNULL)
+        os.close(wfd)
+        self.fd = rfd
+
+    def read(self):
+        """Take in what the worker wrote, False once it closed the pipe."""
+        data = os.read(self.fd, 65536)
+        if not data:
+            os.close(self.fd)
+            self.fd = None
+            return False
+
+        lines = (self.buf + data).split(b'\n')
+        self.buf = lines.pop()
+        # Every line has all counters, only the last one matters
+        for line in reversed(lines):
+            if line:
+                self.stats = json.loads(line.decode('utf-8'))
+                break
+        return True
+
+    def signal(self, signum):
+        if self.proc.poll() is None:
+            self.proc.send_signal(signum)
+
+
+class Supervisor(object):
+    """Shards 'count' sessions over 'jobs' session_pool.py workers.
+
+    Worker k creates its sessions below prefix/wk with its own bus
+    connection and writes its counters (session_pool.SessionPool.stats)
+    to a pipe every 'interval' seconds. The supervisor adds them up into
+    one report; on shutdown the workers destroy their sessions and send
+    their final counters.
+    """
+
+    def __init__(self, jobs, count, prefix, options, interval=1.0,
+                 verbose=False):
+        self.interval = interval
+        self.selector = selectors.DefaultSelector()
+        self.workers = []
+        self.t_start = time.monotonic()
+        self.t_stop = None
+
+        first = 0
+        for i in range(jobs):
+            n = count // jobs + (1 if i < count % jobs else 0)
+            worker = Worker(i, first, n, prefix, options, verbose)
+            self.selector.register(worker.fd, selectors.EVENT_READ, worker)
+            self.workers.append(worker)
+            first += n
+
+    def stop(self, *args):
+        if self.t_stop is not None:
+            return
+        self.t_stop = time.monotonic()
+        for worker in self.workers:
+            worker.signal(signal.SIGINT)
+
+    def run(self):
+        next_report = time.monotonic() + self.interval
+        while self.selector.get_map():
+            timeout = max(next_report - time.monotonic(), 0)
+            for key, events in self.selector.select(timeout):
+                worker = key.data
+                if not worker.read():
+                    self.selector.unregister(key.fd)
+
+            now = time.monotonic()
+            if now >= next_report:
+                self.report()
+                next_report = now + self.interval
+            if self.t_stop is not None and \
+                    now - self.t_stop > SHUTDOWN_TIMEOUT:
+                for worker in self.workers:
+                    worker.signal(signal.SIGKILL)
+
+        for worker in self.workers:
+            worker.status = worker.proc.wait()
+
+    def aggregate(self):
+        """Sum of the workers' counters and the merged histograms."""
+        total = {'sessions': 0, 'lifecycle': {}, 'states': {},
+                 'updates': 0, 'traffic': {}}
+        tracker = metrics.LifecycleTracker()
+        for worker in self.workers:
+            stats = worker.stats
+            if stats is None:
+                continue
+            total['sessions'] += stats['sessions']
+            total['updates'] += stats['updates']
+            for name in ['lifecycle', 'states', 'traffic']:
+                for key, n in stats.get(name, {}).items():
+                    total[name][key] = total[name].get(key, 0) + n
+            tracker.merge(stats['events'],
+                          dict((name, metrics.Histogram.from_dict(h))
+                               for name, h in stats['histograms'].items()))
+        return total, tracker
+
+    def report(self):
+        total, tracker = self.aggregate()
+        running = len([w for w in self.workers if w.fd is not None])
+
+        def ms(name, q):
+            value = tracker.histograms[name].percentile(q)
+            return "-" if value is None else "%.1fms" % (value * 1000.0)
+
+        line = "%7.1fs %d/%d workers, %d/%d sessions created, %d failed, " \
+            "%d online, %d updates, create p99 %s, connect p99 %s" % \
+            (time.monotonic() - self.t_start, running, len(self.workers),
+             total['lifecycle'].get('created', 0), total['sessions'],
+             total['lifecycle'].get('failed', 0),
+             total['states'].get('online', 0), total['updates'],
+             ms('create', 99), ms('connect', 99))
+        if total['traffic']:
+            line += ", %d requests, %d errors, %d bytes" % \
+                (total['traffic']['requests'], total['traffic']['errors'],
+                 total['traffic']['bytes'])
+        print(line)
+        sys.stdout.flush()
+
+    def print_summary(self):
+        total, tracker = self.aggregate()
+        print("%-7s %7s %8s %8s %8s %8s" %
+              ("worker", "first", "sessions", "created", "failed", "status"))
+        for worker in self.workers:
+            stats = worker.stats or {'events': {}, 'lifecycle': {}}
+            print("%-7d %7d %8d %8d %8d %8s" %
+                  (worker.index, worker.first, worker.count,
+                   stats['events'].get('create_replied', 0),
+                   stats['lifecycle'].get('failed', 0), worker.status))
+        tracker.print_summary()
+        return tracker
+
+    def failed(self):
+        return any(worker.status != 0 for worker in self.workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run session_pool.py on several cores: the sessions "
+        "are split across worker processes, all other options are handed "
+        "to every worker",
+        usage="%(prog)s [-j JOBS] [-n SESSIONS] [...] "
+        "[session_pool.py options]")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: one per "
+                        "CPU)")
+    parser.add_argument('-n', '--sessions', type=int, default=1000,
+                        help="number of sessions over all workers")
+    parser.add_argument('-p', '--prefix',
+                        default=session_pool.NOTIFY_PREFIX + '/shard',
+                        help="notification object path prefix, worker k "
+                        "uses PREFIX/wk")
+    parser.add_argument('-i', '--interval', type=float, default=1.0,
+                        metavar='SECONDS', help="report period")
+    parser.add_argument('-m', '--metrics', metavar='FILE',
+                        help="write the merged lifecycle latency "
+                        "histograms to FILE in Prometheus text format "
+                        "when done")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="show the workers' output")
+    args, options = parser.parse_known_args()
+
+    jobs = max(min(args.jobs, args.sessions), 1)
+    supervisor = Supervisor(jobs, args.sessions, args.prefix,
+                            options + ['--stats-interval',
+                                       str(args.interval)],
+                            interval=args.interval, verbose=args.verbose)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+
+    supervisor.run()
+    tracker = supervisor.print_summary()
+    if args.metrics:
+        tracker.write_prometheus(args.metrics)
+    sys.exit(1 if supervisor.failed() else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+if __package__:
+    from . import log
+    from . import updatelog
+else:
+    import log
+    import updatelog
+
+# A snapshot is MAGIC followed by records, one per change of a
+# session's settings: its total length, the CRC32 of everything after
+# the CRC, the length of the UTF-8 notification path, the path and the
+# settings dict encoded like in updatelog. The last record of a path
+# wins. Records are only ever appended, and a record which is cut
+# short or does not match its CRC ends the snapshot, so a crash loses
+# at most the changes not yet committed.
+# Once most records are superseded the file is rewritten into a new
+# file which is renamed over the old one.
+MAGIC = b"SESSNAP1"
+RECORD = struct.Struct("<IIH")
+
+U32 = struct.Struct("<I")
+
+# Rewrite the file when it is this much larger than its live records
+COMPACT_RATIO = 2
+COMPACT_MIN = 64 * 1024
+
+
+def encode_record(path, data):
+    """A record for path with the encoded settings data."""
+    name = path.encode('utf-8')
+    buf = bytearray(RECORD.pack(0, 0, len(name)))
+    buf += name
+    buf += data
+    U32.pack_into(buf, 0, len(buf))
+    U32.pack_into(buf, 4, zlib.crc32(bytes(buf[8:])) & 0xffffffff)
+    return bytes(buf)
+
+
+def read_records(buf):
+    """Yields (path, encoded settings) up to the first broken record."""
+    end = len(buf)
+    offset = len(MAGIC)
+    while offset + RECORD.size <= end:
+        length, crc, name_length = RECORD.unpack_from(buf, offset)
+        if length < RECORD.size + name_length or offset + length > end:
+            break
+        record = buf[offset + 8:offset + length]
+        if zlib.crc32(record) & 0xffffffff != crc:
+            break
+        start = RECORD.size - 8 + name_length
+        yield (record[RECORD.size - 8:start].decode('utf-8'),
+               record[start:])
+        offset += length
+
+
+class Snapshot(object):
+    """The settings of a set of sessions, by notification path.
+
+    Opening a snapshot reads it and rewrites it without superseded or
+    broken records. put() queues a record if the session's encoded
+    settings changed, commit() appends the queued records and syncs
+    them to disk.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # path -> encoded settings
+        self.entries = OrderedDict()
+        self.pending = bytearray()
+        self.size = 0
+        self.live = 0
+        self.compactions = 0
+        self.fd = None
+
+        data = b""
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                data = f.read()
+        if data and data[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a session snapshot" % filename)
+        for path, settings in read_records(data):
+            self.entries[path] = settings
+        self.compact()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def sessions(self):
+        """(path, settings as D-Bus types) in the order first put."""
+        return [(path, updatelog.decode(data, 0)[0])
+                for path, data in self.entries.items()]
+
+    def put(self, path, settings):
+        out = bytearray()
+        try:
+            updatelog.encode(settings, out)
+            data = bytes(out)
+            old = self.entries.get(path)
+            if old == data:
+                return
+            record = encode_record(path, data)
+        except struct.error as e:
+            # The session keeps its last record that fit
+            log.warning("Not saving %s: %s", path, e, path=path)
+            return
+        if old is not None:
+            self.live -= RECORD.size + len(path.encode('utf-8')) + len(old)
+        self.live += len(record)
+        self.entries[path] = data
+        self.pending += record
+
+    def commit(self):
+        if not self.pending:
+            return
+        if self.size + len(self.pending) > \
+                max(COMPACT_MIN, COMPACT_RATIO * self.live):
+            self.pending = bytearray()
+            self.compact()
+            return
+
+        data = bytes(self.pending)
+        self.pending = bytearray()
+        while data:
+            n = os.write(self.fd, data)
+            data = data[n:]
+            self.size += n
+        os.fsync(self.fd)
+
+    def compact(self):
+        """Atomically replace the file by the live records."""
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            for path, data in self.entries.items():
+                f.write(encode_record(path, data))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.rename(tmp, self.filename)
+
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND)
+        self.size = size
+        self.live = size - len(MAGIC)
+        self.compactions += 1
+
+    def close(self):
+        if self.fd is not None:
+            self.commit()
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,84 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import os
+
+if __package__:
+    from . import metrics
+else:
+    import metrics
+
+clock = metrics.clock
+
+
+def process_age():
+    """Seconds since the kernel started this process, None if unknown."""
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces, skip past it
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        ticks = os.sysconf('SC_CLK_TCK')
+        return uptime - float(fields[19]) / ticks
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+def peak_rss():
+    """Peak resident set size of this process in kB, None if unknown."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+class StartupProfile(object):
+    """Wall clock breakdown of the startup phases.
+
+    Each mark() closes the phase which started at the previous mark
+    (or at t_start) and records its duration under the given name.
+    """
+
+    def __init__(self, t_start):
+        self.t_start = t_start
+        self.last = t_start
+        self.phases = []
+
+        # Interpreter startup happened before the first line of ours
+        # ran; measure it from the process start time when possible.
+        age = process_age()
+        if age is not None:
+            age -= clock() - t_start
+            self.phases.append(('interpreter', max(0.0, age)))
+
+    def mark(self, phase):
+        now = clock()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        print("Startup profile:")
+        for phase, duration in self.phases:
+            print("  %-34s %8.1f ms" % (phase, duration * 1000.0))
+        print("  %-34s %8.1f ms" % ("total",
+              sum(d for p, d in self.phases) * 1000.0))
+        rss = peak_rss()
+        if rss is not None:
+            print("  %-34s %8.1f MB" % ("peak RSS", rss / 1024.0))
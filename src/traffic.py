@@ -0,0 +1,219 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import socket
+import threading
+import time
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlsplit
+except ImportError:
+    import httplib
+    from urlparse import urlsplit
+
+if __package__:
+    from . import metrics
+else:
+    import metrics
+
+clock = metrics.clock
+
+# Bytes asked for per read of a response body
+CHUNK = 64 * 1024
+
+
+class TrafficStats(object):
+    """Counters of one traffic generator, shared with its workers."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.active = 0.0
+        self.ttfb = metrics.Histogram()
+        self.latency = metrics.Histogram()
+
+    def request_done(self, nbytes, ttfb, latency):
+        with self.lock:
+            self.requests += 1
+            self.bytes += nbytes
+            self.active += latency
+            self.ttfb.observe(ttfb)
+            self.latency.observe(latency)
+
+    def request_failed(self):
+        with self.lock:
+            self.errors += 1
+
+    def throughput(self):
+        """Bytes per second while requests were running."""
+        if self.active <= 0:
+            return 0.0
+        return self.bytes / self.active
+
+    def summary(self):
+        with self.lock:
+            if self.requests == 0:
+                return "%d requests, %d errors" % (self.requests, self.errors)
+            throughput = self.throughput() / 1024.0
+            return ("%d requests, %d errors, %d bytes, %.1f KiB/s, "
+                    "ttfb p50 %.1fms p99 %.1fms, "
+                    "latency p50 %.1fms p99 %.1fms" %
+                    (self.requests, self.errors, self.bytes, throughput,
+                     self.ttfb.percentile(50) * 1000.0,
+                     self.ttfb.percentile(99) * 1000.0,
+                     self.latency.percentile(50) * 1000.0,
+                     self.latency.percentile(99) * 1000.0))
+
+
+def http_connection(host, port, timeout):
+    return httplib.HTTPConnection(host, port, timeout=timeout)
+
+
+class TrafficGenerator(object):
+    """HTTP GET load of one session over persistent connections.
+
+    'connections' worker threads each keep one keep-alive connection
+    open and reuse it for their requests. With a rate (requests per
+    second, spread over all connections) the GETs are paced, in bulk
+    mode every worker downloads back to back, otherwise a single GET
+    is made per resume(). pause() stops the workers and drops their
+    connections, resume() lets them continue with fresh ones.
+
+    connection_factory(host, port, timeout) returns the connection
+    object; it defaults to a plain HTTPConnection.
+    """
+
+    def __init__(self, url, connections=1, rate=0.0, bulk=False,
+                 timeout=10.0, connection_factory=http_connection):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += "?" + parts.query
+
+        self.rate = rate
+        self.bulk = bulk
+        self.timeout = timeout
+        self.connection_factory = connection_factory
+
+        self.stats = TrafficStats()
+        self.running = threading.Event()
+        self.quit = False
+        self.once = 0
+        self.conns = [None] * connections
+        self.workers = []
+
+    def start_workers(self):
+        for i in range(len(self.conns)):
+            worker = threading.Thread(target=self.work, args=(i,))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def resume(self):
+        if not self.workers:
+            self.start_workers()
+        if not self.rate and not self.bulk:
+            self.once = 1
+        self.running.set()
+
+    def pause(self):
+        self.running.clear()
+        for conn in self.conns:
+            if conn is None:
+                continue
+            # Unblocks a worker waiting for data
+            sock = conn.sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+            conn.close()
+
+    def stop(self):
+        self.quit = True
+        self.pause()
+        self.running.set()
+        for worker in self.workers:
+            worker.join(self.timeout)
+        self.workers = []
+
+    def work(self, i):
+        interval = 0.0
+        if self.rate > 0:
+            interval = len(self.conns) / float(self.rate)
+        next_time = clock()
+
+        while True:
+            self.running.wait()
+            if self.quit:
+                return
+
+            if not self.rate and not self.bulk:
+                with self.stats.lock:
+                    if self.once <= 0:
+                        self.running.clear()
+                        continue
+                    self.once -= 1
+
+            if interval:
+                delay = next_time - clock()
+                if delay > 0:
+                    time.sleep(delay)
+                    if not self.running.is_set():
+                        continue
+                # Falling behind does not make up for it with a burst
+                next_time = max(next_time + interval, clock())
+
+            self.request(i)
+
+    def request(self, i):
+        conn = self.conns[i]
+        if conn is None:
+            conn = self.connection_factory(self.host, self.port,
+                                           self.timeout)
+            self.conns[i] = conn
+
+        t_start = clock()
+        try:
+            conn.request("GET", self.path)
+            response = conn.getresponse()
+            ttfb = clock() - t_start
+
+            nbytes = 0
+            while True:
+                data = response.read(CHUNK)
+                if not data:
+                    break
+                nbytes += len(data)
+
+            if response.will_close:
+                conn.close()
+                self.conns[i] = None
+        except (httplib.HTTPException, socket.error, ValueError,
+                AttributeError):
+            conn.close()
+            self.conns[i] = None
+            # Errors caused by pause() closing the socket don't count
+            if self.running.is_set() and not self.quit:
+                self.stats.request_failed()
+            return
+
+        self.stats.request_done(nbytes, ttfb, clock() - t_start)
@@ -0,0 +1,254 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import errno
+import select
+import socket
+import struct
+import threading
+import time
+
+if __package__:
+    from . import metrics
+else:
+    import metrics
+
+clock = metrics.clock
+
+# Every probe packet starts with its sequence number and the sender's
+# clock in nanoseconds; scripts/udp-server.py uses the same layout.
+HEADER = struct.Struct("!IQ")
+
+# Packets sent per wakeup of the sender at most, the rest of the rate
+# is made up on the next one
+BURST = 64
+
+
+class SequenceStats(object):
+    """Loss, reordering and RFC 3550 jitter of one packet stream."""
+
+    def __init__(self):
+        self.received = 0
+        self.first = None
+        self.highest = None
+        self.reordered = 0
+        self.jitter = 0.0
+        self.transit = None
+
+    def packet(self, seq, sent, arrival):
+        self.received += 1
+        if self.first is None:
+            self.first = self.highest = seq
+        elif seq > self.highest:
+            self.highest = seq
+        else:
+            # Older than what already arrived, don't touch the jitter
+            self.reordered += 1
+            return
+
+        # The clocks' offset cancels out in the difference of transits
+        transit = arrival - sent
+        if self.transit is not None:
+            d = abs(transit - self.transit)
+            self.jitter += (d - self.jitter) / 16.0
+        self.transit = transit
+
+    def expected(self):
+        if self.first is None:
+            return 0
+        return self.highest - self.first + 1
+
+    def lost(self):
+        return max(self.expected() - self.received, 0)
+
+    def summary(self):
+        expected = self.expected()
+        loss = 100.0 * self.lost() / expected if expected else 0.0
+        return ("%d received, %d lost (%.2f%%), %d reordered, "
+                "jitter %.3fms" % (self.received, self.lost(), loss,
+                                   self.reordered, self.jitter * 1000.0))
+
+
+class UdpProbe(object):
+    """Sends numbered, timestamped UDP packets at a fixed rate.
+
+    The packets go to 'address' (host, port), normally a
+    scripts/udp-server.py --reflect. Reflected packets are counted in
+    'stats' and their round trip time goes into 'rtt'. Like
+    traffic.TrafficGenerator it is driven by resume() and pause();
+    every resume() sends from a new socket.
+
+    socket_factory(family) returns the (unconnected) UDP socket, e.g.
+    netbind.SessionBinder.socket.
+    """
+
+    def __init__(self, address, rate=100.0, size=64, timeout=1.0,
+                 socket_factory=None):
+        self.address = address
+        self.rate = rate
+        self.size = max(size, HEADER.size)
+        self.timeout = timeout
+
+        info = socket.getaddrinfo(address[0], address[1], 0,
+                                  socket.SOCK_DGRAM)[0]
+        self.family = info[0]
+        self.sockaddr = info[4]
+        self.socket_factory = socket_factory
+        self.sock = None
+
+        self.sbuf = bytearray(self.size)
+        self.rbuf = bytearray(65536)
+
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.sent = 0
+        self.send_errors = 0
+        self.stats = SequenceStats()
+        self.rtt = metrics.Histogram()
+
+        self.running = threading.Event()
+        self.quit = False
+        self.workers = []
+        # Written to by pause() to wake up the receiver
+        self.wakeup = socket.socketpair()
+
+    def open(self):
+        if self.socket_factory is None:
+            sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        else:
+            sock = self.socket_factory(self.family)
+        # Only the reflector's packets are received
+        sock.connect(self.sockaddr)
+        sock.setblocking(False)
+        return sock
+
+    def resume(self):
+        if self.sock is None:
+            self.sock = self.open()
+        if not self.workers:
+            for target in [self.send_loop, self.receive_loop]:
+                worker = threading.Thread(target=target)
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+        self.running.set()
+
+    def pause(self):
+        self.running.clear()
+        # The receiver closes the socket once it noticed, it might be
+        # waiting for it in select()
+        if self.sock is not None:
+            self.sock = None
+            self.wakeup[1].send(b'x')
+
+    def stop(self):
+        self.pause()
+        self.quit = True
+        self.running.set()
+        for worker in self.workers:
+            worker.join(self.timeout * 2)
+        self.workers = []
+        for sock in self.wakeup:
+            sock.close()
+
+    def send_loop(self):
+        interval = 1.0 / self.rate
+        while True:
+            self.running.wait()
+            if self.quit:
+                return
+
+            next_time = clock()
+            while self.running.is_set() and not self.quit:
+                now = clock()
+                if now < next_time:
+                    time.sleep(next_time - now)
+                    continue
+
+                # Catch up in bursts when sleep() overslept
+                n = min(int((now - next_time) / interval) + 1, BURST)
+                for i in range(n):
+                    self.send()
+                next_time += n * interval
+                if next_time < now - BURST * interval:
+                    next_time = now
+
+    def send(self):
+        sock = self.sock
+        if sock is None:
+            return
+        HEADER.pack_into(self.sbuf, 0, self.seq & 0xffffffff,
+                         int(clock() * 1e9))
+        try:
+            sock.send(self.sbuf)
+        except socket.error:
+            if sock is self.sock:
+                with self.lock:
+                    self.send_errors += 1
+            return
+        self.seq += 1
+        with self.lock:
+            self.sent += 1
+
+    def receive_loop(self):
+        while True:
+            self.running.wait()
+            if self.quit:
+                return
+            sock = self.sock
+            if sock is None:
+                continue
+
+            try:
+                readable = select.select([sock, self.wakeup[0]], [], [],
+                                         self.timeout)[0]
+            except (select.error, socket.error):
+                readable = []
+            if self.wakeup[0] in readable:
+                self.wakeup[0].recv(64)
+            if sock is not self.sock:
+                sock.close()
+                continue
+            if sock in readable:
+                self.receive(sock)
+
+    def receive(self, sock):
+        # Everything queued up, like the reflector does
+        for i in range(BURST):
+            try:
+                n = sock.recv_into(self.rbuf)
+            except socket.error as e:
+                # ICMP port unreachable: the reflector isn't up (yet)
+                if e.errno == errno.ECONNREFUSED:
+                    time.sleep(0.1)
+                return
+            if n < HEADER.size:
+                continue
+
+            arrival = clock()
+            seq, sent = HEADER.unpack_from(self.rbuf)
+            with self.lock:
+                self.stats.packet(seq, sent / 1e9, arrival)
+                self.rtt.observe(arrival - sent / 1e9)
+
+    def summary(self):
+        with self.lock:
+            text = "%d sent, %d send errors, reflected: %s" % \
+                (self.sent, self.send_errors, self.stats.summary())
+            if self.rtt.count:
+                text += ", rtt p50 %.2fms p99 %.2fms" % \
+                    (self.rtt.percentile(50) * 1000.0,
+                     self.rtt.percentile(99) * 1000.0)
+            return text
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import importlib
+import importlib.util
+import os
+import sys
+
+# setup.py writes ui/<name>.ui as ui_<name>.py next to this module.
+# Without it (running from the source tree) the compiled module is
+# kept in the cache directory and rebuilt when the .ui file changes.
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'session-ui')
+
+
+def module_name(ui_file):
+    return 'ui_' + os.path.splitext(os.path.basename(ui_file))[0]
+
+
+def compile_ui(ui_file, py_file):
+    import tempfile
+    from PyQt5 import uic
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(py_file), suffix='.py')
+    with os.fdopen(fd, 'w') as f:
+        uic.compileUi(ui_file, f)
+    os.rename(tmp, py_file)
+
+
+def is_stale(py_file, ui_file):
+    try:
+        return os.path.getmtime(py_file) < os.path.getmtime(ui_file)
+    except OSError:
+        return True
+
+
+def load_precompiled(ui_file):
+    name = module_name(ui_file)
+    try:
+        if __package__:
+            module = importlib.import_module('.' + name, __package__)
+        else:
+            module = importlib.import_module(name)
+    except ImportError:
+        return None
+
+    if os.path.exists(ui_file) and is_stale(module.__file__, ui_file):
+        return None
+    return module
+
+
+def load_cached(ui_file):
+    name = module_name(ui_file)
+    directory = cache_dir()
+    py_file = os.path.join(directory, name + '.py')
+
+    if is_stale(py_file, ui_file):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        compile_ui(ui_file, py_file)
+
+    spec = importlib.util.spec_from_file_location(name, py_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_ui_class(ui_file, class_name):
+    """Return the Ui_<class_name> form class generated from ui_file."""
+    module = load_precompiled(ui_file)
+    if module is None:
+        module = load_cached(ui_file)
+    return getattr(module, 'Ui_' + class_name)
+
+
+BENCH_RUNTIME = """
+import time
+t = time.monotonic()
+from PyQt5 import uic
+uic.loadUiType(%r)
+print(time.monotonic() - t)
+"""
+
+BENCH_COMPILED = """
+import sys, time
+t = time.monotonic()
+sys.path.insert(0, %r)
+import uiloader
+uiloader.load_ui_class(%r, 'Session')
+print(time.monotonic() - t)
+"""
+
+
+def bench(ui_file, runs):
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Warm the cache so only the load itself is measured
+    load_ui_class(ui_file, 'Session')
+
+    for label, code in [('uic.loadUiType', BENCH_RUNTIME % ui_file),
+                        ('precompiled', BENCH_COMPILED % (here, ui_file))]:
+        times = []
+        for i in range(runs):
+            out = subprocess.check_output([sys.executable, '-c', code])
+            times.append(float(out))
+        times.sort()
+        print("%-16s median %7.2f ms  min %7.2f ms  (%d runs)" %
+              (label, times[len(times) // 2] * 1000.0, times[0] * 1000.0,
+               runs))
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    ui_file = os.path.join(here, 'ui', 'session.ui')
+    runs = 10
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+    bench(ui_file, runs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#  Copyright (C) 2012  BMW Car IT GmbH. All rights reserved.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License version 2 as
+#  published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import mmap
+import os
+import struct
+
+if __package__:
+    from . import dbustypes
+    from . import log
+    from . import metrics
+else:
+    import dbustypes
+    import log
+    import metrics
+
+clock = metrics.clock
+
+try:
+    INTEGER_TYPES = (int, long)
+except NameError:
+    INTEGER_TYPES = (int,)
+TEXT_TYPE = type(u"")
+
+# A log is MAGIC followed by records. Every record starts with
+# RECORD: its total length, its kind, the recorder's monotonic clock
+# in seconds and the length of the UTF-8 notification path which
+# follows. An Update record ends with the settings dict, encoded as
+# below; a Release record ends after the path. All integers are
+# little endian.
+#
+# Values are a type byte and the value:
+#   b: Boolean (1 byte)   y: Byte (1 byte)
+#   n: Int16              q: UInt16
+#   u: UInt32             i: Int32
+#   t: UInt64             x: any other integer (8)
+#   d: Double (8)
+#   s: string, 2 byte length and UTF-8
+#   o: ObjectPath, like a string
+#   a: 2 byte count and that many values
+#   e: 2 byte count and that many string keys (without type byte)
+#      and values, a dict
+# A record with a longer string or more items is not written.
+MAGIC = b"SESSUPD1"
+RECORD = struct.Struct("<IBdH")
+
+UPDATE = 1
+RELEASE = 2
+
+U8 = struct.Struct("<B")
+I16 = struct.Struct("<h")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+I32 = struct.Struct("<i")
+U64 = struct.Struct("<Q")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+
+
+def encode_string(value, out):
+    data = value.encode('utf-8')
+    out += U16.pack(len(data))
+    out += data
+
+
+def encode(value, out):
+    """Append value (D-Bus or plain Python types) to bytearray out.
+
+    Raises struct.error for values the format has no room for.
+    """
+    dbus = dbustypes.binding()
+    if isinstance(value, (dbus.Boolean, bool)):
+        out += b'b' + U8.pack(1 if value else 0)
+    elif isinstance(value, dbus.Byte):
+        out += b'y' + U8.pack(value)
+    elif isinstance(value, dict):
+        out += b'e' + U16.pack(len(value))
+        for key, val in value.items():
+            encode_string(key, out)
+            encode(val, out)
+    elif isinstance(value, (list, tuple)):
+        out += b'a' + U16.pack(len(value))
+        for val in value:
+            encode(val, out)
+    elif isinstance(value, dbus.UInt32):
+        out += b'u' + U32.pack(value)
+    elif isinstance(value, dbus.Int32):
+        out += b'i' + I32.pack(value)
+    elif isinstance(value, dbus.Int16):
+        out += b'n' + I16.pack(value)
+    elif isinstance(value, dbus.UInt16):
+        out += b'q' + U16.pack(value)
+    elif isinstance(value, dbus.UInt64):
+        out += b't' + U64.pack(value)
+    elif isinstance(value, INTEGER_TYPES):
+        out += b'x' + I64.pack(value)
+    elif isinstance(value, float):
+        out += b'd' + F64.pack(value)
+    elif isinstance(value, dbus.ObjectPath):
+        out += b'o'
+        encode_string(value, out)
+    else:
+        if not isinstance(value, TEXT_TYPE):
+            value = str(value)
+        out += b's'
+        encode_string(value, out)
+
+
+def decode_string(buf, offset):
+    n, = U16.unpack_from(buf, offset)
+    offset += U16.size
+    return buf[offset:offset + n].decode('utf-8'), offset + n
+
+
+def decode(buf, offset):
+    """The value at offset as D-Bus types, and the offset after it."""
+    dbus = dbustypes.binding()
+    tag = buf[offset:offset + 1]
+    offset += 1
+    if tag == b's':
+        value, offset = decode_string(buf, offset)
+        return dbus.String(value), offset
+    if tag == b'e':
+        n, = U16.unpack_from(buf, offset)
+        offset += U16.size
+        value = dbus.Dictionary(signature='sv')
+        for i in range(n):
+            key, offset = decode_string(buf, offset)
+            value[key], offset = decode(buf, offset)
+        return value, offset
+    if tag == b'a':
+        n, = U16.unpack_from(buf, offset)
+        offset += U16.size
+        value = dbus.Array()
+        for i in range(n):
+            val, offset = decode(buf, offset)
+            value.append(val)
+        return value, offset
+    if tag == b'b':
+        return dbus.Boolean(U8.unpack_from(buf, offset)[0]), offset + 1
+    if tag == b'y':
+        return dbus.Byte(U8.unpack_from(buf, offset)[0]), offset + 1
+    if tag == b'u':
+        return dbus.UInt32(U32.unpack_from(buf, offset)[0]), offset + 4
+    if tag == b'i':
+        return dbus.Int32(I32.unpack_from(buf, offset)[0]), offset + 4
+    if tag == b'x':
+        return dbus.Int64(I64.unpack_from(buf, offset)[0]), offset + 8
+    if tag == b'n':
+        return dbus.Int16(I16.unpack_from(buf, offset)[0]), offset + 2
+    if tag == b'q':
+        return dbus.UInt16(U16.unpack_from(buf, offset)[0]), offset + 2
+    if tag == b't':
+        return dbus.UInt64(U64.unpack_from(buf, offset)[0]), offset + 8
+    if tag == b'd':
+        return dbus.Double(F64.unpack_from(buf, offset)[0]), offset + 8
+    if tag == b'o':
+        value, offset = decode_string(buf, offset)
+        return dbus.ObjectPath(value), offset
+    raise ValueError("unknown type %r at offset %d" % (tag, offset - 1))
+
+
+class Recorder(object):
+    """Appends Update and Release notifications to a log file.
+
+    Set it as NotificationDispatcher.recorder. Records go through a
+    large write buffer; close() (or flush()) makes sure they are on
+    disk.
+    """
+
+    def __init__(self, filename, buffering=1024 * 1024):
+        new = not os.path.exists(filename) or \
+            os.path.getsize(filename) == 0
+        self.f = open(filename, 'ab', buffering)
+        if new:
+            self.f.write(MAGIC)
+        self.records = 0
+        self.dropped = 0
+
+    def record(self, kind, path, settings=None):
+        data = path.encode('utf-8')
+        try:
+            buf = bytearray(RECORD.pack(0, kind, clock(), len(data)))
+            buf += data
+            if settings is not None:
+                encode(settings, buf)
+        except struct.error as e:
+            # Rather lose the record than the Update it came with
+            self.dropped += 1
+            log.warning("Not recording %s: %s", path, e, path=path)
+            return
+        # The length goes in last
+        U32.pack_into(buf, 0, len(buf))
+        self.f.write(buf)
+        self.records += 1
+
+    def update(self, path, settings):
+        self.record(UPDATE, path, settings)
+
+    def release(self, path):
+        self.record(RELEASE, path)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+            if self.dropped:
+                log.warning("%d records too large for the log were "
+                            "not written", self.dropped)
+
+
+class Reader(object):
+    """Iterates over a log through a read-only memory mapping.
+
+    Yields (kind, timestamp, path, settings) with settings None for
+    Release records, or for all records from records(False). A record
+    cut short at the end (the recorder was killed) ends the iteration.
+    """
+
+    def __init__(self, filename):
+        self.f = open(filename, 'rb')
+        self.buf = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buf[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not an update log" % filename)
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self, decode_settings=True):
+        buf = self.buf
+        end = len(buf)
+        offset = len(MAGIC)
+        while offset + RECORD.size <= end:
+            length, kind, t, path_length = RECORD.unpack_from(buf, offset)
+            if length < RECORD.size or offset + length > end:
+                return
+            start = offset + RECORD.size
+            path = buf[start:start + path_length].decode('utf-8')
+            settings = None
+            if kind == UPDATE and decode_settings:
+                settings, _ = decode(buf, start + path_length)
+            yield kind, t, path, settings
+            offset += length
+
+    def close(self):
+        self.buf.close()
+        self.f.close()